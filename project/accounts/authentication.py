@@ -0,0 +1,106 @@
+import hashlib
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+# Compteurs du processus courant
+metrics = Counter()
+# Caches propres à chaque processus : une révocation n'y serait vue que par un worker
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def _cache_key(key):
+    # Le jeton n'apparaît pas en clair dans un cache partagé
+    return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def shared_cache():
+    """Vrai si le cache par défaut est partagé par tous les processus (Redis, Memcached...)."""
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHES
+
+
+@lru_cache(maxsize=None)
+def _local_cache():
+    # LRU du processus, borné en taille ; les entrées sont copiées comme dans un cache partagé
+    return LocMemCache('auth-tokens', {'OPTIONS': {'MAX_ENTRIES': settings.AUTH_TOKEN_LOCAL_CACHE_SIZE}})
+
+
+def token_cache():
+    """(cache, durée de vie) de la résolution jeton -> utilisateur.
+
+    Le cache par défaut s'il est partagé ; sinon un cache du processus à
+    durée de vie courte, qui borne le délai avant qu'une révocation faite
+    dans un autre worker soit prise en compte.
+    """
+    if shared_cache():
+        return cache, settings.AUTH_TOKEN_CACHE_TTL
+    return _local_cache(), settings.AUTH_TOKEN_LOCAL_CACHE_TTL
+
+
+def token_cache_enabled():
+    return token_cache()[1] > 0
+
+
+def forget_token(key):
+    """Retire un jeton du cache, une fois la transaction validée."""
+    backend, ttl = token_cache()
+    if ttl > 0:
+        transaction.on_commit(lambda: backend.delete(_cache_key(key)))
+
+
+def forget_user_tokens(user_ids):
+    """Retire du cache les jetons d'un utilisateur ou d'une liste d'utilisateurs."""
+    if not token_cache_enabled():
+        return
+    user_ids = user_ids if isinstance(user_ids, (list, tuple, set)) else [user_ids]
+    for key in Token.objects.filter(user_id__in=user_ids).values_list('key', flat=True):
+        forget_token(key)
+
+
+def token_cache_metrics():
+    hits, misses = metrics['hits'], metrics['misses']
+    return {
+        'enabled': token_cache_enabled(),
+        'shared': shared_cache(),
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else None,
+    }
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Authentification par jeton, avec la résolution jeton -> utilisateur en cache.
+
+    Le couple (utilisateur, jeton) est conservé `AUTH_TOKEN_CACHE_TTL`
+    secondes dans le cache par défaut s'il est partagé, sinon
+    `AUTH_TOKEN_LOCAL_CACHE_TTL` secondes dans un cache du processus (voir
+    `token_cache`). Il est invalidé à la suppression du jeton (déconnexion)
+    et à toute modification de l'utilisateur, désactivation et changement de
+    rôle compris, y compris par `User.objects...update()` ; avec le cache du
+    processus, les autres workers ne le voient qu'à l'expiration de l'entrée.
+    Un `.update()` direct sur `Token` n'est pas suivi : supprimer et recréer
+    le jeton, ou appeler `forget_token`.
+    """
+
+    def authenticate_credentials(self, key):
+        backend, ttl = token_cache()
+        if ttl <= 0:
+            return super().authenticate_credentials(key)
+        cache_key = _cache_key(key)
+        cached = backend.get(cache_key)
+        if cached is not None:
+            metrics['hits'] += 1
+            return cached
+        metrics['misses'] += 1
+        user, token = super().authenticate_credentials(key)
+        backend.set(cache_key, (user, token), ttl)
+        return user, token
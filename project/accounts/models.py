@@ -1,6 +1,25 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
 
+
+class UserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # Les mises à jour en masse ne passent pas par post_save : on invalide ici
+        # le cache d'authentification des utilisateurs concernés
+        from .authentication import forget_user_tokens, token_cache_enabled
+
+        if not token_cache_enabled():
+            return super().update(**kwargs)
+        user_ids = list(self.values_list('pk', flat=True))
+        updated = super().update(**kwargs)
+        forget_user_tokens(user_ids)
+        return updated
+
+
+class LibraryUserManager(UserManager.from_queryset(UserQuerySet)):
+    pass
+
+
 class User(AbstractUser):
     ROLE_CHOICES = [
         ('user', 'Utilisateur'),
@@ -17,6 +36,8 @@ class User(AbstractUser):
     address = models.TextField(blank=True)
     birth_date = models.DateField(blank=True, null=True)
     
+    objects = LibraryUserManager()
+    
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
     
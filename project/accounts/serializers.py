@@ -1,12 +1,17 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
+from library.fieldsets import SparseFieldsMixin
+from library.thumbnails import ThumbnailsField
 from .models import User
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    avatar_thumbnails = ThumbnailsField(source='avatar')
+    
     class Meta:
         model = User
-        fields = ('id', 'email', 'first_name', 'last_name', 'role', 'join_date', 'avatar', 'full_name')
+        fields = ('id', 'email', 'first_name', 'last_name', 'role', 'join_date', 'avatar', 'avatar_thumbnails', 'full_name')
         read_only_fields = ('id', 'join_date', 'full_name')
+        field_dependencies = {'full_name': ['first_name', 'last_name']}
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=8)
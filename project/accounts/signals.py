@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import forget_token, forget_user_tokens
+from .models import User
+
+
+# Cache d'authentification par jeton
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def forget_changed_user(sender, instance, raw=False, created=False, **kwargs):
+    # La mise à jour de `last_login` à la connexion ne change rien au cache
+    if not raw and not created and set(kwargs.get('update_fields') or ()) != {'last_login'}:
+        forget_user_tokens(instance.pk)
@@ -3,4 +3,7 @@ from django.apps import AppConfig
 class LibraryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'library'
-    verbose_name = 'Bibliothèque'
\ No newline at end of file
+    verbose_name = 'Bibliothèque'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
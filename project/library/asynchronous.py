@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+_executor = None
+
+
+def _read_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.LIBRARY_ASYNC_READ_THREADS, thread_name_prefix='library-read')
+    return _executor
+
+
+def _run(view, request, args, kwargs):
+    # Chaque thread du pool garde sa connexion (CONN_MAX_AGE) : on la recycle
+    # comme le ferait le gestionnaire WSGI en début et fin de requête
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_read_view(view):
+    """Version asynchrone d'une vue de lecture DRF.
+
+    DRF 3.14 n'a pas de vues asynchrones, et l'ORM asynchrone de Django 4.2
+    fait passer toutes les requêtes par un unique thread partagé. La vue
+    complète (authentification, requêtes, sérialisation, rendu) s'exécute
+    donc dans un pool de `LIBRARY_ASYNC_READ_THREADS` threads : une lecture
+    lente occupe un thread du pool, plus un worker du serveur.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await sync_to_async(_run, thread_sensitive=False, executor=_read_executor())(view, request, args, kwargs)
+    return wrapper
+
+
+def read_view(view):
+    """`async_read_view(view)` quand les lectures asynchrones sont activées (ASGI), sinon `view`."""
+    return async_read_view(view) if settings.LIBRARY_ASYNC_READS else view
+
+
+def iterate_in_thread(iterator, size=500):
+    """Itérateur asynchrone sur un itérateur synchrone qui lit la base.
+
+    Sous ASGI, Django 4.2 consomme entièrement un itérateur synchrone avant
+    d'envoyer une réponse en flux. Ici les éléments sont produits par lots de
+    `size` dans un thread propre à la réponse : le curseur reste sur une
+    seule connexion, et la mémoire est bornée par un lot.
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='library-stream')
+
+    def in_thread(function):
+        return sync_to_async(function, thread_sensitive=False, executor=executor)
+
+    def close():
+        getattr(iterator, 'close', lambda: None)()
+        connection.close()
+
+    async def items():
+        try:
+            while batch := await in_thread(lambda: list(islice(iterator, size)))():
+                for item in batch:
+                    yield item
+        finally:
+            await in_thread(close)()
+            executor.shutdown(wait=False)
+    return items()
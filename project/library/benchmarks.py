@@ -0,0 +1,118 @@
+import json
+import time
+from pathlib import Path
+
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .models import Book, Loan
+from .stats import invalidate_dashboard
+from .typeahead import get_typeahead
+
+# Budgets versionnés : seul le nombre de requêtes ne dépend pas de la machine.
+# Les budgets de latence s'enregistrent sur la machine de mesure (--record-budgets).
+BUDGETS_PATH = Path(__file__).resolve().parent / 'benchmark_budgets.json'
+
+# Marge appliquée aux mesures quand on enregistre de nouveaux budgets
+HEADROOM = {'queries': 1, 'p95_ms': 2, 'bytes': 1.2}
+
+# Nom -> (URL, rôle du client, vider le cache du tableau de bord avant chaque appel).
+# `{book}` est remplacé par le livre le plus commenté.
+SCENARIOS = {
+    'book-list': ('/api/books/', 'user', False),
+    'book-list-search': ('/api/books/?search=jardin', 'user', False),
+    'book-list-facets': ('/api/books/?language=fr&facets=all', 'user', False),
+    'book-list-cursor': ('/api/books/?pagination=cursor&fields=id,title,authors.last_name', 'user', False),
+    'book-detail': ('/api/books/{book}/', 'user', False),
+    'autocomplete': ('/api/autocomplete/?q=jar', 'user', False),
+    'loan-list': ('/api/loans/', 'user', False),
+    'loan-list-admin': ('/api/loans/', 'admin', False),
+    'dashboard': ('/api/dashboard/', 'user', True),
+    'dashboard-admin': ('/api/dashboard/', 'admin', True),
+    'dashboard-admin-cached': ('/api/dashboard/', 'admin', False),
+}
+
+
+def percentile(values, rank):
+    """Percentile au rang le plus proche d'une liste non vide."""
+    values = sorted(values)
+    return values[min(int(len(values) * rank / 100), len(values) - 1)]
+
+
+def busiest_reader():
+    """Lecteur qui a le plus d'emprunts : le cas le plus coûteux pour ses listes."""
+    row = Loan.objects.values('user').annotate(total=Count('id')).order_by('-total').first()
+    return row['user'] if row else None
+
+
+def run_scenario(client, url, iterations, warmup=2, cold=False):
+    """Appelle `url` et renvoie latences p50/p95, requêtes SQL et taille de réponse."""
+    for _ in range(warmup):
+        client.get(url)
+    timings = []
+    for _ in range(iterations):
+        if cold:
+            invalidate_dashboard()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'url': url,
+        'status': response.status_code,
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'queries': len(queries),
+        'bytes': len(response.content),
+    }
+
+
+def run_benchmarks(users, iterations, names=None):
+    """Exécute les scénarios demandés ; `users` associe un utilisateur à chaque rôle."""
+    book = Book.objects.order_by('-review_count', 'id').values_list('id', flat=True).first()
+    clients = {}
+    for role, user in users.items():
+        clients[role] = APIClient(SERVER_NAME='localhost')
+        clients[role].force_authenticate(user)
+    if not names or 'autocomplete' in names:
+        # En service, les suggestions restent vides le temps de la construction en arrière-plan
+        get_typeahead().build()
+
+    results = {}
+    for name, (url, role, cold) in SCENARIOS.items():
+        if names and name not in names:
+            continue
+        results[name] = run_scenario(clients[role], url.format(book=book), iterations, cold=cold)
+    return results
+
+
+def load_budgets(path=BUDGETS_PATH):
+    path = Path(path)
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def record_budgets(results, path=BUDGETS_PATH):
+    """Enregistre les mesures, avec marge, comme nouveaux budgets."""
+    budgets = load_budgets(path)
+    for name, result in results.items():
+        budgets[name] = {
+            'queries': result['queries'] + HEADROOM['queries'],
+            'p95_ms': round(result['p95_ms'] * HEADROOM['p95_ms'], 1),
+            'bytes': int(result['bytes'] * HEADROOM['bytes']),
+        }
+    Path(path).write_text(json.dumps(budgets, indent=2, sort_keys=True) + '\n')
+    return budgets
+
+
+def check_budgets(results, budgets):
+    """Liste des dépassements, sous forme de messages lisibles."""
+    failures = []
+    for name, result in results.items():
+        if result['status'] != 200:
+            failures.append(f"{name} : statut HTTP {result['status']}")
+        for metric, limit in budgets.get(name, {}).items():
+            if result[metric] > limit:
+                failures.append(f'{name} : {metric} = {result[metric]} (budget {limit})')
+    return failures
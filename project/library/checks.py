@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+from accounts.authentication import shared_cache
+
+
+@register(Tags.caches, Tags.database)
+def check_replica_stickiness(app_configs, **kwargs):
+    # Le marqueur « lire sur default » est posé par le worker qui a traité
+    # l'écriture : la lecture suivante doit le voir, quel que soit le worker
+    if not settings.LIBRARY_READ_REPLICAS or shared_cache():
+        return []
+    return [Error(
+        "Répliques de lecture configurées avec un cache propre à chaque processus : après une écriture, "
+        "une lecture traitée par un autre worker irait sur une réplique en retard.",
+        hint="Configurez un cache partagé (CACHE_BACKEND Redis ou Memcached), ou retirez LIBRARY_REPLICA_DATABASES.",
+        id='library.E001',
+    )]
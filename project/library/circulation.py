@@ -0,0 +1,334 @@
+from collections import Counter
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, Max, Min, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Now
+from django.utils import timezone
+
+from .models import Book, Loan, Reservation
+from .popularity import record_checkouts
+from .stats import invalidate_dashboard
+
+OPEN_LOAN_STATUSES = ('active', 'overdue')
+
+
+class CirculationError(Exception):
+    """Erreur métier de prêt ou de retour, avec le code HTTP associé."""
+    status_code = 400
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.message = message
+        if status_code is not None:
+            self.status_code = status_code
+
+
+class BookUnavailable(CirculationError):
+    def __init__(self):
+        super().__init__("Ce livre n'est pas disponible.")
+
+
+def reserve_copy(book_id):
+    """Retire un exemplaire disponible par un UPDATE conditionnel unique.
+
+    La condition `available_quantity > 0` est évaluée par la base au moment
+    de l'écriture : deux prêts simultanés ne peuvent pas prendre le même
+    exemplaire. Renvoie False si aucun exemplaire n'était disponible.
+    """
+    return Book.objects.filter(id=book_id, status='available', available_quantity__gt=0).update(
+        available_quantity=F('available_quantity') - 1,
+        status=Case(When(available_quantity=1, then=Value('borrowed')), default=F('status')),
+        updated_at=Now(),
+    ) == 1
+
+
+def release_copy(book_id, count=1):
+    """Remet `count` exemplaires en rayon."""
+    Book.objects.filter(id=book_id).update(
+        available_quantity=F('available_quantity') + count,
+        status=Case(When(status='borrowed', then=Value('available')), default=F('status')),
+        updated_at=Now(),
+    )
+
+
+def hold_copies(book_id, count=1):
+    """Met de côté jusqu'à `count` exemplaires rendus pour les premiers de la file.
+
+    Les réservations en attente sont servies par ordre d'arrivée, sans limite
+    de durée dans la file ; le délai de retrait `HOLD_PERIOD` court à partir
+    de la mise de côté. Sur les bases
+    qui le permettent, `skip_locked` laisse deux retours simultanés servir deux
+    réservations différentes au lieu de se bloquer sur la même. Renvoie le
+    nombre d'exemplaires mis de côté ; le reste doit être remis en rayon.
+    """
+    now = timezone.now()
+    waiting = list(
+        Reservation.objects.select_for_update(skip_locked=True)
+        .filter(book_id=book_id, status='active')
+        .order_by('reservation_date', 'id')
+        .values_list('id', flat=True)[:count]
+    )
+    if not waiting:
+        return 0
+    return Reservation.objects.filter(id__in=waiting, status='active').update(
+        status='ready', expiry_date=now + Reservation.HOLD_PERIOD, notified=False
+    )
+
+
+def hand_off(book_id, count=1):
+    """Attribue les exemplaires rendus à la file d'attente, puis remet le reste en rayon."""
+    remaining = count - hold_copies(book_id, count)
+    if remaining:
+        release_copy(book_id, remaining)
+
+
+def claim_hold(book_id, user):
+    """Consomme l'exemplaire mis de côté pour `user`, s'il y en a un."""
+    return Reservation.objects.filter(book_id=book_id, user=user, status='ready').update(status='fulfilled') > 0
+
+
+def checkout(book_id, user, due_date=None, notes=''):
+    """Réserve un exemplaire et crée l'emprunt dans une même transaction.
+
+    Un exemplaire mis de côté pour l'emprunteur est pris en priorité : il a
+    déjà été retiré du stock disponible lors du retour.
+    """
+    with transaction.atomic():
+        if not claim_hold(book_id, user) and not reserve_copy(book_id):
+            raise BookUnavailable()
+        record_checkouts([book_id])
+        return Loan.objects.create(book_id=book_id, user=user, due_date=due_date, notes=notes)
+
+
+def return_loan(loan_id, user):
+    """Clôture l'emprunt et rend l'exemplaire ; renvoie l'id du livre.
+
+    La transition de statut est elle-même un UPDATE conditionnel : un même
+    emprunt ne peut pas être rendu deux fois, même en parallèle.
+    """
+    with transaction.atomic():
+        loans = Loan.objects.filter(id=loan_id, status__in=OPEN_LOAN_STATUSES)
+        if not user.is_admin:
+            loans = loans.filter(user=user)
+        # L'écriture passe en premier pour prendre le verrou d'écriture d'emblée
+        if not loans.update(status='returned', return_date=date.today(), updated_at=Now()):
+            loan = Loan.objects.filter(id=loan_id).values('user_id').first()
+            if loan is None:
+                raise CirculationError('Emprunt non trouvé', status_code=404)
+            if loan['user_id'] != user.id and not user.is_admin:
+                raise CirculationError('Permission refusée', status_code=403)
+            raise CirculationError('Cet emprunt est déjà clôturé.')
+
+        book_id = Loan.objects.filter(id=loan_id).values_list('book_id', flat=True).get()
+        hand_off(book_id)
+        invalidate_dashboard()
+    return book_id
+
+
+def _item_result(ok, **fields):
+    return {'ok': ok, **fields}
+
+
+def checkout_many(book_ids, user, due_date=None):
+    """Emprunte une liste de livres en un nombre fixe de requêtes, quelle que soit sa taille.
+
+    Un identifiant répété demande plusieurs exemplaires du même livre ; un
+    exemplaire mis de côté pour l'emprunteur est servi en premier. Les
+    livres indisponibles sont signalés élément par élément sans faire
+    échouer le reste du lot.
+    """
+    due_date = due_date or date.today() + Loan.LOAN_PERIOD
+    with transaction.atomic():
+        holds = dict(
+            Reservation.objects.select_for_update()
+            .filter(book_id__in=set(book_ids), user=user, status='ready')
+            .values_list('book_id', 'id')
+        )
+        stock = dict(
+            Book.objects.select_for_update()
+            .filter(id__in=set(book_ids), status='available')
+            .values_list('id', 'available_quantity')
+        )
+
+        claimed = []
+        taken = Counter()
+        results = []
+        for book_id in book_ids:
+            if book_id in holds:
+                claimed.append(holds.pop(book_id))
+                results.append(_item_result(True, book_id=book_id))
+            elif stock.get(book_id, 0) > taken[book_id]:
+                taken[book_id] += 1
+                results.append(_item_result(True, book_id=book_id))
+            else:
+                results.append(_item_result(False, book_id=book_id, error=BookUnavailable().message))
+
+        if taken:
+            guard = Q()
+            for book_id, count in taken.items():
+                guard |= Q(id=book_id, available_quantity__gte=count)
+            updated = Book.objects.filter(guard, status='available').update(
+                available_quantity=F('available_quantity') - Case(
+                    *[When(id=book_id, then=Value(count)) for book_id, count in taken.items()]
+                ),
+                status=Case(
+                    *[When(id=book_id, available_quantity=count, then=Value('borrowed'))
+                      for book_id, count in taken.items()],
+                    default=F('status'),
+                ),
+                updated_at=Now(),
+            )
+            if updated != len(taken):
+                raise CirculationError('Le stock a changé pendant le traitement, veuillez réessayer.', status_code=409)
+        if claimed:
+            if Reservation.objects.filter(id__in=claimed, status='ready').update(status='fulfilled') != len(claimed):
+                raise CirculationError('Une réservation a changé pendant le traitement, veuillez réessayer.', status_code=409)
+
+        served = [result for result in results if result['ok']]
+        if served:
+            loans = Loan.objects.bulk_create([
+                Loan(book_id=result['book_id'], user=user, due_date=due_date) for result in served
+            ])
+            for result, loan in zip(served, loans):
+                result.update(loan_id=loan.id, due_date=loan.due_date)
+            record_checkouts([result['book_id'] for result in served])
+            invalidate_dashboard()
+    return results
+
+
+def return_many(loan_ids, user):
+    """Rend une liste d'emprunts avec un résultat par élément.
+
+    Le nombre de requêtes est fixe, plus une passe de file d'attente par
+    livre réservé par d'autres lecteurs.
+    """
+    with transaction.atomic():
+        loans = {
+            loan['id']: loan for loan in
+            Loan.objects.select_for_update().filter(id__in=set(loan_ids)).values('id', 'book_id', 'user_id', 'status')
+        }
+
+        results = []
+        returned = {}
+        for loan_id in loan_ids:
+            loan = loans.get(loan_id)
+            if loan is None:
+                results.append(_item_result(False, loan_id=loan_id, error='Emprunt non trouvé'))
+            elif loan['user_id'] != user.id and not user.is_admin:
+                results.append(_item_result(False, loan_id=loan_id, error='Permission refusée'))
+            elif loan['status'] not in OPEN_LOAN_STATUSES or loan_id in returned:
+                results.append(_item_result(False, loan_id=loan_id, error='Cet emprunt est déjà clôturé.'))
+            else:
+                returned[loan_id] = loan['book_id']
+                results.append(_item_result(True, loan_id=loan_id, book_id=loan['book_id']))
+
+        if returned:
+            updated = Loan.objects.filter(id__in=returned, status__in=OPEN_LOAN_STATUSES).update(
+                status='returned', return_date=date.today(), updated_at=Now()
+            )
+            if updated != len(returned):
+                raise CirculationError('Un emprunt a changé pendant le traitement, veuillez réessayer.', status_code=409)
+
+            copies = Counter(returned.values())
+            # Les livres attendus passent par la file ; les autres sont remis en rayon d'un coup
+            waiting = set(
+                Reservation.objects.filter(book_id__in=copies, status='active')
+                .values_list('book_id', flat=True).distinct()
+            )
+            for book_id in waiting:
+                hand_off(book_id, copies.pop(book_id))
+            if copies:
+                Book.objects.filter(id__in=copies).update(
+                    available_quantity=F('available_quantity') + Case(
+                        *[When(id=book_id, then=Value(count)) for book_id, count in copies.items()]
+                    ),
+                    status=Case(When(status='borrowed', then=Value('available')), default=F('status')),
+                    updated_at=Now(),
+                )
+            invalidate_dashboard()
+    return results
+
+
+def compute_fine(days_overdue):
+    """Amende due pour `days_overdue` jours de retard, plafonnée si `LIBRARY_FINE_MAX` > 0."""
+    fine = settings.LIBRARY_FINE_PER_DAY * max(days_overdue, 0)
+    if settings.LIBRARY_FINE_MAX > 0:
+        fine = min(fine, settings.LIBRARY_FINE_MAX)
+    return fine.quantize(Decimal('0.01'))
+
+
+def sweep_overdue(today=None, chunk_size=None):
+    """Passe en retard les emprunts échus et met à jour leurs amendes.
+
+    L'amende ne dépend que de `due_date` : on exécute un UPDATE par date
+    d'échéance, découpé en tranches d'identifiants pour garder des
+    transactions courtes. Les lignes déjà à jour sont exclues, ce qui rend la
+    tâche idempotente et reprenable. Renvoie le nombre d'emprunts modifiés.
+    """
+    today = today or date.today()
+    chunk_size = chunk_size or settings.LIBRARY_SWEEP_CHUNK_SIZE
+    due_loans = Loan.objects.filter(status__in=OPEN_LOAN_STATUSES, due_date__lt=today)
+
+    updated = 0
+    for due_date in due_loans.order_by('due_date').values_list('due_date', flat=True).distinct():
+        fine = compute_fine((today - due_date).days)
+        stale = due_loans.filter(due_date=due_date).exclude(status='overdue', fine_amount=fine)
+        bounds = stale.aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            continue
+        for start in range(bounds['first'], bounds['last'] + 1, chunk_size):
+            updated += stale.filter(id__gte=start, id__lt=start + chunk_size).update(
+                status='overdue', fine_amount=fine, updated_at=Now()
+            )
+    if updated:
+        invalidate_dashboard()
+    return updated
+
+
+def expire_reservations(now=None, chunk_size=None):
+    """Expire les mises de côté non retirées et redistribue leurs exemplaires.
+
+    Seules les réservations `ready` ont une échéance : celles qui attendent
+    encore un exemplaire restent dans la file. Les exemplaires non retirés
+    repassent par la file du livre, par tranches de réservations
+    verrouillées. Renvoie le nombre de réservations expirées.
+    """
+    now = now or timezone.now()
+    chunk_size = chunk_size or settings.LIBRARY_SWEEP_CHUNK_SIZE
+    expired = 0
+
+    while True:
+        with transaction.atomic():
+            holds = list(
+                Reservation.objects.select_for_update(skip_locked=True)
+                .filter(status='ready', expiry_date__lte=now)
+                .order_by('id').values_list('id', 'book_id')[:chunk_size]
+            )
+            if not holds:
+                break
+            Reservation.objects.filter(id__in=[hold_id for hold_id, _ in holds]).update(status='expired')
+            for book_id, count in Counter(book_id for _, book_id in holds).items():
+                hand_off(book_id, count)
+        expired += len(holds)
+    return expired
+
+
+def with_queue_position(queryset):
+    """Annote `queue_position` (1 = prochain servi) sur les réservations en attente.
+
+    Le rang est un COUNT des réservations plus anciennes du même livre,
+    résolu par l'index (book, status, reservation_date, id).
+    """
+    ahead = (
+        Reservation.objects.filter(book=OuterRef('book'), status='active')
+        .filter(Q(reservation_date__lt=OuterRef('reservation_date'))
+                | Q(reservation_date=OuterRef('reservation_date'), id__lt=OuterRef('id')))
+        .order_by().values('book').annotate(count=Count('id')).values('count')
+    )
+    return queryset.annotate(queue_position=Case(
+        When(status='active', then=Coalesce(Subquery(ahead), 0) + 1),
+        default=None,
+    ))
@@ -0,0 +1,71 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.db.models.functions import Now
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import Book
+from .thumbnails import thumbnails_generation
+
+
+def touch_books(book_ids):
+    """Avance `updated_at` des livres dont la représentation a changé.
+
+    Les auteurs, catégories et éditeurs sont imbriqués dans les réponses du
+    catalogue : leur modification doit invalider les validateurs des livres.
+    """
+    Book.objects.filter(id__in=book_ids).update(updated_at=Now())
+
+
+class ConditionalGetMixin:
+    """Répond 304 aux GET dont les données n'ont pas changé.
+
+    Les validateurs viennent d'un seul agrégat sur le queryset filtré (nombre
+    de lignes et max des `last_modified_fields`), sans exécuter la requête de
+    la page. L'ETag combine ces valeurs avec l'URL complète et l'en-tête
+    Accept ; le nombre de lignes couvre les suppressions, et le compteur de
+    miniatures les réponses rendues avant la fin de leur génération.
+    """
+    last_modified_fields = ('updated_at',)
+
+    def filter_queryset(self, queryset):
+        # Filtres (recherche plein texte comprise) appliqués une fois par
+        # requête : validateurs et page partent du même queryset
+        if not hasattr(self, '_filtered_queryset'):
+            self._filtered_queryset = super().filter_queryset(queryset)
+        return self._filtered_queryset.all()
+
+    def get_validators_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg in self.kwargs:
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return queryset.order_by()
+
+    def get_validators(self):
+        aggregates = {f'last_modified_{index}': Max(field) for index, field in enumerate(self.last_modified_fields)}
+        row = self.get_validators_queryset().aggregate(rows=Count('pk', distinct=True), **aggregates)
+        rows = row.pop('rows')
+        timestamps = [value for value in row.values() if value is not None]
+        last_modified = int(max(timestamps).timestamp()) if timestamps else None
+
+        key = '|'.join([
+            self.request.get_full_path(),
+            self.request.META.get('HTTP_ACCEPT', ''),
+            str(rows),
+            max(timestamps).isoformat() if timestamps else '',
+            str(thumbnails_generation()),
+        ])
+        return quote_etag(hashlib.md5(key.encode()).hexdigest()), last_modified
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -0,0 +1,110 @@
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import F
+
+from .models import Book, Loan
+
+BOOK_COLUMNS = [
+    'id', 'isbn', 'title', 'subtitle', 'description', 'publish_date', 'pages', 'language', 'status',
+    'quantity', 'available_quantity', 'publisher', 'average_rating', 'review_count',
+    'authors', 'categories', 'created_at', 'updated_at',
+]
+
+LOAN_COLUMNS = [
+    'id', 'book_id', 'book_isbn', 'book_title', 'user_id', 'user_email', 'borrow_date', 'due_date',
+    'return_date', 'status', 'fine_amount', 'created_at', 'updated_at',
+]
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def export_books(since=None, chunk_size=None):
+    """Livres avec auteurs et catégories, par lots de `chunk_size` lignes.
+
+    Les livres sont lus par curseur serveur ; les liens M2M du lot courant
+    sont chargés en deux requêtes, si bien que la mémoire ne dépend que de
+    `chunk_size`. Les auteurs sont écrits `Nom, Prénom`, comme à l'import.
+    """
+    chunk_size = chunk_size or settings.LIBRARY_EXPORT_CHUNK_SIZE
+    books = Book.objects.order_by('id')
+    if since is not None:
+        books = books.filter(updated_at__gte=since)
+    rows = books.values(
+        *[column for column in BOOK_COLUMNS if column not in ('publisher', 'authors', 'categories')],
+        publisher_name=F('publisher__name'),
+    ).iterator(chunk_size=chunk_size)
+
+    for batch in _batches(rows, chunk_size):
+        ids = [row['id'] for row in batch]
+        authors, categories = {}, {}
+        for book_id, first_name, last_name in Book.authors.through.objects.filter(book_id__in=ids).values_list(
+                'book_id', 'author__first_name', 'author__last_name'):
+            authors.setdefault(book_id, []).append(f'{last_name}, {first_name}' if first_name else last_name)
+        for book_id, name in Book.categories.through.objects.filter(book_id__in=ids).values_list(
+                'book_id', 'category__name'):
+            categories.setdefault(book_id, []).append(name)
+
+        for row in batch:
+            row['publisher'] = row.pop('publisher_name')
+            row['authors'] = authors.get(row['id'], [])
+            row['categories'] = categories.get(row['id'], [])
+            yield row
+
+
+def export_loans(since=None, chunk_size=None):
+    """Historique des emprunts, lu par curseur serveur."""
+    chunk_size = chunk_size or settings.LIBRARY_EXPORT_CHUNK_SIZE
+    loans = Loan.objects.order_by('id')
+    if since is not None:
+        loans = loans.filter(updated_at__gte=since)
+    return loans.values(
+        'id', 'book_id', 'user_id', 'borrow_date', 'due_date', 'return_date', 'status', 'fine_amount',
+        'created_at', 'updated_at', book_isbn=F('book__isbn'), book_title=F('book__title'), user_email=F('user__email'),
+    ).iterator(chunk_size=chunk_size)
+
+
+DATASETS = {'books': (export_books, BOOK_COLUMNS), 'loans': (export_loans, LOAN_COLUMNS)}
+
+
+class _Echo:
+    """Tampon d'écriture qui renvoie la ligne au lieu de la stocker."""
+
+    def write(self, value):
+        return value
+
+
+def to_csv(rows, columns):
+    """Lignes CSV une à une, en-tête compris ; les listes sont jointes par `;`."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([
+            '; '.join(value) if isinstance(value, list) else value
+            for value in (row[column] for column in columns)
+        ])
+
+
+def to_ndjson(rows, columns):
+    """Un objet JSON par ligne, colonnes dans l'ordre de `columns`."""
+    for row in rows:
+        yield json.dumps({column: row[column] for column in columns}, default=str, ensure_ascii=False) + '\n'
+
+
+FORMATS = {
+    'csv': (to_csv, 'text/csv; charset=utf-8'),
+    'ndjson': (to_ndjson, 'application/x-ndjson; charset=utf-8'),
+}
+
+
+def export(dataset, fmt, since=None, chunk_size=None):
+    """Flux de lignes texte pour `dataset` (books, loans) au format `fmt` (csv, ndjson)."""
+    rows_for, columns = DATASETS[dataset]
+    serialize, _ = FORMATS[fmt]
+    return serialize(rows_for(since=since, chunk_size=chunk_size), columns)
@@ -0,0 +1,269 @@
+import hashlib
+from datetime import timedelta
+from itertools import chain
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import CharField, Count, Exists, F, IntegerField, OuterRef, Q, Sum, Value
+from django.db.models.functions import Cast, Substr
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .filters import BookFilter
+from .models import Book, BookFacetCount, Category, FacetIndexRun, Publisher
+from .search import get_search_backend, tokenize
+
+# Paramètres de BookFilter ignorés par chaque facette : ses propres filtres
+FACET_FILTERS = {
+    'category': ('categories',),
+    'language': ('language',),
+    'status': ('status',),
+    'publisher': ('publisher',),
+    'decade': ('publish_year', 'publish_year_gte', 'publish_year_lte'),
+}
+FACET_PARAMS = {param for params in FACET_FILTERS.values() for param in params}
+CHOICE_LABELS = {
+    'language': dict(Book.LANGUAGE_CHOICES),
+    'status': dict(Book.STATUS_CHOICES),
+}
+MODEL_LABELS = {'category': Category, 'publisher': Publisher}
+FRESHNESS_MARGIN = timedelta(seconds=1)
+
+
+def decade_key(field):
+    # Trois premiers caractères de la date ISO ('199' pour 1990-1999) : sous
+    # SQLite, extraire l'année passe par une fonction Python à chaque ligne
+    return Substr(Cast(field, CharField()), 1, 3)
+
+
+def decade_of(key):
+    return None if key is None else int(key) * 10
+
+
+def parse_facets(value):
+    """Noms de facettes demandés par `?facets=category,language` ; `all` les demande toutes."""
+    names = [name.strip() for name in (value or '').split(',') if name.strip()]
+    if names == ['all']:
+        return list(FACET_FILTERS)
+    unknown = [name for name in names if name not in FACET_FILTERS]
+    if unknown:
+        raise ValidationError({'facets': f"Facette(s) inconnue(s) : {', '.join(unknown)}. "
+                                         f"Valeurs possibles : {', '.join(FACET_FILTERS)}."})
+    return list(dict.fromkeys(names))
+
+
+def _grouped(rows, name, value=None, code=None, count=None):
+    # Valeurs textuelles et entières dans deux colonnes pour une UNION bien typée ;
+    # la colonne vide est une constante, hors du GROUP BY
+    return (
+        rows.order_by()
+        .values(
+            facet=Value(name, output_field=CharField()),
+            value=value if value is not None else Value(None, output_field=CharField()),
+            code=code if code is not None else Value(None, output_field=IntegerField()),
+        )
+        .annotate(count=count or Count('*'))
+        .values_list('facet', 'value', 'code', 'count')
+    )
+
+
+# Calcul exact sur les livres filtrés
+
+def _filtered_books(params):
+    """Livres retenus par les filtres et la recherche de `params`, ou None sans filtre actif."""
+    query = params.get('search', '')
+    if not any(params.get(name) for name in BookFilter.base_filters) and not tokenize(query):
+        return None
+    books = BookFilter(params, queryset=Book.objects.all()).qs
+    if tokenize(query):
+        # Pas de classement par pertinence : seul l'ensemble des livres trouvés compte
+        books = books.filter(id__in=get_search_backend().matching(query))
+    if books.query.distinct:
+        # Filtre sur une relation multiple : on repasse par l'ensemble des ids
+        books = Book.objects.filter(id__in=books.order_by().values('id'))
+    return books.order_by()
+
+
+def _exact_part(name, books):
+    if name == 'category':
+        # Compté sur la table de liaison seule, sans jointure vers les livres
+        rows = Book.categories.through.objects.all()
+        if books is not None:
+            rows = rows.filter(book_id__in=books.values('id'))
+        return _grouped(rows, name, code=F('category_id'))
+    rows = books if books is not None else Book.objects.all()
+    if name == 'decade':
+        return _grouped(rows, name, value=decade_key('publish_date'))
+    if name == 'publisher':
+        return _grouped(rows, name, code=F('publisher_id'))
+    return _grouped(rows, name, value=F(name))
+
+
+def _exact_parts(params, names):
+    parts = []
+    for name in names:
+        own = params.copy()
+        for param in FACET_FILTERS[name]:
+            own.pop(param, None)
+        parts.append(_exact_part(name, _filtered_books(own)))
+    return parts
+
+
+# Index de facettes
+
+def rebuild_facet_index():
+    """Recalcule la table `BookFacetCount` ; renvoie son nombre de lignes."""
+    # Date prise avant la lecture, avec une marge (Now() de SQLite est à la
+    # milliseconde, et une écriture pas encore validée échappe à la lecture) :
+    # un livre modifié pendant le calcul rend l'index périmé
+    started_at = timezone.now() - FRESHNESS_MARGIN
+    books = Book.objects.order_by().values(
+        'language', 'status', 'publisher_id', key=decade_key('publish_date'),
+    ).annotate(books=Count('id'))
+    pairs = Book.categories.through.objects.order_by().values(
+        'category_id', language=F('book__language'), status=F('book__status'),
+        publisher_id=F('book__publisher_id'), key=decade_key('book__publish_date'),
+    ).annotate(books=Count('id'))
+    rows = []
+    for row in chain(books.iterator(), pairs.iterator()):
+        rows.append(BookFacetCount(decade=decade_of(row.pop('key')), **row))
+    with transaction.atomic():
+        BookFacetCount.objects.all().delete()
+        BookFacetCount.objects.bulk_create(rows, batch_size=5000)
+        FacetIndexRun.objects.all().delete()
+        FacetIndexRun.objects.create(started_at=started_at)
+    return len(rows)
+
+
+def invalidate_facet_index():
+    """Écarte l'index jusqu'à sa prochaine reconstruction (livre supprimé : pas d'`updated_at` à comparer)."""
+    FacetIndexRun.objects.all().delete()
+
+
+def facet_index_is_current():
+    """Vrai si l'index a été construit et qu'aucun livre n'a changé depuis.
+
+    Toutes les écritures sur les livres, y compris les UPDATE en masse de la
+    circulation, avancent `updated_at` ; les suppressions écartent l'index.
+    Une seule requête, résolue par l'index sur `updated_at`.
+    """
+    changed = Book.objects.filter(updated_at__gt=OuterRef('started_at'))
+    stale = FacetIndexRun.objects.annotate(stale=Exists(changed)).values_list('stale', flat=True).first()
+    return stale is False
+
+
+def _index_conditions(params):
+    """Conditions sur `BookFacetCount` par paramètre, ou None si l'index ne suffit pas.
+
+    L'index ne connaît que les facettes, à la décennie près et pour au plus
+    une catégorie à la fois : tout autre filtre demande le calcul exact.
+    """
+    if tokenize(params.get('search', '')) or params.get('publish_year') or any(
+        params.get(name) for name in BookFilter.base_filters if name not in FACET_PARAMS
+    ):
+        return None
+    categories = [value for value in params.getlist('categories') if value]
+    if len(categories) > 1:
+        return None
+    filterset = BookFilter(params, queryset=Book.objects.none())
+    if not filterset.is_valid():
+        return None
+    data = filterset.form.cleaned_data
+
+    conditions = {'categories': Q(category_id=categories[0]) if categories else Q(category__isnull=True)}
+    for param in ('language', 'status', 'publisher'):
+        if data.get(param):
+            conditions[param] = Q(**{param: data[param]})
+    if data.get('publish_year_gte') is not None:
+        if data['publish_year_gte'] % 10:
+            return None
+        conditions['publish_year_gte'] = Q(decade__gte=data['publish_year_gte'])
+    if data.get('publish_year_lte') is not None:
+        if data['publish_year_lte'] % 10 != 9:
+            return None
+        conditions['publish_year_lte'] = Q(decade__lte=data['publish_year_lte'] - 9)
+    return conditions
+
+
+def _index_parts(conditions, names):
+    parts = []
+    for name in names:
+        condition = Q()
+        for param, q in conditions.items():
+            if param not in FACET_FILTERS[name]:
+                condition &= q
+        if name == 'category':
+            condition &= Q(category__isnull=False)
+        rows = BookFacetCount.objects.filter(condition)
+        if name in CHOICE_LABELS:
+            parts.append(_grouped(rows, name, value=F(name), count=Sum('books')))
+        else:
+            column = {'category': 'category_id', 'publisher': 'publisher_id'}.get(name, name)
+            parts.append(_grouped(rows, name, code=F(column), count=Sum('books')))
+    return parts
+
+
+def _labels(facets):
+    for name, model in MODEL_LABELS.items():
+        buckets = facets.get(name)
+        if buckets:
+            names = model.objects.in_bulk([bucket['value'] for bucket in buckets])
+            for bucket in buckets:
+                instance = names.get(bucket['value'])
+                bucket['label'] = instance.name if instance else str(bucket['value'])
+    for name, choices in CHOICE_LABELS.items():
+        for bucket in facets.get(name, ()):
+            bucket['label'] = choices.get(bucket['value'], bucket['value'])
+    for bucket in facets.get('decade', ()):
+        bucket['label'] = f"Années {bucket['value']}"
+
+
+def compute_facet_counts(params, names):
+    """Nombre de livres par valeur de chaque facette.
+
+    Chaque facette compte les livres retenus par tous les filtres sauf le
+    sien, pour que le client voie ce que donnerait un autre choix. Les
+    regroupements sont réunis par UNION ALL : un seul aller-retour pour
+    toutes les facettes, suivi des libellés des catégories et éditeurs.
+
+    Quand seuls des filtres de facettes sont actifs, les compteurs viennent
+    de l'index `BookFacetCount`, s'il est à jour : aucun livre modifié depuis
+    le dernier `build_facet_index`. Sinon ils sont calculés exactement sur les
+    livres filtrés ; les compteurs ne contredisent jamais la liste.
+    """
+    conditions = None
+    if settings.LIBRARY_FACET_INDEX:
+        conditions = _index_conditions(params)
+        if conditions is not None and not facet_index_is_current():
+            conditions = None
+    parts = _index_parts(conditions, names) if conditions is not None else _exact_parts(params, names)
+    rows = parts[0].union(*parts[1:], all=True) if len(parts) > 1 else parts[0]
+
+    facets = {name: [] for name in names}
+    for name, value, code, count in rows:
+        value = code if value is None else value
+        if name == 'decade' and isinstance(value, str):
+            value = decade_of(value)
+        if value is not None and count:
+            facets[name].append({'value': value, 'count': count})
+    size = settings.LIBRARY_FACET_SIZE
+    for buckets in facets.values():
+        buckets.sort(key=lambda bucket: (-bucket['count'], str(bucket['value'])))
+        del buckets[size:]
+    _labels(facets)
+    return facets
+
+
+def facet_counts(params, names):
+    """`compute_facet_counts` mis en cache `LIBRARY_FACET_CACHE_TTL` secondes par combinaison de filtres."""
+    if not names:
+        return {}
+    ignored = {'facets', 'page', 'page_size', 'cursor', 'pagination', 'count', 'ordering', 'fields', 'expand'}
+    key = repr(sorted((name, params.getlist(name)) for name in params if name not in ignored)) + repr(names)
+    key = 'facets:' + hashlib.sha1(key.encode()).hexdigest()
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facet_counts(params, names)
+        cache.set(key, facets, settings.LIBRARY_FACET_CACHE_TTL)
+    return facets
@@ -0,0 +1,175 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+PK_ONLY = object()
+
+
+def parse_fieldset(value):
+    """Transforme `id,book.title,book.isbn` en arbre `{'id': {}, 'book': {'title': {}, 'isbn': {}}}`."""
+    tree = {}
+    for path in (part.strip() for part in (value or '').split(',')):
+        if not path:
+            continue
+        node = tree
+        for name in path.split('.'):
+            node = node.setdefault(name, {})
+    return tree
+
+
+class SparseFieldsMixin:
+    """Rend seulement les champs demandés, avec des relations compactes.
+
+    `fields` restreint les champs rendus ; un chemin pointé (`book.title`)
+    sélectionne un champ d'une relation imbriquée. Dans ce mode, les
+    relations sont rendues par leur clé primaire sauf si elles figurent dans
+    `expand` ou si des sous-champs sont demandés. Sans `fields` ni `expand`,
+    la représentation complète est conservée.
+
+    Un champ inconnu, ou des sous-champs demandés sur un champ qui n'est pas
+    une relation imbriquée capable de les restreindre, lèvent une erreur de
+    validation (400) plutôt que d'être ignorés.
+
+    `Meta.field_dependencies` indique les champs du modèle lus par les
+    propriétés calculées, pour que la vue puisse restreindre sa requête.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sparse = bool(fields or expand)
+        if not self.sparse:
+            return
+
+        expand = expand or {}
+        unknown = sorted(set(fields or ()) - set(self.fields))
+        if unknown:
+            raise serializers.ValidationError({'fields': [f"Champ inconnu : {name}." for name in unknown]})
+        for name in list(self.fields):
+            if fields and name not in fields:
+                self.fields.pop(name)
+                continue
+            field = self.fields[name]
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            subfields = fields.get(name) if fields else None
+            if not isinstance(nested, serializers.BaseSerializer):
+                if subfields:
+                    raise serializers.ValidationError({'fields': [f"Le champ {name} n'a pas de sous-champs."]})
+                continue
+            if subfields and not issubclass(type(nested), SparseFieldsMixin):
+                raise serializers.ValidationError(
+                    {'fields': [f"Les sous-champs de {name} ne peuvent pas être sélectionnés."]}
+                )
+
+            options = {'many': nested is not field, 'read_only': True}
+            if field.source != name:
+                options['source'] = field.source
+            if not (subfields or name in expand):
+                self.fields[name] = serializers.PrimaryKeyRelatedField(**options)
+            elif issubclass(type(nested), SparseFieldsMixin):
+                self.fields[name] = type(nested)(fields=subfields, expand=expand.get(name), **options)
+            else:
+                self.fields[name] = type(nested)(**options)
+
+
+def _collect(serializer, prefix, plan):
+    """Renseigne `plan` (colonnes, jointures, préchargements) pour `serializer`."""
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    model = serializer.Meta.model
+    dependencies = getattr(serializer.Meta, 'field_dependencies', {})
+
+    columns = {model._meta.pk.name}
+    complete = True
+    for field in serializer.fields.values():
+        if field.write_only or isinstance(field, serializers.SerializerMethodField):
+            continue
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        if not isinstance(nested, serializers.BaseSerializer):
+            nested = None
+        for source in dependencies.get(field.source, (field.source,)):
+            try:
+                model_field = model._meta.get_field(source)
+            except FieldDoesNotExist:
+                complete = False
+                continue
+
+            path = prefix + source
+            if model_field.many_to_many or model_field.one_to_many:
+                # Une propriété lit des objets complets (None) ; une liste
+                # de clés primaires se contente de la colonne `pk`
+                if source != field.source:
+                    wanted = None
+                else:
+                    wanted = nested if nested is not None else PK_ONLY
+                if plan['prefetch'].get(path, PK_ONLY) is PK_ONLY:
+                    plan['prefetch'][path] = wanted
+            else:
+                columns.add(source)
+                if model_field.is_relation and nested is not None and source == field.source:
+                    plan['select'].append(path)
+                    _collect(nested, path + '__', plan)
+
+    if not complete:
+        columns = {field.name for field in model._meta.concrete_fields}
+    plan['only'].extend(prefix + column for column in columns)
+
+
+def optimize_queryset(queryset, serializer, extra_columns=()):
+    """Restreint colonnes, jointures et préchargements à ce que `serializer` rend.
+
+    Les jointures et préchargements existants du queryset sont remplacés.
+    Un niveau dont un champ ne correspond à aucune colonne (propriété sans
+    `field_dependencies`) charge toutes ses colonnes.
+    """
+    plan = {'only': list(extra_columns), 'select': [], 'prefetch': {}}
+    _collect(serializer, '', plan)
+
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if plan['select']:
+        queryset = queryset.select_related(*plan['select'])
+    for path, nested in plan['prefetch'].items():
+        model = queryset.model
+        for name in path.split('__'):
+            model = model._meta.get_field(name).related_model
+        related = model.objects.all()
+        if nested is PK_ONLY:
+            related = related.only(model._meta.pk.name)
+        elif nested is not None:
+            related = optimize_queryset(related, nested)
+        queryset = queryset.prefetch_related(Prefetch(path, queryset=related))
+    return queryset.only(*plan['only'])
+
+
+class SparseFieldsetMixin:
+    """Branche `?fields=` et `?expand=` sur une vue de lecture.
+
+    Le sérialiseur ne rend que les champs demandés et le queryset ne charge
+    que les colonnes et relations correspondantes.
+    """
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+
+    def get_fieldset(self):
+        params = self.request.query_params
+        return parse_fieldset(params.get(self.fields_query_param)), parse_fieldset(params.get(self.expand_query_param))
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.get_fieldset()
+        if fields or expand:
+            kwargs.setdefault('fields', fields)
+            kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        # Appliqué après les filtres pour couvrir aussi les vues qui redéfinissent get_queryset
+        queryset = super().filter_queryset(queryset)
+        fields, expand = self.get_fieldset()
+        if not (fields or expand):
+            return queryset
+        # Le sérialiseur sans instance suffit à connaître les champs rendus
+        serializer = self.get_serializer_class()(
+            context=self.get_serializer_context(), fields=fields, expand=expand,
+        )
+        # Les colonnes du curseur de pagination sont lues sur chaque page
+        keyset = [field.lstrip('-') for field in getattr(self.paginator, 'keyset_ordering', ())]
+        return optimize_queryset(queryset, serializer, extra_columns=keyset)
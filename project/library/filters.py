@@ -1,5 +1,7 @@
 import django_filters
+from rest_framework.filters import BaseFilterBackend
 from .models import Book, Category, Author
+from .search import get_search_backend, tokenize
 
 class BookFilter(django_filters.FilterSet):
     title = django_filters.CharFilter(lookup_expr='icontains')
@@ -10,7 +12,29 @@ class BookFilter(django_filters.FilterSet):
     publish_year_lte = django_filters.NumberFilter(field_name='publish_date', lookup_expr='year__lte')
     pages_gte = django_filters.NumberFilter(field_name='pages', lookup_expr='gte')
     pages_lte = django_filters.NumberFilter(field_name='pages', lookup_expr='lte')
+    average_rating_gte = django_filters.NumberFilter(field_name='average_rating', lookup_expr='gte')
+    average_rating_lte = django_filters.NumberFilter(field_name='average_rating', lookup_expr='lte')
+    review_count_gte = django_filters.NumberFilter(field_name='review_count', lookup_expr='gte')
     
     class Meta:
         model = Book
-        fields = ['status', 'language', 'publisher']
\ No newline at end of file
+        fields = ['status', 'language', 'publisher']
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """Recherche via l'index plein texte, résultats triés par pertinence.
+
+    Le tri par pertinence ne s'applique que si le client ne demande pas
+    explicitement un `ordering`.
+    """
+    search_param = 'search'
+    ordering_param = 'ordering'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not tokenize(query):
+            return queryset
+
+        queryset = get_search_backend().filter_queryset(queryset, query)
+        if request.query_params.get(self.ordering_param):
+            return queryset
+        return queryset.order_by('search_rank', *queryset.query.order_by)
@@ -0,0 +1,284 @@
+import csv
+import json
+import re
+from datetime import date
+
+from django.db import transaction
+from django.utils import timezone
+
+from .isbn import canonical_isbn
+from .models import Author, Book, Category, Publisher
+from .search import get_search_backend
+from .stats import invalidate_dashboard
+
+BOOK_FIELDS = ['title', 'subtitle', 'description', 'publish_date', 'pages', 'language', 'publisher_id']
+
+MARC_LANGUAGES = {'fre': 'fr', 'fra': 'fr', 'eng': 'en', 'spa': 'es', 'ger': 'de', 'deu': 'de', 'ita': 'it', 'por': 'pt'}
+
+
+class CatalogImportError(Exception):
+    """Fichier d'import illisible ou format inconnu."""
+
+
+# Lecteurs : chaque format produit des enregistrements au fil de l'eau
+
+def read_csv(stream):
+    """Lit un CSV dont les colonnes `authors` et `categories` sont séparées par des `;`."""
+    for row in csv.DictReader(stream):
+        yield {
+            **row,
+            'authors': _split(row.get('authors')),
+            'categories': _split(row.get('categories')),
+        }
+
+
+def read_jsonl(stream):
+    """Lit un objet JSON par ligne ; les lignes vides sont ignorées."""
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            raise CatalogImportError(f'JSON invalide à la ligne {number}')
+
+
+def read_marc(stream):
+    """Lit des notices MARC 21 (ISO 2709) une à une, sans dépendance externe."""
+    while True:
+        length = stream.read(5)
+        if not length.strip():
+            return
+        try:
+            data = length + stream.read(int(length) - 5)
+        except ValueError:
+            raise CatalogImportError('Longueur de notice MARC invalide')
+        yield _marc_record(_marc_fields(data))
+
+
+def _marc_fields(data):
+    base = int(data[12:17])
+    directory = data[24:data.index(b'\x1e')]
+    fields = {}
+    for offset in range(0, len(directory) - 11, 12):
+        entry = directory[offset:offset + 12]
+        tag, size, start = entry[:3].decode(), int(entry[3:7]), int(entry[7:12])
+        raw = data[base + start:base + start + size].rstrip(b'\x1e').decode('utf-8', 'replace')
+        if tag < '010':
+            fields.setdefault(tag, []).append(raw)
+        else:
+            # Indicateurs, puis sous-champs introduits par 0x1F et leur code
+            subfields = {}
+            for chunk in raw.split('\x1f')[1:]:
+                if chunk:
+                    subfields.setdefault(chunk[0], []).append(chunk[1:].strip(' /:;,.'))
+            fields.setdefault(tag, []).append(subfields)
+    return fields
+
+
+def _marc_record(fields):
+    def first(tag, code):
+        for field in fields.get(tag, []):
+            if field.get(code):
+                return field[code][0]
+        return ''
+
+    def every(tags, code):
+        return [value for tag in tags for field in fields.get(tag, []) for value in field.get(code, [])]
+
+    fixed = (fields.get('008') or [''])[0]
+    return {
+        'isbn': first('020', 'a').split(' ')[0],
+        'title': first('245', 'a'),
+        'subtitle': first('245', 'b'),
+        'description': first('520', 'a'),
+        'publish_date': first('264', 'c') or first('260', 'c'),
+        'pages': first('300', 'a'),
+        'language': MARC_LANGUAGES.get(first('041', 'a') or fixed[35:38], 'other'),
+        'publisher': first('264', 'b') or first('260', 'b'),
+        'authors': every(('100', '700'), 'a'),
+        'categories': every(('650',), 'a'),
+    }
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl, 'marc': read_marc}
+
+
+def _split(value):
+    return [part.strip() for part in (value or '').split(';') if part.strip()]
+
+
+def _author_name(name):
+    """`Nom, Prénom` ou `Prénom Nom` -> (prénom, nom)."""
+    if ',' in name:
+        last_name, first_name = (part.strip() for part in name.split(',', 1))
+    else:
+        first_name, _, last_name = name.strip().rpartition(' ')
+    return first_name[:100], last_name[:100]
+
+
+def _publish_date(value):
+    if isinstance(value, date):
+        return value
+    value = str(value or '').strip()
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        year = re.search(r'\d{4}', value)
+        return date(int(year.group()), 1, 1) if year else None
+
+
+def normalize(record):
+    """Valide un enregistrement brut ; renvoie None s'il est inexploitable.
+
+    ISBN, titre et date de publication sont obligatoires ; `authors` et
+    `categories` sont des listes ou des chaînes séparées par des `;`.
+    """
+    try:
+        return _normalize(record)
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def _names(value):
+    return _split(value) if isinstance(value, str) else [str(name).strip() for name in value or [] if str(name).strip()]
+
+
+def _normalize(record):
+    isbn = str(record.get('isbn') or '').strip()
+    title = str(record.get('title') or '').strip()
+    publish_date = _publish_date(record.get('publish_date'))
+    if not isbn or not title or publish_date is None or len(isbn) > 17:
+        return None
+
+    pages = re.search(r'\d+', str(record.get('pages') or ''))
+    language = record.get('language') or 'fr'
+    quantity = int(record.get('quantity') or 1)
+    return {
+        'isbn': isbn,
+        'title': title[:300],
+        'subtitle': str(record.get('subtitle') or '')[:300],
+        'description': str(record.get('description') or ''),
+        'publish_date': publish_date,
+        # Le nombre de pages est obligatoire : 1 faute de mieux
+        'pages': max(int(pages.group()), 1) if pages else 1,
+        'language': language if language in dict(Book.LANGUAGE_CHOICES) else 'other',
+        'quantity': max(quantity, 1),
+        'publisher': str(record.get('publisher') or '').strip()[:200],
+        'authors': [_author_name(name) for name in _names(record.get('authors'))],
+        'categories': [name[:100] for name in _names(record.get('categories'))],
+    }
+
+
+# Écriture par lots
+
+def _publisher_ids(names):
+    ids = dict(Publisher.objects.filter(name__in=names).values_list('name', 'id'))
+    missing = [Publisher(name=name) for name in names if name not in ids]
+    ids.update((publisher.name, publisher.id) for publisher in Publisher.objects.bulk_create(missing))
+    return ids
+
+
+def _category_ids(names):
+    Category.objects.bulk_create([Category(name=name) for name in names], ignore_conflicts=True)
+    return dict(Category.objects.filter(name__in=names).values_list('name', 'id'))
+
+
+def _author_ids(names):
+    ids = {}
+    for author_id, first_name, last_name in Author.objects.filter(
+            last_name__in={last_name for _, last_name in names}).values_list('id', 'first_name', 'last_name'):
+        ids.setdefault((first_name, last_name), author_id)
+    missing = [Author(first_name=first_name, last_name=last_name) for first_name, last_name in names if (first_name, last_name) not in ids]
+    ids.update(((author.first_name, author.last_name), author.id) for author in Author.objects.bulk_create(missing))
+    return ids
+
+
+def _replace_links(through, column, links):
+    """Remplace les liens M2M des livres du lot par `links` ({book_id: [related_id]})."""
+    through.objects.filter(book_id__in=links).delete()
+    through.objects.bulk_create([
+        through(book_id=book_id, **{column: related_id})
+        for book_id, related_ids in links.items() for related_id in dict.fromkeys(related_ids)
+    ])
+
+
+def write_batch(records):
+    """Insère ou met à jour un lot d'enregistrements normalisés ; renvoie (créés, mis à jour).
+
+    Les livres sont écrits par un seul INSERT ... ON CONFLICT (isbn) DO
+    UPDATE ; le stock des livres déjà présents n'est pas modifié. Les liens
+    auteurs et catégories du lot sont remplacés en bloc.
+    """
+    records = {record['isbn']: record for record in records}
+    publishers = _publisher_ids({record['publisher'] for record in records.values() if record['publisher']})
+    categories = _category_ids({name for record in records.values() for name in record['categories']})
+    authors = _author_ids({name for record in records.values() for name in record['authors']})
+
+    # Une seule écriture par ISBN : celle du livre déjà présent, sinon la première du lot
+    canonical = {isbn: canonical_isbn(isbn) for isbn in records}
+    spellings = dict(Book.objects.filter(isbn13__in=set(canonical.values()) - {None}).values_list('isbn13', 'isbn'))
+    merged = {}
+    for isbn, record in records.items():
+        if canonical[isbn] is not None:
+            isbn = spellings.setdefault(canonical[isbn], isbn)
+        merged[isbn] = {**record, 'isbn': isbn}
+    records = merged
+    canonical = {isbn: canonical_isbn(isbn) for isbn in records}
+
+    existing = set(Book.objects.filter(isbn__in=records).values_list('isbn', flat=True))
+    now = timezone.now()
+    Book.objects.bulk_create(
+        [
+            Book(
+                isbn=isbn, isbn13=canonical[isbn], quantity=record['quantity'], available_quantity=record['quantity'],
+                publisher_id=publishers.get(record['publisher']), updated_at=now,
+                **{field: record[field] for field in BOOK_FIELDS if field != 'publisher_id'},
+            )
+            for isbn, record in records.items()
+        ],
+        update_conflicts=True, unique_fields=['isbn'], update_fields=BOOK_FIELDS + ['updated_at'],
+    )
+
+    book_ids = dict(Book.objects.filter(isbn__in=records).values_list('isbn', 'id'))
+    _replace_links(Book.authors.through, 'author_id', {
+        book_ids[isbn]: [authors[name] for name in record['authors']] for isbn, record in records.items()
+    })
+    _replace_links(Book.categories.through, 'category_id', {
+        book_ids[isbn]: [categories[name] for name in record['categories']] for isbn, record in records.items()
+    })
+    get_search_backend().index_books(book_ids.values())
+    return len(records) - len(existing), len(existing)
+
+
+def import_catalog(records, batch_size=1000, progress=None):
+    """Importe un flux d'enregistrements bruts par lots, une transaction par lot.
+
+    La mémoire reste bornée par `batch_size` quelle que soit la taille du
+    flux. `progress(stats)` est appelé après chaque lot.
+    """
+    stats = {'read': 0, 'created': 0, 'updated': 0, 'skipped': 0}
+
+    def flush(batch):
+        with transaction.atomic():
+            created, updated = write_batch(batch)
+        stats['created'] += created
+        stats['updated'] += updated
+        if progress:
+            progress(stats)
+
+    batch = []
+    for raw in records:
+        stats['read'] += 1
+        record = normalize(raw)
+        if record is None:
+            stats['skipped'] += 1
+            continue
+        batch.append(record)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    invalidate_dashboard()
+    return stats
@@ -0,0 +1,142 @@
+import json
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger('library.instrumentation')
+
+_current = ContextVar('library_request_timings', default=None)
+
+
+class RequestTimings:
+    """Mesures d'une requête : SQL, sérialisation et rendu, en millisecondes."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+        self.serialize_ms = 0.0
+        self.render_ms = 0.0
+        self.statements = Counter()
+        self.serializing = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Enveloppe d'exécution SQL (connection.execute_wrapper)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_ms += (time.perf_counter() - started) * 1000
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def repeated_statement(self):
+        """(requête SQL, nombre d'exécutions) de la requête la plus répétée."""
+        return self.statements.most_common(1)[0] if self.statements else ('', 0)
+
+
+def _timed_data(data):
+    def wrapper(serializer):
+        timings = _current.get()
+        # Seul l'appel le plus externe est mesuré : les sérialiseurs imbriqués y sont inclus
+        if timings is None or timings.serializing:
+            return data.fget(serializer)
+        timings.serializing += 1
+        db_before, started = timings.db_ms, time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            timings.serializing -= 1
+            # Les requêtes lancées pendant la sérialisation (querysets paresseux) restent comptées en base
+            timings.serialize_ms += (time.perf_counter() - started) * 1000 - (timings.db_ms - db_before)
+    wrapper.instrumented = True
+    return property(wrapper)
+
+
+def instrument_serializers():
+    if not getattr(BaseSerializer.data.fget, 'instrumented', False):
+        BaseSerializer.data = _timed_data(BaseSerializer.data)
+
+
+class ServerTimingMiddleware:
+    """Expose le coût de chaque requête dans l'en-tête `Server-Timing` et les logs.
+
+    Désactivé par défaut (`LIBRARY_SERVER_TIMING`) : le middleware se retire
+    alors de la chaîne au démarrage et ne coûte rien. Une requête SQL
+    exécutée au moins `LIBRARY_N_PLUS_ONE_THRESHOLD` fois est signalée comme
+    N+1 probable. Sous ASGI, les requêtes SQL des vues de lecture
+    asynchrones, exécutées dans leur propre pool, ne sont pas comptées.
+    """
+
+    def __init__(self, get_response):
+        if not settings.LIBRARY_SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        instrument_serializers()
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            with _wrap_connections(timings):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        statement, repeats = timings.repeated_statement()
+        n_plus_one = repeats >= settings.LIBRARY_N_PLUS_ONE_THRESHOLD
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timings.db_ms:.1f};desc="{timings.queries} queries"',
+            f'serialize;dur={timings.serialize_ms:.1f}',
+            f'render;dur={timings.render_ms:.1f}',
+            f'total;dur={total_ms:.1f}',
+        ])
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': timings.queries,
+            'db_ms': round(timings.db_ms, 1),
+            'serialize_ms': round(timings.serialize_ms, 1),
+            'render_ms': round(timings.render_ms, 1),
+            'total_ms': round(total_ms, 1),
+        }
+        if n_plus_one:
+            record.update(n_plus_one=repeats, statement=statement[:500])
+        logger.log(logging.WARNING if n_plus_one else logging.INFO, json.dumps(record))
+        return response
+
+    def process_template_response(self, request, response):
+        # Les réponses DRF sont rendues juste après ce hook
+        timings = _current.get()
+        started = time.perf_counter()
+
+        def rendered(response):
+            timings.render_ms += (time.perf_counter() - started) * 1000
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class _wrap_connections:
+    """Installe l'enveloppe de mesure sur toutes les connexions ouvertes pendant la requête."""
+
+    def __init__(self, timings):
+        self.timings = timings
+        self.wrapped = []
+
+    def __enter__(self):
+        for connection in connections.all():
+            connection.execute_wrappers.append(self.timings)
+            self.wrapped.append(connection)
+
+    def __exit__(self, *exc_info):
+        for connection in self.wrapped:
+            connection.execute_wrappers.remove(self.timings)
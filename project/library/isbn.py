@@ -0,0 +1,66 @@
+import re
+
+from django.db import transaction
+
+# Préfixe « ISBN », « ISBN-13: »… que les lecteurs et les notices ajoutent parfois
+PREFIX_RE = re.compile(r'^\s*isbn(?:-?1[03])?\s*:?\s*', re.IGNORECASE)
+SEPARATORS_RE = re.compile(r'[\s\-.]')
+
+
+def _isbn13_check(digits):
+    total = sum(int(digit) * (3 if position % 2 else 1) for position, digit in enumerate(digits[:12]))
+    return str((10 - total % 10) % 10)
+
+
+def _isbn10_check(digits):
+    total = sum(int(digit) * weight for digit, weight in zip(digits[:9], range(10, 1, -1)))
+    check = (11 - total % 11) % 11
+    return 'X' if check == 10 else str(check)
+
+
+def canonical_isbn(value):
+    """ISBN-13 sans séparateurs, ou None si `value` n'est pas un ISBN valide.
+
+    Accepte tirets, espaces et préfixe « ISBN » ; un ISBN-10 est converti en
+    ISBN-13 (préfixe 978). La clé de contrôle est vérifiée dans les deux cas.
+    """
+    value = SEPARATORS_RE.sub('', PREFIX_RE.sub('', str(value or ''))).upper()
+    if len(value) == 13 and value.isdigit():
+        if value[:3] in ('978', '979') and value[12] == _isbn13_check(value):
+            return value
+        return None
+    if len(value) == 10 and value[:9].isdigit() and value[9] == _isbn10_check(value):
+        digits = '978' + value[:9]
+        return digits + _isbn13_check(digits)
+    return None
+
+
+def backfill_isbn13(batch_size=1000):
+    """Renseigne `Book.isbn13` pour tout le catalogue ; renvoie (mis à jour, invalides, doublons).
+
+    Les ISBN invalides restent sans forme canonique. Quand plusieurs livres
+    ont le même ISBN sous des écritures différentes, seul le premier créé la
+    reçoit : les autres sont à fusionner à la main.
+    """
+    from .models import Book
+
+    seen = {}
+    changed, invalid, duplicates = [], 0, 0
+    for book_id, isbn, current in Book.objects.order_by('id').values_list('id', 'isbn', 'isbn13').iterator(chunk_size=batch_size):
+        isbn13 = canonical_isbn(isbn)
+        if isbn13 is None:
+            invalid += 1
+        elif isbn13 in seen:
+            duplicates += 1
+            isbn13 = None
+        else:
+            seen[isbn13] = book_id
+        if isbn13 != current:
+            changed.append(Book(id=book_id, isbn13=isbn13))
+
+    with transaction.atomic():
+        # Les valeurs retirées d'abord : l'index unique ne voit jamais deux fois la même
+        Book.objects.bulk_update([book for book in changed if book.isbn13 is None], ['isbn13'], batch_size=batch_size)
+        Book.objects.bulk_update([book for book in changed if book.isbn13 is not None], ['isbn13'],
+                                 batch_size=batch_size)
+    return len(changed), invalid, duplicates
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from rest_framework.authtoken.models import Token
+
+from accounts.models import User
+from library.benchmarks import busiest_reader, percentile
+from library.models import Book
+
+
+class Command(BaseCommand):
+    help = ("Compare le débit des lectures de l'API sous WSGI (workers synchrones) et sous ASGI "
+            "(vues de lecture asynchrones) pour un même nombre de connexions concurrentes")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--connections', type=int, default=64, help="Connexions concurrentes")
+        parser.add_argument('--workers', type=int, default=8, help="Workers du serveur WSGI simulé")
+        parser.add_argument('--db-latency-ms', type=float, default=0,
+                            help="Latence ajoutée à chaque requête SQL, pour simuler une base distante")
+        parser.add_argument('--mode', choices=['wsgi', 'asgi'], default=None,
+                            help="Mesure un seul mode dans ce processus (usage interne)")
+
+    def handle(self, *args, **options):
+        if options['mode']:
+            self.stdout.write(json.dumps(self.measure(options)))
+            return
+
+        # Un processus par mode : les URLs sont résolues selon LIBRARY_ASYNC_READS
+        results = {}
+        for mode in ('wsgi', 'asgi'):
+            env = {
+                **os.environ,
+                'LIBRARY_ASYNC_READS': str(mode == 'asgi'),
+                'PYTHONPATH': os.pathsep.join(filter(None, [str(settings.BASE_DIR), os.environ.get('PYTHONPATH')])),
+            }
+            command = [sys.executable, '-m', 'django', 'benchmark_asgi', '--mode', mode]
+            for option in ('requests', 'connections', 'workers', 'db_latency_ms'):
+                command += [f"--{option.replace('_', '-')}", str(options[option])]
+            completed = subprocess.run(command, env=env, capture_output=True, text=True)
+            if completed.returncode:
+                raise CommandError(f'Échec de la mesure {mode} :\n{completed.stderr}')
+            results[mode] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+        self.stdout.write(f"{'Mode':6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'erreurs':>8}")
+        for mode, result in results.items():
+            self.stdout.write(f"{mode.upper():6} {result['rps']:9.1f} {result['p50_ms']:9.1f} "
+                              f"{result['p95_ms']:9.1f} {result['errors']:8d}")
+        self.stdout.write(self.style.SUCCESS(
+            f"ASGI / WSGI : x{results['asgi']['rps'] / max(results['wsgi']['rps'], 0.1):.1f} "
+            f"({options['connections']} connexions, {options['workers']} workers WSGI)"
+        ))
+
+    def measure(self, options):
+        reader_id = busiest_reader()
+        book_id = Book.objects.order_by('id').values_list('id', flat=True).first()
+        if reader_id is None or book_id is None:
+            raise CommandError('Aucun emprunt en base : lancez generate_data avant le benchmark.')
+        token, _ = Token.objects.get_or_create(user=User.objects.get(pk=reader_id))
+        self.headers = {'Authorization': f'Token {token.key}'}
+        # Hôte des clients de test Django, en WSGI comme en ASGI
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+        # Requêtes de l'application mobile : champs restreints, peu de CPU par requête
+        self.urls = [
+            '/api/books/?fields=id,title,authors_list,cover_thumbnails',
+            f'/api/books/{book_id}/',
+            '/api/loans/?fields=id,book.title,due_date,status',
+            '/api/dashboard/',
+        ]
+
+        if options['db_latency_ms']:
+            self.add_latency(options['db_latency_ms'] / 1000)
+        run = self.run_asgi if options['mode'] == 'asgi' else self.run_wsgi
+        started = time.perf_counter()
+        timings, errors = run(options)
+        elapsed = time.perf_counter() - started
+        return {
+            'mode': options['mode'],
+            'requests': len(timings),
+            'rps': round(len(timings) / elapsed, 1),
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'errors': errors,
+            'run': uuid.uuid4().hex[:8],
+        }
+
+    def add_latency(self, seconds):
+        def slow(execute, sql, params, many, context):
+            time.sleep(seconds)
+            return execute(sql, params, many, context)
+
+        def install(sender, connection, **kwargs):
+            # Une connexion fermée puis rouverte garde ses enveloppes
+            if slow not in connection.execute_wrappers:
+                connection.execute_wrappers.append(slow)
+
+        connections.close_all()
+        connection_created.connect(install, weak=False)
+
+    def run_wsgi(self, options):
+        remaining = iter(range(options['requests']))
+        lock = threading.Lock()
+        timings, errors = [], []
+
+        def worker():
+            client = Client()
+            while True:
+                with lock:
+                    index = next(remaining, None)
+                if index is None:
+                    return
+                started = time.perf_counter()
+                response = client.get(self.urls[index % len(self.urls)], headers=self.headers)
+                timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+
+        threads = [threading.Thread(target=worker) for _ in range(options['workers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return timings, len(errors)
+
+    def run_asgi(self, options):
+        remaining = iter(range(options['requests']))
+        timings, errors = [], []
+
+        async def connection():
+            client = AsyncClient()
+            for index in remaining:
+                started = time.perf_counter()
+                response = await client.get(self.urls[index % len(self.urls)], headers=self.headers)
+                timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+
+        async def main():
+            await asyncio.gather(*(connection() for _ in range(options['connections'])))
+
+        asyncio.run(main())
+        return timings, len(errors)
@@ -0,0 +1,65 @@
+import time
+import uuid
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from library.models import Book
+
+
+class Command(BaseCommand):
+    help = "Compare le débit des emprunts/retours unitaires et par lot via l'API"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=20, help="Livres par lot")
+        parser.add_argument('--rounds', type=int, default=10)
+
+    def handle(self, *args, **options):
+        items, rounds = options['items'], options['rounds']
+        tag = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(
+            email=f'bench-{tag}@library.invalid', username=f'bench-{tag}',
+            first_name='Bench', last_name='Circulation',
+        )
+        books = Book.objects.bulk_create([
+            Book(title=f'Bench {tag} {i}', isbn=f'bench-{tag}-{i}', description='Livre temporaire',
+                 publish_date=date.today(), pages=1)
+            for i in range(items)
+        ])
+        book_ids = [book.id for book in books]
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(user)
+        try:
+            single = self.measure(rounds, items, lambda: self.single_round(client, book_ids))
+            batch = self.measure(rounds, items, lambda: self.batch_round(client, book_ids))
+        finally:
+            Book.objects.filter(id__in=book_ids).delete()
+            user.delete()
+
+        for label, (rate, queries) in (('Unitaire', single), ('Par lot', batch)):
+            self.stdout.write(f'{label:10} {rate:10.1f} livres/s  {queries:6.1f} requêtes SQL par livre')
+        self.stdout.write(self.style.SUCCESS(f'Gain de débit : x{batch[0] / single[0]:.1f}'))
+
+    def measure(self, rounds, items, run_round):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(rounds):
+                run_round()
+            elapsed = time.perf_counter() - started
+        processed = rounds * items
+        return processed / elapsed, len(queries) / processed
+
+    def single_round(self, client, book_ids):
+        loan_ids = [client.post('/api/loans/create/', {'book_id': book_id, 'due_date': date.today()}).data['id']
+                    for book_id in book_ids]
+        for loan_id in loan_ids:
+            client.post(f'/api/loans/{loan_id}/return/')
+
+    def batch_round(self, client, book_ids):
+        response = client.post('/api/loans/batch/checkout/', {'book_ids': book_ids}, format='json')
+        loan_ids = [result['loan_id'] for result in response.data['results'] if result['ok']]
+        client.post('/api/loans/batch/return/', {'loan_ids': loan_ids}, format='json')
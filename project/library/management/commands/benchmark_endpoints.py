@@ -0,0 +1,102 @@
+import json
+import platform
+import uuid
+from datetime import date
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts.models import User
+from library import benchmarks
+from library.models import Book, Loan
+from library.synthetic import isbn13
+
+# Volumes générés pour --scale 1
+BASE_VOLUMES = {'books': 100000, 'users': 10000, 'loans': 1000000, 'reviews': 200000, 'reservations': 20000}
+
+
+class Command(BaseCommand):
+    help = ("Mesure latence p50/p95, requêtes SQL et taille de réponse des principaux endpoints, "
+            "et échoue si un budget est dépassé")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=sorted(benchmarks.SCENARIOS),
+                            help="Limite la mesure à ce scénario (répétable)")
+        parser.add_argument('--scale', type=float, default=None,
+                            help="Génère d'abord un jeu de données synthétique (1 : 100 000 livres, 1 million d'emprunts)")
+        parser.add_argument('--output', default=None, help="Fichier JSON où écrire les résultats")
+        parser.add_argument('--compare', default=None, help="Résultats JSON d'une exécution précédente")
+        parser.add_argument('--budgets', default=str(benchmarks.BUDGETS_PATH))
+        parser.add_argument('--record-budgets', action='store_true',
+                            help="Enregistre les mesures, avec marge, comme nouveaux budgets")
+
+    def handle(self, *args, **options):
+        if options['scale']:
+            self.generate(options['scale'])
+        reader_id = benchmarks.busiest_reader()
+        if reader_id is None:
+            raise CommandError('Aucun emprunt en base : lancez generate_data ou passez --scale.')
+
+        tag = uuid.uuid4().hex[:8]
+        admin = User.objects.create_user(
+            email=f'bench-{tag}@library.invalid', username=f'bench-{tag}',
+            first_name='Bench', last_name='Endpoints', role='admin',
+        )
+        try:
+            results = benchmarks.run_benchmarks(
+                {'user': User.objects.get(pk=reader_id), 'admin': admin},
+                options['iterations'], options['scenarios'],
+            )
+        finally:
+            admin.delete()
+
+        previous = json.loads(Path(options['compare']).read_text())['results'] if options['compare'] else {}
+        self.report(results, previous)
+        if options['output']:
+            Path(options['output']).write_text(json.dumps({
+                'date': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'iterations': options['iterations'],
+                'books': Book.objects.count(),
+                'loans': Loan.objects.count(),
+                'results': results,
+            }, indent=2) + '\n')
+
+        if options['record_budgets']:
+            benchmarks.record_budgets(results, options['budgets'])
+            self.stdout.write(self.style.SUCCESS(f"Budgets enregistrés dans {options['budgets']}"))
+            return
+        failures = benchmarks.check_budgets(results, benchmarks.load_budgets(options['budgets']))
+        if failures:
+            raise CommandError('Budgets dépassés :\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Tous les budgets sont respectés'))
+
+    def generate(self, scale):
+        if Book.objects.filter(isbn=isbn13(0)).exists():
+            self.stdout.write('Données synthétiques déjà présentes, génération ignorée')
+            return
+        volumes = {key: max(int(value * scale), 1) for key, value in BASE_VOLUMES.items()}
+        # Date fixe : d'une exécution à l'autre, les mêmes données
+        call_command('generate_data', today=date(2025, 1, 1), stdout=self.stdout, **volumes)
+
+    def report(self, results, previous):
+        self.stdout.write(f"{'Scénario':24} {'p50 ms':>9} {'p95 ms':>9} {'SQL':>5} {'octets':>9}")
+        for name, result in results.items():
+            line = (f"{name:24} {result['p50_ms']:9.1f} {result['p95_ms']:9.1f} "
+                    f"{result['queries']:5d} {result['bytes']:9d}")
+            before = previous.get(name)
+            if before:
+                line += '   ' + '  '.join(
+                    f'{metric} {self.delta(before[metric], result[metric])}'
+                    for metric in ('p95_ms', 'queries', 'bytes')
+                )
+            self.stdout.write(line)
+
+    @staticmethod
+    def delta(before, after):
+        if not before:
+            return f'{after:+}'
+        return f'{(after - before) / before * 100:+.0f}%'
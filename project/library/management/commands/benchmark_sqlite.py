@@ -0,0 +1,122 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from library.sqlite import DEFAULT_PRAGMAS, apply_pragmas
+
+TUNED_PRAGMAS = {
+    'busy_timeout': 5000, 'journal_mode': 'wal', 'synchronous': 'normal',
+    'mmap_size': 268435456, 'cache_size': -65536, 'temp_store': 'memory',
+}
+
+READ_SQL = 'SELECT id, title, isbn, status, available_quantity FROM library_book ORDER BY id LIMIT 20 OFFSET ?'
+COUNT_SQL = "SELECT COUNT(*) FROM library_loan WHERE user_id = ? AND status IN ('active', 'overdue')"
+CHECKOUT_SQL = ('UPDATE library_book SET available_quantity = available_quantity - 1, updated_at = ? '
+                'WHERE id = ? AND available_quantity > 0')
+RETURN_SQL = ('UPDATE library_book SET available_quantity = available_quantity + 1, updated_at = ? '
+              'WHERE id = ? AND available_quantity < quantity')
+
+
+class Command(BaseCommand):
+    help = ("Compare le débit lectures/écritures concurrentes avec les réglages SQLite par défaut "
+            "et avec LIBRARY_SQLITE_PRAGMAS, sur deux copies de la base")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Ce benchmark ne concerne que SQLite.')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*), MIN(id), MAX(id) FROM library_book')
+            books, first_id, last_id = cursor.fetchone()
+            cursor.execute('SELECT MIN(id), MAX(id) FROM auth_user')
+            users = cursor.fetchone()
+        if not books:
+            raise CommandError('Catalogue vide : lancez generate_data avant le benchmark.')
+        self.bounds = {'books': books, 'book_ids': (first_id, last_id), 'user_ids': users}
+
+        profiles = (('Par défaut', DEFAULT_PRAGMAS), ('Optimisé', settings.LIBRARY_SQLITE_PRAGMAS or TUNED_PRAGMAS))
+        results = []
+        with tempfile.TemporaryDirectory() as directory:
+            for label, pragmas in profiles:
+                path = os.path.join(directory, f'{len(results)}.sqlite3')
+                self.copy_database(path)
+                results.append(self.run(path, pragmas, options))
+                reads, writes, locked = results[-1]
+                self.stdout.write(
+                    f'{label:12} {reads:10.0f} lectures/s {writes:10.0f} écritures/s {locked:6d} « database is locked »'
+                )
+        (base_reads, base_writes, _), (reads, writes, _) = results
+        self.stdout.write(self.style.SUCCESS(
+            f'Gain : lectures x{reads / max(base_reads, 1):.1f}, écritures x{writes / max(base_writes, 1):.1f}'
+        ))
+
+    def copy_database(self, path):
+        connection.ensure_connection()
+        target = sqlite3.connect(path)
+        connection.connection.backup(target)
+        target.close()
+
+    def run(self, path, pragmas, options):
+        # Le mode de journal s'écrit dans le fichier : on le fixe avant de lancer les threads
+        setup = sqlite3.connect(path)
+        apply_pragmas(setup.cursor(), pragmas)
+        setup.close()
+
+        deadline = time.perf_counter() + options['seconds']
+        counts = {'reads': 0, 'writes': 0, 'locked': 0}
+        lock = threading.Lock()
+
+        def worker(seed, write):
+            rng = random.Random(seed)
+            db = sqlite3.connect(path, timeout=0, isolation_level=None, check_same_thread=False)
+            apply_pragmas(db.cursor(), {name: value for name, value in pragmas.items() if name != 'journal_mode'})
+            done = locked = 0
+            while time.perf_counter() < deadline:
+                try:
+                    if write:
+                        self.write_once(db, rng)
+                    else:
+                        self.read_once(db, rng)
+                    done += 1
+                except sqlite3.OperationalError:
+                    locked += 1
+                    if db.in_transaction:
+                        db.execute('ROLLBACK')
+            db.close()
+            with lock:
+                counts['writes' if write else 'reads'] += done
+                counts['locked'] += locked
+
+        threads = [threading.Thread(target=worker, args=(index, False)) for index in range(options['readers'])]
+        threads += [threading.Thread(target=worker, args=(1000 + index, True)) for index in range(options['writers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return counts['reads'] / elapsed, counts['writes'] / elapsed, counts['locked']
+
+    def read_once(self, db, rng):
+        db.execute(READ_SQL, (rng.randrange(max(self.bounds['books'] - 20, 1)),)).fetchall()
+        db.execute(COUNT_SQL, (rng.randint(*self.bounds['user_ids']),)).fetchone()
+
+    def write_once(self, db, rng):
+        # Un emprunt puis un retour, chacun dans sa transaction, comme la circulation
+        book_id = rng.randint(*self.bounds['book_ids'])
+        for sql in (CHECKOUT_SQL, RETURN_SQL):
+            db.execute('BEGIN IMMEDIATE')
+            db.execute(sql, (timezone.now().isoformat(' '), book_id))
+            db.execute('COMMIT')
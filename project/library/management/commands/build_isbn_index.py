@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from library.isbn import backfill_isbn13
+
+
+class Command(BaseCommand):
+    help = "Renseigne la forme canonique ISBN-13 des livres (lectures de code-barres par books/isbn/<isbn>/)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        updated, invalid, duplicates = backfill_isbn13(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{updated} livre(s) mis à jour en {time.perf_counter() - started:.1f} s'
+        ))
+        if invalid:
+            self.stdout.write(self.style.WARNING(f'{invalid} ISBN invalide(s), sans forme canonique'))
+        if duplicates:
+            self.stdout.write(self.style.WARNING(
+                f'{duplicates} livre(s) en double sous une autre écriture du même ISBN, à fusionner'
+            ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from library.recommendations import refresh_similar_books
+
+
+class Command(BaseCommand):
+    help = ("Calcule les livres « aussi empruntés » à partir de l'historique des emprunts "
+            "(incrémental : seuls les emprunts depuis le dernier calcul sont pris en compte)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recalcule tous les livres")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        updated = refresh_similar_books(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{updated} livre(s) recalculé(s) en {time.perf_counter() - started:.1f} s'
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from library.popularity import decay_popularity, rebuild_popularity
+
+
+class Command(BaseCommand):
+    help = "Fait décroître la popularité des livres (à planifier toutes les heures)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Recalcule les popularités à partir de l'historique des emprunts")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.stdout.write(self.style.SUCCESS(f'{rebuild_popularity()} livre(s) populaire(s) recalculé(s)'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'{decay_popularity()} score(s) de popularité mis à jour'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from library.circulation import expire_reservations
+
+
+class Command(BaseCommand):
+    help = "Expire les réservations échues et redistribue les exemplaires non retirés (à planifier)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        expired = expire_reservations(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'{expired} réservation(s) expirée(s)'))
@@ -0,0 +1,25 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from library.exporter import DATASETS, FORMATS, export
+
+
+class Command(BaseCommand):
+    help = "Exporte le catalogue ou l'historique des emprunts en CSV ou NDJSON, en flux"
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS))
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--output', help="Fichier de sortie (sortie standard par défaut)")
+        parser.add_argument('--since', type=date.fromisoformat, help="Lignes modifiées depuis (AAAA-MM-JJ)")
+        parser.add_argument('--chunk-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        lines = export(options['dataset'], options['format'], since=options['since'], chunk_size=options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as stream:
+                stream.writelines(lines)
+        else:
+            sys.stdout.writelines(lines)
@@ -0,0 +1,239 @@
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, time as day_time, timezone as dt_timezone
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.lookups import GreaterThan
+
+from accounts.models import User
+from library import synthetic
+from library.circulation import OPEN_LOAN_STATUSES, sweep_overdue
+from library.facets import rebuild_facet_index
+from library.models import Author, Book, Category, Loan, Publisher, Reservation, Review
+from library.popularity import rebuild_popularity
+from library.ratings import rebuild_rating_aggregates
+from library.search import get_search_backend
+from library.stats import invalidate_dashboard
+
+
+@contextmanager
+def historical_dates(*fields):
+    """Laisse bulk_create écrire les dates générées au lieu de la date du jour."""
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = "Génère un jeu de données synthétique reproductible, à l'échelle voulue, pour les tests de charge"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--authors', type=int, default=None, help="Par défaut : un auteur pour 4 livres")
+        parser.add_argument('--publishers', type=int, default=200)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--loans', type=int, default=100000)
+        parser.add_argument('--reviews', type=int, default=20000)
+        parser.add_argument('--reservations', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=730, help="Profondeur de l'historique d'emprunts")
+        parser.add_argument('--today', type=date.fromisoformat, default=None,
+                            help="Date de référence (AAAA-MM-JJ), à fixer pour un résultat identique d'un jour à l'autre")
+        parser.add_argument('--password', default='password', help="Mot de passe commun, haché une seule fois")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=None, help="Processus de génération (0 : aucun)")
+
+    def handle(self, *args, **options):
+        self.seed = options['seed']
+        self.batch_size = options['batch_size']
+        self.today = options['today'] or date.today()
+        if Book.objects.filter(isbn=synthetic.isbn13(0)).exists():
+            raise CommandError('Des données synthétiques sont déjà présentes dans cette base.')
+
+        counts = {key: options[key] for key in ('books', 'publishers', 'users', 'loans', 'reviews', 'reservations')}
+        counts['authors'] = options['authors'] or max(counts['books'] // 4, 1)
+
+        # Les processus de génération n'utilisent pas la base : on ne leur lègue aucune connexion
+        connections.close_all()
+        workers = options['workers']
+        self.pool = ProcessPoolExecutor(max_workers=workers) if workers != 0 else None
+        self.workers = workers or 4
+        started = time.perf_counter()
+        try:
+            publishers = self.create_publishers(counts['publishers'])
+            categories = self.create_categories()
+            authors = self.create_authors(counts['authors'])
+            users = self.create_users(counts['users'], make_password(options['password']))
+            books = self.create_books(counts['books'], authors, publishers, categories)
+            self.create_loans(counts['loans'], books, users, options['days'])
+            self.create_reviews(counts['reviews'], books, users)
+            self.create_reservations(counts['reservations'], books, users, options['days'])
+        finally:
+            if self.pool:
+                self.pool.shutdown()
+
+        self.finalize(books)
+        self.stdout.write(self.style.SUCCESS(f'Données générées en {time.perf_counter() - started:.1f} s'))
+
+    # Génération parallèle
+
+    def chunks(self, total):
+        for chunk, start in enumerate(range(0, total, self.batch_size)):
+            yield chunk, start, min(self.batch_size, total - start)
+
+    def generate(self, function, specs):
+        """Résultats de `function` dans l'ordre des specs, avec un nombre borné de tranches en vol."""
+        specs = iter(specs)
+        if self.pool is None:
+            yield from map(function, specs)
+            return
+        pending = deque(self.pool.submit(function, spec) for spec in islice(specs, self.workers * 2))
+        while pending:
+            rows = pending.popleft().result()
+            for spec in islice(specs, 1):
+                pending.append(self.pool.submit(function, spec))
+            yield rows
+
+    def report(self, label, count):
+        self.stdout.write(f'{label} : {count}')
+
+    # Tables
+
+    def create_publishers(self, total):
+        created = Publisher.objects.bulk_create([
+            Publisher(name=f'Éditions {synthetic.LAST_NAMES[index % len(synthetic.LAST_NAMES)]} {index}')
+            for index in range(total)
+        ], batch_size=self.batch_size)
+        self.report('Éditeurs', total)
+        return array('q', (publisher.pk for publisher in created))
+
+    def create_categories(self):
+        names = synthetic.CATEGORY_NAMES
+        Category.objects.bulk_create([Category(name=name) for name in names], ignore_conflicts=True)
+        ids = dict(Category.objects.filter(name__in=names).values_list('name', 'id'))
+        return array('q', (ids[name] for name in names))
+
+    def create_authors(self, total):
+        ids = array('q')
+        specs = ((self.seed, chunk, start, count) for chunk, start, count in self.chunks(total))
+        for rows in self.generate(synthetic.author_rows, specs):
+            created = Author.objects.bulk_create([
+                Author(first_name=first_name, last_name=last_name, birth_date=birth_date)
+                for first_name, last_name, birth_date in rows
+            ])
+            ids.extend(author.pk for author in created)
+        self.report('Auteurs', len(ids))
+        return ids
+
+    def create_users(self, total, password):
+        ids = array('q')
+        specs = ((self.seed, chunk, start, count) for chunk, start, count in self.chunks(total))
+        for rows in self.generate(synthetic.user_rows, specs):
+            created = User.objects.bulk_create([
+                User(email=email, username=username, first_name=first_name, last_name=last_name, password=password)
+                for email, username, first_name, last_name in rows
+            ])
+            ids.extend(user.pk for user in created)
+        self.report('Lecteurs', len(ids))
+        return ids
+
+    def create_books(self, total, authors, publishers, categories):
+        ids = array('q')
+        specs = (
+            (self.seed, chunk, start, count, len(authors), len(publishers), len(categories))
+            for chunk, start, count in self.chunks(total)
+        )
+        for rows in self.generate(synthetic.book_rows, specs):
+            with transaction.atomic():
+                created = Book.objects.bulk_create([
+                    Book(isbn=isbn, isbn13=isbn, title=title, description=description, publish_date=publish_date, pages=pages,
+                         language=language, quantity=quantity, available_quantity=quantity,
+                         publisher_id=publishers[publisher])
+                    for isbn, title, description, publish_date, pages, language, quantity, publisher, _, _ in rows
+                ])
+                Book.authors.through.objects.bulk_create([
+                    Book.authors.through(book_id=book.pk, author_id=authors[author])
+                    for book, row in zip(created, rows) for author in row[8]
+                ])
+                Book.categories.through.objects.bulk_create([
+                    Book.categories.through(book_id=book.pk, category_id=categories[category])
+                    for book, row in zip(created, rows) for category in row[9]
+                ])
+            ids.extend(book.pk for book in created)
+        self.report('Livres', len(ids))
+        return ids
+
+    def create_loans(self, total, books, users, days):
+        created = 0
+        specs = (
+            (self.seed, chunk, count, len(books), len(users), days, self.today)
+            for chunk, _, count in self.chunks(total)
+        )
+        with historical_dates(Loan._meta.get_field('borrow_date')):
+            for rows in self.generate(synthetic.loan_rows, specs):
+                Loan.objects.bulk_create([
+                    Loan(book_id=books[book], user_id=users[user], borrow_date=borrow_date, due_date=due_date,
+                         return_date=return_date, status=status)
+                    for book, user, borrow_date, due_date, return_date, status in rows
+                ])
+                created += len(rows)
+        self.report('Emprunts', created)
+
+    def create_reviews(self, total, books, users):
+        specs = ((self.seed, chunk, count, len(books), len(users)) for chunk, _, count in self.chunks(total))
+        for rows in self.generate(synthetic.review_rows, specs):
+            # Un même lecteur peut être tiré deux fois pour un livre dans deux tranches
+            Review.objects.bulk_create([
+                Review(book_id=books[book], user_id=users[user], rating=rating, comment=comment)
+                for book, user, rating, comment in rows
+            ], ignore_conflicts=True)
+        self.report('Avis', Review.objects.filter(book_id__gte=books[0], book_id__lte=books[-1]).count())
+
+    def create_reservations(self, total, books, users, days):
+        now = datetime.combine(self.today, day_time(12), tzinfo=dt_timezone.utc)
+        specs = (
+            (self.seed, chunk, count, len(books), len(users), days, now)
+            for chunk, _, count in self.chunks(total)
+        )
+        with historical_dates(Reservation._meta.get_field('reservation_date')):
+            for rows in self.generate(synthetic.reservation_rows, specs):
+                Reservation.objects.bulk_create([
+                    Reservation(book_id=books[book], user_id=users[user], reservation_date=reserved,
+                                expiry_date=expiry, status=status)
+                    for book, user, reserved, expiry, status in rows
+                ], ignore_conflicts=True)
+        self.report('Réservations', Reservation.objects.filter(book_id__gte=books[0], book_id__lte=books[-1]).count())
+
+    def finalize(self, books):
+        """Rend les données dérivées cohérentes : stock, agrégats, retards, index."""
+        if books:
+            open_loans = Coalesce(Subquery(
+                Loan.objects.filter(book=OuterRef('pk'), status__in=OPEN_LOAN_STATUSES)
+                .order_by().values('book').annotate(count=Count('id')).values('count')
+            ), 0)
+            synthetic_books = Book.objects.filter(id__gte=books[0], id__lte=books[-1])
+            synthetic_books.update(quantity=Greatest(F('quantity'), open_loans))
+            synthetic_books.update(
+                available_quantity=F('quantity') - open_loans,
+                status=Case(When(GreaterThan(F('quantity'), open_loans), then=Value('available')),
+                            default=Value('borrowed')),
+            )
+        self.report('Agrégats des avis', rebuild_rating_aggregates())
+        self.report('Emprunts en retard', sweep_overdue(today=self.today))
+        self.report('Livres populaires', rebuild_popularity(today=self.today))
+        self.report('Livres indexés', get_search_backend().rebuild() or 0)
+        self.report('Compteurs de facettes', rebuild_facet_index())
+        invalidate_dashboard()
@@ -0,0 +1,36 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from library.thumbnails import IMAGE_FIELDS, render_thumbnails, setup_worker, thumbnail_job, thumbnails_generated
+
+
+class Command(BaseCommand):
+    help = "Génère en parallèle les miniatures manquantes des couvertures, photos d'auteurs et avatars"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None)
+        parser.add_argument('--force', action='store_true', help="Régénère aussi les miniatures existantes")
+
+    def handle(self, *args, **options):
+        jobs = []
+        for model, field in IMAGE_FIELDS.items():
+            names = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).values_list(field, flat=True)
+            for name in names.distinct().iterator():
+                job = thumbnail_job(name, force=options['force'])
+                if job is not None:
+                    jobs.append(job)
+
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=setup_worker) as executor:
+            futures = {executor.submit(render_thumbnails, *job): job[0] for job in jobs}
+            for future in as_completed(futures):
+                if future.exception() is None:
+                    done += 1
+                else:
+                    failed += 1
+                    self.stderr.write(f'{futures[future]} : {future.exception()}')
+        if done:
+            thumbnails_generated()
+
+        self.stdout.write(self.style.SUCCESS(f'{done} image(s) traitée(s), {failed} échec(s)'))
@@ -0,0 +1,38 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.importer import READERS, CatalogImportError, import_catalog
+
+EXTENSIONS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.mrc': 'marc', '.marc': 'marc'}
+
+
+class Command(BaseCommand):
+    help = "Importe un catalogue fournisseur (CSV, JSON Lines ou MARC 21) en mettant à jour par ISBN"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(READERS), help="Déduit de l'extension par défaut")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        if fmt is None:
+            raise CommandError('Format inconnu, précisez --format')
+
+        if fmt == 'marc':
+            stream = open(path, 'rb')
+        else:
+            stream = open(path, encoding='utf-8-sig', newline='')
+        with stream:
+            try:
+                stats = import_catalog(READERS[fmt](stream), batch_size=options['batch_size'], progress=self.report)
+            except CatalogImportError as exc:
+                raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['created']} livre(s) créé(s), {stats['updated']} mis à jour, {stats['skipped']} ignoré(s)"
+        ))
+
+    def report(self, stats):
+        self.stdout.write(f"{stats['read']} lus, {stats['created']} créés, {stats['updated']} mis à jour")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from library.sqlite import optimize
+
+
+class Command(BaseCommand):
+    help = "Lance PRAGMA optimize et un checkpoint du journal WAL (à planifier toutes les heures)"
+
+    def handle(self, *args, **options):
+        for alias, pages in optimize().items():
+            self.stdout.write(self.style.SUCCESS(f'{alias} : statistiques à jour, {max(pages, 0)} page(s) du WAL recopiée(s)'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from library.ratings import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = "Recalcule en masse la note moyenne, le nombre d'avis et l'histogramme des livres"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = rebuild_rating_aggregates(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{updated} livre(s) mis à jour'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from library.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index plein texte du catalogue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.ensure_index()
+        total = backend.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{total or 0} livre(s) indexé(s)'))
@@ -0,0 +1,39 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = ("Recopie la base SQLite principale dans les fichiers des répliques "
+            "(réplication de substitution pour le développement)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Recopie toutes les N secondes au lieu d'une seule fois")
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('La réplication de substitution ne concerne que SQLite.')
+        if not settings.LIBRARY_READ_REPLICAS:
+            raise CommandError('Aucune réplique configurée (LIBRARY_REPLICA_DATABASES).')
+        while True:
+            started = time.perf_counter()
+            self.replicate()
+            self.stdout.write(f'Répliques à jour en {time.perf_counter() - started:.2f} s')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def replicate(self):
+        source = connections['default']
+        source.ensure_connection()
+        for alias in settings.LIBRARY_READ_REPLICAS:
+            # L'API de sauvegarde copie une image cohérente, même pendant des écritures
+            target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                source.connection.backup(target)
+            finally:
+                target.close()
@@ -0,0 +1,92 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from accounts.models import User
+from library.circulation import BookUnavailable, CirculationError, checkout, return_loan
+from library.models import Book, Loan
+
+
+class Command(BaseCommand):
+    help = ("Lance des emprunts et retours concurrents sur un livre temporaire "
+            "et vérifie qu'aucun exemplaire n'est prêté deux fois")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--copies', type=int, default=25)
+        parser.add_argument('--attempts', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=64)
+
+    def handle(self, *args, **options):
+        copies, attempts, workers = options['copies'], options['attempts'], options['workers']
+        tag = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(
+            email=f'stress-{tag}@library.invalid', username=f'stress-{tag}',
+            first_name='Stress', last_name='Test', role='admin',
+        )
+        book = Book.objects.create(
+            title=f'Stress test {tag}', isbn=f'stress-{tag}', description='Livre temporaire',
+            publish_date=date.today(), pages=1, quantity=copies, available_quantity=copies,
+        )
+        try:
+            self.run(book, user, copies, attempts, workers)
+        finally:
+            book.delete()
+            user.delete()
+
+    def run(self, book, user, copies, attempts, workers):
+        def attempt_checkout(_):
+            try:
+                checkout(book.id, user)
+                return 'ok'
+            except BookUnavailable:
+                return 'unavailable'
+            except OperationalError:
+                return 'error'
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(attempt_checkout, range(attempts)))
+        elapsed = time.perf_counter() - started
+
+        book.refresh_from_db()
+        loans = Loan.objects.filter(book=book).count()
+        self.stdout.write(
+            f"{attempts} emprunts concurrents ({workers} threads) en {elapsed:.2f}s : "
+            f"{outcomes.count('ok')} réussis, {outcomes.count('unavailable')} refusés, "
+            f"{outcomes.count('error')} erreurs de base"
+        )
+        if loans > copies or outcomes.count('ok') != loans or book.available_quantity != copies - loans:
+            raise CommandError(
+                f'Survente détectée : {loans} emprunts pour {copies} exemplaires, '
+                f'{book.available_quantity} exemplaire(s) restant(s)'
+            )
+
+        def attempt_return(loan_id):
+            try:
+                return_loan(loan_id, user)
+                return 'ok'
+            except CirculationError:
+                return 'refused'
+            except OperationalError:
+                return 'error'
+            finally:
+                connection.close()
+
+        # Chaque retour est soumis deux fois : le second doit être refusé
+        loan_ids = list(Loan.objects.filter(book=book).values_list('id', flat=True)) * 2
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(attempt_return, loan_ids))
+
+        book.refresh_from_db()
+        if book.available_quantity != copies - loans + Loan.objects.filter(book=book, status='returned').count():
+            raise CommandError(f'Stock incohérent après les retours : {book.available_quantity}/{copies}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Aucune survente : {loans} exemplaire(s) prêté(s) puis rendu(s), stock final {book.available_quantity}/{copies}'
+        ))
+
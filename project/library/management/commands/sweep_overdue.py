@@ -0,0 +1,17 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from library.circulation import sweep_overdue
+
+
+class Command(BaseCommand):
+    help = "Passe en retard les emprunts échus et calcule leurs amendes (à planifier quotidiennement)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--date', type=date.fromisoformat, default=None, help="Date de référence (AAAA-MM-JJ)")
+
+    def handle(self, *args, **options):
+        updated = sweep_overdue(today=options['date'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'{updated} emprunt(s) mis à jour'))
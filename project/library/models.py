@@ -1,8 +1,11 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from datetime import date, timedelta
 
+from .isbn import canonical_isbn
+
 User = get_user_model()
 
 class Author(models.Model):
@@ -87,6 +90,10 @@ class Book(models.Model):
     title = models.CharField(max_length=300, verbose_name="Titre")
     subtitle = models.CharField(max_length=300, blank=True, verbose_name="Sous-titre")
     isbn = models.CharField(max_length=17, unique=True, verbose_name="ISBN")
+    # Forme canonique (ISBN-13 sans tirets) pour les lectures de code-barres ;
+    # vide si l'ISBN saisi n'est pas valide
+    isbn13 = models.CharField(max_length=13, unique=True, null=True, blank=True, editable=False,
+                              verbose_name="ISBN-13")
     description = models.TextField(verbose_name="Description")
     publish_date = models.DateField(verbose_name="Date de publication")
     pages = models.PositiveIntegerField(validators=[MinValueValidator(1)], verbose_name="Nombre de pages")
@@ -103,6 +110,18 @@ class Book(models.Model):
     # Relations Foreign Key
     publisher = models.ForeignKey(Publisher, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Éditeur")
     
+    # Agrégats des avis, maintenus par library.ratings
+    average_rating = models.FloatField(default=0, verbose_name="Note moyenne")
+    review_count = models.PositiveIntegerField(default=0, verbose_name="Nombre d'avis")
+    rating_1_count = models.PositiveIntegerField(default=0, verbose_name="Avis à 1 étoile")
+    rating_2_count = models.PositiveIntegerField(default=0, verbose_name="Avis à 2 étoiles")
+    rating_3_count = models.PositiveIntegerField(default=0, verbose_name="Avis à 3 étoiles")
+    rating_4_count = models.PositiveIntegerField(default=0, verbose_name="Avis à 4 étoiles")
+    rating_5_count = models.PositiveIntegerField(default=0, verbose_name="Avis à 5 étoiles")
+    
+    # Emprunts pondérés par leur ancienneté, maintenus par library.popularity
+    popularity = models.FloatField(default=0, verbose_name="Popularité")
+    
     # Métadonnées
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -115,14 +134,55 @@ class Book(models.Model):
         ordering = ['title']
         indexes = [
             models.Index(fields=['title']),
+            models.Index(fields=['title', 'id']),
             models.Index(fields=['isbn']),
             models.Index(fields=['status']),
+            models.Index(fields=['language']),
             models.Index(fields=['publish_date']),
+            models.Index(fields=['average_rating']),
+            models.Index(fields=['review_count']),
+            models.Index(fields=['popularity']),
+            # Fraîcheur de l'index de facettes : un livre modifié depuis sa reconstruction ?
+            models.Index(fields=['updated_at']),
         ]
     
     def __str__(self):
         return self.title
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_isbn = instance.__dict__.get('isbn')
+        return instance
+    
+    def isbn_changed(self):
+        # Un ISBN différé et jamais lu n'a pas pu changer
+        return self._state.adding or ('isbn' in self.__dict__ and self.isbn != getattr(self, '_loaded_isbn', None))
+    
+    def validate_unique(self, exclude=None):
+        super().validate_unique(exclude)
+        if (exclude and 'isbn' in exclude) or not self.isbn_changed():
+            return
+        # Unicité quelle que soit l'écriture (tirets, ISBN-10), comme le sérialiseur
+        isbn13 = canonical_isbn(self.isbn)
+        if isbn13 and Book.objects.filter(isbn13=isbn13).exclude(pk=self.pk).exists():
+            raise ValidationError({'isbn': "Un livre avec cet ISBN existe déjà."})
+    
+    def save(self, *args, **kwargs):
+        # Forme canonique recalculée seulement si l'ISBN change : un doublon que
+        # backfill_isbn13 a laissé sans forme canonique reste enregistrable
+        if self.isbn_changed():
+            self.isbn13 = canonical_isbn(self.isbn)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'isbn' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'isbn13'}
+        super().save(*args, **kwargs)
+        self._loaded_isbn = self.__dict__.get('isbn')
+    
+    @property
+    def rating_histogram(self):
+        return {str(rating): getattr(self, f'rating_{rating}_count') for rating in range(1, 6)}
+    
     @property
     def is_available(self):
         return self.status == 'available' and self.available_quantity > 0
@@ -143,6 +203,8 @@ class Loan(models.Model):
         ('lost', 'Perdu'),
     ]
     
+    LOAN_PERIOD = timedelta(days=30)
+    
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='loans', verbose_name="Livre")
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='loans', verbose_name="Utilisateur")
     borrow_date = models.DateField(auto_now_add=True, verbose_name="Date d'emprunt")
@@ -164,6 +226,11 @@ class Loan(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['due_date']),
             models.Index(fields=['borrow_date']),
+            # Pagination par curseur : (-borrow_date, id), globale et par utilisateur
+            models.Index(fields=['-borrow_date', 'id']),
+            models.Index(fields=['user', '-borrow_date', 'id']),
+            # Passe des retards : emprunts ouverts par date d'échéance
+            models.Index(fields=['status', 'due_date']),
         ]
     
     def __str__(self):
@@ -181,7 +248,7 @@ class Loan(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.due_date:
-            self.due_date = date.today() + timedelta(days=30)
+            self.due_date = date.today() + self.LOAN_PERIOD
         
         # Mettre à jour le statut si en retard
         if self.status == 'active' and self.due_date < date.today():
@@ -192,15 +259,21 @@ class Loan(models.Model):
 class Reservation(models.Model):
     STATUS_CHOICES = [
         ('active', 'Active'),
+        ('ready', 'Disponible au retrait'),
         ('fulfilled', 'Satisfaite'),
         ('cancelled', 'Annulée'),
         ('expired', 'Expirée'),
     ]
     
+    # En file d'attente ou exemplaire mis de côté
+    OPEN_STATUSES = ('active', 'ready')
+    HOLD_PERIOD = timedelta(days=3)
+    
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reservations', verbose_name="Livre")
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reservations', verbose_name="Utilisateur")
     reservation_date = models.DateTimeField(auto_now_add=True, verbose_name="Date de réservation")
-    expiry_date = models.DateTimeField(verbose_name="Date d'expiration")
+    # Fin de la mise de côté : vide tant que la réservation attend un exemplaire
+    expiry_date = models.DateTimeField(blank=True, null=True, verbose_name="Date d'expiration")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active', verbose_name="Statut")
     notified = models.BooleanField(default=False, verbose_name="Utilisateur notifié")
     
@@ -209,7 +282,18 @@ class Reservation(models.Model):
         verbose_name = 'Réservation'
         verbose_name_plural = 'Réservations'
         ordering = ['reservation_date']
-        unique_together = ['book', 'user', 'status']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['book', 'user'], condition=models.Q(status__in=['active', 'ready']),
+                name='unique_open_reservation',
+            ),
+        ]
+        indexes = [
+            # File d'attente FIFO par livre et rang d'une réservation
+            models.Index(fields=['book', 'status', 'reservation_date', 'id']),
+            # Passe des réservations expirées
+            models.Index(fields=['status', 'expiry_date']),
+        ]
     
     def __str__(self):
         return f"{self.book.title} - {self.user.full_name}"
@@ -217,7 +301,7 @@ class Reservation(models.Model):
     @property
     def is_expired(self):
         from django.utils import timezone
-        return timezone.now() > self.expiry_date
+        return self.expiry_date is not None and timezone.now() > self.expiry_date
 
 class Review(models.Model):
     RATING_CHOICES = [(i, i) for i in range(1, 6)]
@@ -235,6 +319,93 @@ class Review(models.Model):
         verbose_name_plural = 'Avis'
         ordering = ['-created_at']
         unique_together = ['book', 'user']
+        indexes = [
+            models.Index(fields=['-created_at', 'id']),
+            models.Index(fields=['book', '-created_at', 'id']),
+        ]
     
     def __str__(self):
-        return f"{self.book.title} - {self.user.full_name} ({self.rating}/5)"
\ No newline at end of file
+        return f"{self.book.title} - {self.user.full_name} ({self.rating}/5)"
+
+
+class SimilarBook(models.Model):
+    """Livres souvent empruntés par les mêmes lecteurs, précalculés par `build_similar_books`."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='similar_entries', verbose_name="Livre")
+    similar = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+', verbose_name="Livre similaire")
+    rank = models.PositiveSmallIntegerField(verbose_name="Rang")
+    score = models.FloatField(verbose_name="Score")
+    # Lecteurs communs aux deux livres, repris par le calcul incrémental
+    co_readers = models.PositiveIntegerField(default=0, verbose_name="Lecteurs communs")
+    
+    class Meta:
+        db_table = 'library_similar_book'
+        verbose_name = 'Livre similaire'
+        verbose_name_plural = 'Livres similaires'
+        constraints = [
+            # Sert aussi d'index à la lecture : une seule plage (book, rank)
+            models.UniqueConstraint(fields=['book', 'rank'], name='unique_similar_book_rank'),
+        ]
+    
+    def __str__(self):
+        return f"{self.book_id} -> {self.similar_id} ({self.score:.3f})"
+
+class RecommendationRun(models.Model):
+    """Passe de calcul des livres similaires ; la dernière fixe le point de reprise."""
+    last_loan_id = models.BigIntegerField(verbose_name="Dernier emprunt traité")
+    books_updated = models.PositiveIntegerField(default=0, verbose_name="Livres mis à jour")
+    full = models.BooleanField(default=False, verbose_name="Recalcul complet")
+    finished_at = models.DateTimeField(auto_now_add=True, verbose_name="Terminée le")
+    
+    class Meta:
+        db_table = 'library_recommendation_run'
+        verbose_name = 'Calcul de recommandations'
+        verbose_name_plural = 'Calculs de recommandations'
+        ordering = ['-id']
+
+class BookReaderCount(models.Model):
+    """Lecteurs distincts d'un livre (norme de la similarité), tenu à jour par `build_similar_books`."""
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='+', verbose_name="Livre")
+    readers = models.PositiveIntegerField(verbose_name="Lecteurs distincts")
+    
+    class Meta:
+        db_table = 'library_book_reader_count'
+        verbose_name = "Lecteurs d'un livre"
+        verbose_name_plural = 'Lecteurs des livres'
+
+class PopularityDecay(models.Model):
+    """Passe de décroissance des popularités ; la dernière date les scores stockés."""
+    decayed_at = models.DateTimeField(verbose_name="Effectuée le")
+    
+    class Meta:
+        db_table = 'library_popularity_decay'
+        verbose_name = 'Décroissance des popularités'
+        verbose_name_plural = 'Décroissances des popularités'
+        ordering = ['-id']
+
+class BookFacetCount(models.Model):
+    """Nombre de livres par combinaison de facettes, recalculé par `build_facet_index`.
+
+    Les lignes sans catégorie comptent chaque livre une fois ; les lignes avec
+    catégorie comptent chaque couple (livre, catégorie).
+    """
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, related_name='+', verbose_name="Catégorie")
+    language = models.CharField(max_length=10, verbose_name="Langue")
+    status = models.CharField(max_length=20, verbose_name="Statut")
+    publisher = models.ForeignKey(Publisher, on_delete=models.CASCADE, null=True, related_name='+', verbose_name="Éditeur")
+    decade = models.SmallIntegerField(null=True, verbose_name="Décennie")
+    books = models.PositiveIntegerField(verbose_name="Livres")
+    
+    class Meta:
+        db_table = 'library_book_facet_count'
+        verbose_name = 'Compteur de facettes'
+        verbose_name_plural = 'Compteurs de facettes'
+
+class FacetIndexRun(models.Model):
+    """Reconstruction de l'index de facettes ; l'index n'est utilisé que si aucun livre n'a changé depuis."""
+    started_at = models.DateTimeField(verbose_name="Commencée le")
+    
+    class Meta:
+        db_table = 'library_facet_index_run'
+        verbose_name = "Reconstruction de l'index de facettes"
+        verbose_name_plural = "Reconstructions de l'index de facettes"
+        ordering = ['-id']
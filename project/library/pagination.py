@@ -0,0 +1,174 @@
+import base64
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimate_count(queryset):
+    """Nombre approximatif de lignes, sans COUNT(*) systématique.
+
+    Sur PostgreSQL on lit l'estimation du planificateur ; ailleurs on met en
+    cache le COUNT exact pendant `LIBRARY_COUNT_CACHE_TTL` secondes.
+    """
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            return cursor.fetchone()[0][0]['Plan']['Plan Rows']
+
+    key = 'estimated-count:' + hashlib.sha1(f'{queryset.db}:{sql}:{params}'.encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, settings.LIBRARY_COUNT_CACHE_TTL)
+    return count
+
+
+class KeysetPagination(PageNumberPagination):
+    """Pagination par numéro de page, ou par curseur sur demande.
+
+    Le mode curseur (`?pagination=cursor` ou présence de `?cursor=`) impose
+    l'ordre stable `keyset_ordering` et filtre sur les valeurs de la dernière
+    ligne vue au lieu d'un OFFSET : la page N coûte autant que la page 1, et
+    aucun COUNT(*) n'est exécuté sauf si `?count=estimate` est demandé.
+    """
+    keyset_ordering = ('id',)
+    mode_query_param = 'pagination'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Curseur invalide.'
+
+    def use_keyset(self, request):
+        return (request.query_params.get(self.mode_query_param) == 'cursor'
+                or self.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.use_keyset(request)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request, queryset.model)
+
+        self.estimated_count = None
+        if request.query_params.get(self.count_query_param) == 'estimate':
+            self.estimated_count = estimate_count(queryset)
+
+        ordering = self.get_ordering(reverse)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_condition(ordering, position))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        # En remontant, la présence d'une page suivante est garantie par le curseur
+        has_next = has_more if not reverse else position is not None
+        has_previous = position is not None if not reverse else has_more
+        self.next_position = self.get_position(results[-1]) if results and has_next else None
+        self.previous_position = self.get_position(results[0]) if results and has_previous else None
+        return results
+
+    def get_ordering(self, reverse=False):
+        if not reverse:
+            return list(self.keyset_ordering)
+        return [field[1:] if field.startswith('-') else f'-{field}' for field in self.keyset_ordering]
+
+    def keyset_condition(self, ordering, position):
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y), selon le sens de chaque champ
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def get_position(self, instance):
+        return [getattr(instance, field.lstrip('-')) for field in self.keyset_ordering]
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': reverse}, default=str, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        """Position et sens du curseur, valeurs converties par les champs du modèle.
+
+        Un curseur altéré donne une 404 ici plutôt qu'une erreur au moment
+        d'exécuter la requête.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            values = payload['p']
+            if not isinstance(values, list) or len(values) != len(self.keyset_ordering):
+                raise ValueError
+            position = []
+            for field, value in zip(self.keyset_ordering, values):
+                model_field = model._meta.get_field(field.lstrip('-'))
+                value = model_field.to_python(value)
+                # Les champs du tri sont non nuls : `__gt=None` n'a pas de sens
+                if value is None:
+                    raise ValueError
+                # Entiers au-delà de 64 bits : refusés par toutes les bases au moment de la requête
+                if isinstance(value, int) and not -2 ** 63 <= value < 2 ** 63:
+                    raise ValueError
+                position.append(value)
+        except (TypeError, ValueError, OverflowError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(payload.get('r'))
+
+    def get_next_link(self):
+        if not getattr(self, 'keyset', False):
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if not getattr(self, 'keyset', False):
+            return super().get_previous_link()
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+
+        fields = [('next', self.get_next_link()), ('previous', self.get_previous_link())]
+        if self.estimated_count is not None:
+            fields.append(('estimated_count', self.estimated_count))
+        fields.append(('results', data))
+        return Response(OrderedDict(fields))
+
+
+class BookPagination(KeysetPagination):
+    keyset_ordering = ('title', 'id')
+
+
+class LoanPagination(KeysetPagination):
+    keyset_ordering = ('-borrow_date', 'id')
+
+
+class ReviewPagination(KeysetPagination):
+    keyset_ordering = ('-created_at', 'id')
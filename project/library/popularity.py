@@ -0,0 +1,91 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, Value, When
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .models import Book, Loan, PopularityDecay
+
+# Les scores stockés sont tous exprimés à l'instant de la dernière passe de
+# décroissance : un emprunt plus récent compte 2^(Δt / demi-vie). L'ordre
+# entre livres est donc exact à tout moment, et la passe périodique ne fait
+# que ramener les scores à l'instant présent pour borner leur croissance.
+# Chaque écriture avance `updated_at` : le tri par popularité fait partie de
+# la représentation validée par les ETag du catalogue.
+
+
+def _half_lives(since, until):
+    return (until - since).total_seconds() / (settings.LIBRARY_POPULARITY_HALF_LIFE_DAYS * 86400)
+
+
+def reference_time():
+    """Instant auquel les scores stockés sont exprimés, ou None avant la première passe."""
+    return PopularityDecay.objects.values_list('decayed_at', flat=True).first()
+
+
+def current_factor(reference=None):
+    """Multiplicateur qui ramène un score stocké à l'instant présent."""
+    reference = reference or reference_time()
+    return 1.0 if reference is None else 0.5 ** _half_lives(reference, timezone.now())
+
+
+def record_checkouts(book_ids):
+    """Ajoute les emprunts de `book_ids` (un identifiant par exemplaire) aux popularités.
+
+    À appeler dans la transaction de l'emprunt, après la mise à jour du stock.
+    """
+    counts = Counter(book_ids)
+    if not counts:
+        return
+    reference = reference_time()
+    weight = 1.0 if reference is None else 2 ** _half_lives(reference, timezone.now())
+    if len(counts) == 1:
+        [(book_id, count)] = counts.items()
+        Book.objects.filter(id=book_id).update(popularity=F('popularity') + weight * count, updated_at=Now())
+        return
+    Book.objects.filter(id__in=list(counts)).update(popularity=F('popularity') + Case(
+        *[When(id=book_id, then=Value(weight * count)) for book_id, count in counts.items()]
+    ), updated_at=Now())
+
+
+def decay_popularity():
+    """Ramène tous les scores à l'instant présent ; les plus faibles retombent à zéro.
+
+    Renvoie le nombre de livres mis à jour.
+    """
+    with transaction.atomic():
+        now = timezone.now()
+        reference = reference_time()
+        updated = 0
+        if reference is not None:
+            factor = 0.5 ** _half_lives(reference, now)
+            updated = Book.objects.filter(popularity__gt=0).update(popularity=Case(
+                When(popularity__lt=settings.LIBRARY_POPULARITY_FLOOR / factor, then=Value(0.0)),
+                default=F('popularity') * factor,
+            ), updated_at=Now())
+        PopularityDecay.objects.create(decayed_at=now)
+    return updated
+
+
+def rebuild_popularity(today=None, batch_size=1000):
+    """Recalcule toutes les popularités à partir de l'historique des emprunts."""
+    today = today or timezone.localdate()
+    half_life = settings.LIBRARY_POPULARITY_HALF_LIFE_DAYS
+    scores = Counter()
+    per_day = (Loan.objects.filter(borrow_date__lte=today).order_by()
+               .values_list('book_id', 'borrow_date').annotate(count=Count('id')))
+    for book_id, borrow_date, count in per_day.iterator(chunk_size=batch_size):
+        scores[book_id] += count * 0.5 ** ((today - borrow_date).days / half_life)
+    scores = {book_id: score for book_id, score in scores.items() if score >= settings.LIBRARY_POPULARITY_FLOOR}
+
+    with transaction.atomic():
+        now = timezone.now()
+        Book.objects.filter(popularity__gt=0).update(popularity=0, updated_at=now)
+        Book.objects.bulk_update(
+            [Book(id=book_id, popularity=score, updated_at=now) for book_id, score in scores.items()],
+            ['popularity', 'updated_at'], batch_size=batch_size,
+        )
+        PopularityDecay.objects.create(decayed_at=now)
+    return len(scores)
@@ -0,0 +1,69 @@
+from django.db.models import Avg, Case, Count, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast, Now
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+
+from .models import Book, Review
+
+RATING_FIELDS = {rating: f'rating_{rating}_count' for rating in range(1, 6)}
+
+
+def apply_rating_change(book_id, added=None, removed=None):
+    """Répercute l'ajout et/ou le retrait d'une note sur les agrégats du livre.
+
+    Tout est calculé par la base en un seul UPDATE à partir des valeurs
+    courantes de la ligne, sans relire les avis.
+    """
+    deltas = {}
+    if added is not None:
+        deltas[added] = deltas.get(added, 0) + 1
+    if removed is not None:
+        deltas[removed] = deltas.get(removed, 0) - 1
+    deltas = {rating: delta for rating, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    counts = {rating: F(field) + deltas.get(rating, 0) for rating, field in RATING_FIELDS.items()}
+    total = F('review_count') + sum(deltas.values())
+    weighted = sum(rating * count for rating, count in counts.items())
+
+    updates = {RATING_FIELDS[rating]: F(RATING_FIELDS[rating]) + delta for rating, delta in deltas.items()}
+    updates['review_count'] = total
+    updates['average_rating'] = Case(
+        When(GreaterThan(total, 0), then=Cast(weighted, FloatField()) / total),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    updates['updated_at'] = Now()
+    Book.objects.filter(id=book_id).update(**updates)
+
+
+def rebuild_rating_aggregates(batch_size=1000):
+    """Recalcule les agrégats de tous les livres à partir de la table des avis."""
+    Book.objects.exclude(id__in=Review.objects.values('book_id')).exclude(review_count=0).update(
+        average_rating=0, review_count=0, updated_at=Now(), **{field: 0 for field in RATING_FIELDS.values()}
+    )
+
+    aggregates = Review.objects.order_by('book_id').values('book_id').annotate(
+        average=Avg('rating'),
+        total=Count('id'),
+        **{field: Count('id', filter=Q(rating=rating)) for rating, field in RATING_FIELDS.items()},
+    )
+    # `updated_at` avancé à la main : bulk_update ignore auto_now, et les ETag en dépendent
+    fields = ['average_rating', 'review_count', *RATING_FIELDS.values(), 'updated_at']
+    now = timezone.now()
+    batch = []
+    updated = 0
+    for row in aggregates.iterator(chunk_size=batch_size):
+        book = Book(id=row['book_id'], average_rating=row['average'], review_count=row['total'], updated_at=now)
+        for field in RATING_FIELDS.values():
+            setattr(book, field, row[field])
+        batch.append(book)
+        if len(batch) >= batch_size:
+            Book.objects.bulk_update(batch, fields)
+            updated += len(batch)
+            batch = []
+    if batch:
+        Book.objects.bulk_update(batch, fields)
+        updated += len(batch)
+    return updated
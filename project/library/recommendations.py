@@ -0,0 +1,192 @@
+import heapq
+import math
+from array import array
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .models import BookReaderCount, Loan, RecommendationRun, SimilarBook
+
+
+def _rows(pairs):
+    """{ligne: array des colonnes} à partir de couples (ligne, colonne) triés par ligne."""
+    rows = {}
+    current = None
+    for row, column in pairs:
+        if row != current:
+            current = row
+            values = rows[row] = array('q')
+        values.append(column)
+    return rows
+
+
+def load_histories(loans):
+    """Matrice creuse lecteurs × livres : {lecteur: array des livres empruntés}.
+
+    Les lecteurs au-delà de `LIBRARY_SIMILAR_MAX_HISTORY` livres distincts
+    (comptes de service, gros lecteurs) sont écartés : ils rapprochent tout
+    de tout.
+    """
+    pairs = loans.order_by('user_id', 'book_id').values_list('user_id', 'book_id').distinct()
+    histories = _rows(pairs.iterator(chunk_size=10000))
+    limit = settings.LIBRARY_SIMILAR_MAX_HISTORY
+    return {user: books for user, books in histories.items() if 1 < len(books) <= limit}
+
+
+def readers_of(histories, book_ids=None):
+    """Transposée de la matrice : {livre: array des lecteurs}, limitée à `book_ids`."""
+    readers = defaultdict(lambda: array('q'))
+    for user, books in histories.items():
+        for book in books:
+            if book_ids is None or book in book_ids:
+                readers[book].append(user)
+    return readers
+
+
+def top_similar(book_id, readers, histories, reader_counts, k, min_count):
+    """Les `k` livres les plus co-empruntés avec `book_id`, en similarité cosinus.
+
+    Le produit de la ligne du livre par la matrice se réduit à additionner
+    les historiques de ses lecteurs.
+    """
+    counts = Counter()
+    for user in readers:
+        counts.update(histories[user])
+    del counts[book_id]
+    return _best(book_id, counts, reader_counts, k, min_count)
+
+
+def _best(book_id, counts, reader_counts, k, min_count):
+    """(score, livre, lecteurs communs) des `k` meilleurs livres de `counts` ({livre: lecteurs communs})."""
+    norm = reader_counts[book_id]
+    return heapq.nlargest(k, (
+        (count / math.sqrt(norm * reader_counts[other]), other, count)
+        for other, count in counts.items() if count >= min_count
+    ))
+
+
+def _write(results):
+    SimilarBook.objects.filter(book_id__in=list(results)).delete()
+    SimilarBook.objects.bulk_create([
+        SimilarBook(book_id=book_id, similar_id=other, rank=rank, score=round(score, 6), co_readers=count)
+        for book_id, scored in results.items()
+        for rank, (score, other, count) in enumerate(scored, start=1)
+    ])
+
+
+def _chunks(values, size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _full_refresh(loans, k, min_count, batch_size):
+    histories = load_histories(loans)
+    readers = readers_of(histories)
+    # Normes des colonnes : nombre de lecteurs distincts de chaque livre
+    reader_counts = dict(
+        loans.order_by().values('book_id').annotate(total=Count('user_id', distinct=True))
+        .values_list('book_id', 'total')
+    )
+    book_ids = sorted(readers)
+    SimilarBook.objects.all().delete()
+    for batch in _chunks(book_ids, batch_size):
+        _write({
+            book_id: top_similar(book_id, readers[book_id], histories, reader_counts, k, min_count)
+            for book_id in batch
+        })
+    BookReaderCount.objects.all().delete()
+    BookReaderCount.objects.bulk_create(
+        [BookReaderCount(book_id=book_id, readers=total) for book_id, total in reader_counts.items()],
+        batch_size=batch_size,
+    )
+    return len(book_ids)
+
+
+def new_readings(loans, since_loan_id):
+    """{lecteur: (livres déjà empruntés, livres nouveaux)} des lecteurs ayant emprunté depuis `since_loan_id`."""
+    def pairs(rows):
+        rows = rows.order_by('user_id', 'book_id').values_list('user_id', 'book_id').distinct()
+        return _rows(rows.iterator(chunk_size=10000))
+
+    new = loans.filter(id__gt=since_loan_id)
+    added = pairs(new)
+    before = pairs(loans.filter(id__lte=since_loan_id, user__in=new.values('user_id')))
+    result = {}
+    for user, books in added.items():
+        known = set(before.get(user, ()))
+        result[user] = (known, set(books) - known)
+    return result
+
+
+def _incremental_refresh(loans, since_loan_id, k, min_count, batch_size):
+    # Lecteurs communs gagnés par couple de livres, et lecteurs gagnés par livre
+    co_readers = defaultdict(Counter)
+    new_readers = Counter()
+    limit = settings.LIBRARY_SIMILAR_MAX_HISTORY
+    for known, added in new_readings(loans, since_loan_id).values():
+        new_readers.update(added)
+        books = known | added
+        if not added or not 1 < len(books) <= limit:
+            continue
+        for book in added:
+            for other in books:
+                if other != book:
+                    co_readers[book][other] += 1
+                    if other in known:
+                        co_readers[other][book] += 1
+
+    reader_counts = {}
+    for batch in _chunks(new_readers, batch_size):
+        reader_counts.update(BookReaderCount.objects.filter(book_id__in=batch).values_list('book_id', 'readers'))
+    for book_id, count in new_readers.items():
+        reader_counts[book_id] = reader_counts.get(book_id, 0) + count
+    BookReaderCount.objects.bulk_create(
+        [BookReaderCount(book_id=book_id, readers=reader_counts[book_id]) for book_id in new_readers],
+        update_conflicts=True, unique_fields=['book'], update_fields=['readers'], batch_size=batch_size,
+    )
+
+    # Les couples déjà retenus repartent de leurs lecteurs communs enregistrés
+    targets = sorted(co_readers)
+    for batch in _chunks(targets, batch_size):
+        stored = SimilarBook.objects.filter(book_id__in=batch).values_list('book_id', 'similar_id', 'co_readers')
+        for book_id, other, count in stored:
+            co_readers[book_id][other] += count
+    others = {other for counts in co_readers.values() for other in counts} - reader_counts.keys()
+    for batch in _chunks(others, batch_size):
+        reader_counts.update(BookReaderCount.objects.filter(book_id__in=batch).values_list('book_id', 'readers'))
+
+    for batch in _chunks(targets, batch_size):
+        _write({
+            book_id: _best(book_id, co_readers[book_id], reader_counts, k, min_count)
+            for book_id in batch
+        })
+    return len(targets)
+
+
+def refresh_similar_books(full=False, batch_size=500):
+    """Met à jour la table des livres similaires ; renvoie le nombre de livres recalculés.
+
+    En mode incrémental, seuls les emprunts postérieurs au dernier calcul
+    sont lus, avec l'historique de leurs seuls lecteurs : les lecteurs
+    communs gagnés s'ajoutent à ceux enregistrés dans `SimilarBook`, et les
+    normes à `BookReaderCount`. Le coût suit le nombre de nouveaux emprunts.
+    Approximations rattrapées au prochain recalcul complet : un couple hors
+    des `k` retenus repart de ses seuls nouveaux lecteurs communs, et les
+    scores des livres non touchés gardent leurs anciennes normes.
+    """
+    last_run = RecommendationRun.objects.first()
+    last_loan_id = Loan.objects.aggregate(last=Max('id'))['last'] or 0
+    loans = Loan.objects.filter(id__lte=last_loan_id)
+    k, min_count = settings.LIBRARY_SIMILAR_BOOKS_K, settings.LIBRARY_SIMILAR_MIN_COUNT
+
+    full = full or last_run is None or not BookReaderCount.objects.exists()
+    with transaction.atomic():
+        if full:
+            updated = _full_refresh(loans, k, min_count, batch_size)
+        else:
+            updated = _incremental_refresh(loans, last_run.last_loan_id, k, min_count, batch_size)
+        RecommendationRun.objects.create(last_loan_id=last_loan_id, books_updated=updated, full=full)
+    return updated
@@ -0,0 +1,127 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+# Alias de la réplique choisie pour les lectures de la requête en cours
+_read_alias = ContextVar('library_read_alias', default=None)
+
+
+class ReplicaRouter:
+    """Envoie les lectures sur une réplique quand la vue l'a demandé.
+
+    Hors d'une vue qui a choisi les répliques, et pour toutes les écritures,
+    la base `default` est utilisée.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Les répliques contiennent les mêmes données que `default`
+        return True
+
+
+def _sticky_key(user_id):
+    return f'replicas:sticky:{user_id}'
+
+
+def stick_to_primary(user):
+    """Lit sur `default` pour `user` pendant `LIBRARY_REPLICA_STICKY_SECONDS` (lecture de ses écritures).
+
+    Le marqueur est dans le cache par défaut, qui doit être partagé entre les
+    workers (contrôle library.E001).
+    """
+    cache.set(_sticky_key(user.pk), True, settings.LIBRARY_REPLICA_STICKY_SECONDS)
+
+
+def choose_replica(user):
+    """Alias de réplique pour les lectures de `user`, ou None s'il doit lire sur `default`."""
+    if not settings.LIBRARY_READ_REPLICAS:
+        return None
+    if user.is_authenticated and cache.get(_sticky_key(user.pk)):
+        return None
+    return random.choice(settings.LIBRARY_READ_REPLICAS)
+
+
+@contextmanager
+def replica_reads(request):
+    alias = choose_replica(request.user) if request.method in SAFE_METHODS else None
+    token = _read_alias.set(alias)
+    try:
+        yield alias
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaReadMixin:
+    """Sert les GET de la vue depuis une réplique.
+
+    L'authentification a lieu avant le choix de la réplique et lit donc
+    toujours sur `default`.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._replica_reads = replica_reads(request)
+        self._replica_reads.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        replica = getattr(self, '_replica_reads', None)
+        if replica is not None:
+            self._replica_reads = None
+            replica.__exit__(None, None, None)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+def read_from_replica(view):
+    """Équivalent de `ReplicaReadMixin` pour une vue fonction `@api_view`."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with replica_reads(request):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaStickinessMiddleware:
+    """Après une écriture réussie, renvoie l'utilisateur sur `default` quelques secondes.
+
+    Placé après l'authentification ; l'utilisateur authentifié par DRF est
+    reporté sur la requête Django, ce qui couvre aussi les jetons. Compatible
+    WSGI et ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.process_response(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            # `request.user` peut encore devoir être chargé depuis la session
+            await sync_to_async(self.process_response)(request, response)
+        return response
+
+    def process_response(self, request, response):
+        if (settings.LIBRARY_READ_REPLICAS and request.method not in SAFE_METHODS
+                and response.status_code < 400 and getattr(request, 'user', None) is not None
+                and request.user.is_authenticated):
+            stick_to_primary(request.user)
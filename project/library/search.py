@@ -0,0 +1,175 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import IntegerField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query or '')
+
+
+class BaseSearchBackend:
+    """Interface commune des moteurs de recherche du catalogue."""
+
+    def ensure_index(self):
+        """Crée l'index s'il n'existe pas ; renvoie True s'il vient d'être créé."""
+        return False
+
+    def rebuild(self, batch_size=1000):
+        return 0
+
+    def index_books(self, book_ids):
+        pass
+
+    def remove_books(self, book_ids):
+        pass
+
+    def search(self, query, limit=None):
+        raise NotImplementedError
+
+    def matching(self, query):
+        """Sous-requête des ids des livres trouvés, sans classement (pour `id__in`)."""
+        raise NotImplementedError
+
+    def filter_queryset(self, queryset, query):
+        """Restreint le queryset aux livres trouvés et l'annote avec `search_rank`."""
+        raise NotImplementedError
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Recherche par `icontains`, sans index ; utilisable sur toutes les bases."""
+
+    def _condition(self, query):
+        condition = Q()
+        for term in tokenize(query):
+            condition &= (
+                Q(title__icontains=term) | Q(subtitle__icontains=term) |
+                Q(isbn__icontains=term) | Q(description__icontains=term) |
+                Q(authors__first_name__icontains=term) | Q(authors__last_name__icontains=term)
+            )
+        return condition
+
+    def search(self, query, limit=None):
+        from .models import Book
+        if not tokenize(query):
+            return []
+        ids = Book.objects.filter(self._condition(query)).values_list('id', flat=True).distinct()
+        return list(ids[:limit] if limit else ids)
+
+    def matching(self, query):
+        from .models import Book
+        return Book.objects.filter(self._condition(query)).values('id')
+
+    def filter_queryset(self, queryset, query):
+        if not tokenize(query):
+            return queryset.none()
+        return queryset.filter(id__in=self.matching(query)).annotate(search_rank=Value(0, output_field=IntegerField()))
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    """Index FTS5 externe à la table `library_book`, la rowid étant l'id du livre."""
+
+    table = 'library_book_fts'
+    columns = ('title', 'subtitle', 'authors', 'isbn', 'description')
+    # Poids bm25 par colonne, dans l'ordre de `columns`
+    weights = (10.0, 4.0, 6.0, 10.0, 1.0)
+
+    def ensure_index(self):
+        if self.table in connection.introspection.table_names():
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {self.table} USING fts5("
+                f"{', '.join(self.columns)}, tokenize='unicode61 remove_diacritics 2')"
+            )
+        return True
+
+    def rebuild(self, batch_size=1000):
+        from .models import Book
+        self.ensure_index()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+        ids = list(Book.objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(ids), batch_size):
+            self.index_books(ids[start:start + batch_size])
+        return len(ids)
+
+    def _documents(self, book_ids):
+        from .models import Book
+        authors = {}
+        through = Book.authors.through.objects.filter(book_id__in=book_ids)
+        for book_id, first_name, last_name in through.values_list(
+                'book_id', 'author__first_name', 'author__last_name'):
+            authors.setdefault(book_id, []).append(f'{first_name} {last_name}')
+
+        books = Book.objects.filter(id__in=book_ids).values_list('id', 'title', 'subtitle', 'isbn', 'description')
+        for book_id, title, subtitle, isbn, description in books:
+            # L'ISBN est indexé tel quel et sans tirets pour les lectures de code-barres
+            isbn_terms = f"{isbn} {isbn.replace('-', '')}"
+            yield (book_id, title, subtitle, ' '.join(authors.get(book_id, [])), isbn_terms, description)
+
+    def index_books(self, book_ids):
+        book_ids = list(book_ids)
+        if not book_ids:
+            return
+        self.remove_books(book_ids)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, {', '.join(self.columns)}) VALUES (%s, %s, %s, %s, %s, %s)",
+                list(self._documents(book_ids)),
+            )
+
+    def remove_books(self, book_ids):
+        book_ids = list(book_ids)
+        if not book_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(book_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', book_ids)
+
+    def match_expression(self, query):
+        # Chaque terme devient un préfixe entre guillemets : pas d'injection de syntaxe FTS5
+        return ' '.join(f'"{term}"*' for term in tokenize(query))
+
+    def search(self, query, limit=None):
+        match = self.match_expression(query)
+        if not match:
+            return []
+        weights = ', '.join(str(weight) for weight in self.weights)
+        sql = f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s ORDER BY bm25({self.table}, {weights})'
+        params = [match]
+        if limit:
+            sql += ' LIMIT %s'
+            params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def filter_queryset(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+
+        # Jointure sur l'index : bm25 calculé dans la même passe que le MATCH,
+        # pour tous les livres trouvés
+        weights = ', '.join(str(weight) for weight in self.weights)
+        return queryset.extra(
+            select={'search_rank': f'bm25({self.table}, {weights})'},
+            tables=[self.table],
+            where=[f'{self.table}.rowid = {queryset.model._meta.db_table}.id', f'{self.table} MATCH %s'],
+            params=[match],
+        )
+
+    def matching(self, query):
+        return RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [self.match_expression(query)])
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    return import_string(settings.LIBRARY_SEARCH_BACKEND)()
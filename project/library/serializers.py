@@ -1,62 +1,84 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import Author, Category, Publisher, Book, Loan, Reservation, Review
+from .fieldsets import SparseFieldsMixin
+from .isbn import canonical_isbn
+from .thumbnails import ThumbnailsField
 from accounts.serializers import UserSerializer
 
-class AuthorSerializer(serializers.ModelSerializer):
+class AuthorSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     age = serializers.ReadOnlyField()
     full_name = serializers.ReadOnlyField()
+    photo_thumbnails = ThumbnailsField(source='photo')
     
     class Meta:
         model = Author
         fields = '__all__'
+        field_dependencies = {
+            'age': ['birth_date', 'death_date'],
+            'full_name': ['first_name', 'last_name'],
+        }
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
 
-class PublisherSerializer(serializers.ModelSerializer):
+class PublisherSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Publisher
         fields = '__all__'
 
-class BookListSerializer(serializers.ModelSerializer):
+class BookListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     authors = AuthorSerializer(many=True, read_only=True)
     categories = CategorySerializer(many=True, read_only=True)
     publisher = PublisherSerializer(read_only=True)
     authors_list = serializers.ReadOnlyField()
     categories_list = serializers.ReadOnlyField()
     is_available = serializers.ReadOnlyField()
+    rating_histogram = serializers.ReadOnlyField()
+    cover_thumbnails = ThumbnailsField(source='cover_image')
     
     class Meta:
         model = Book
         fields = [
             'id', 'title', 'subtitle', 'isbn', 'description', 'publish_date',
-            'pages', 'language', 'cover_image', 'status', 'quantity', 'available_quantity',
+            'pages', 'language', 'cover_image', 'cover_thumbnails', 'status', 'quantity', 'available_quantity',
             'authors', 'categories', 'publisher', 'authors_list', 'categories_list',
-            'is_available', 'created_at', 'updated_at'
+            'is_available', 'average_rating', 'review_count', 'rating_histogram',
+            'created_at', 'updated_at'
+        ]
+        read_only_fields = ['average_rating', 'review_count']
+        field_dependencies = {
+            'authors_list': ['authors'],
+            'categories_list': ['categories'],
+            'is_available': ['status', 'available_quantity'],
+            'rating_histogram': [f'rating_{rating}_count' for rating in range(1, 6)],
+        }
+
+class BookSummarySerializer(serializers.ModelSerializer):
+    authors_list = serializers.ReadOnlyField()
+    is_available = serializers.ReadOnlyField()
+    cover_thumbnails = ThumbnailsField(source='cover_image')
+    
+    class Meta:
+        model = Book
+        fields = [
+            'id', 'title', 'isbn', 'cover_image', 'cover_thumbnails', 'status', 'available_quantity',
+            'authors_list', 'is_available', 'created_at'
         ]
 
 class BookDetailSerializer(BookListSerializer):
     reviews = serializers.SerializerMethodField()
-    average_rating = serializers.SerializerMethodField()
-    total_reviews = serializers.SerializerMethodField()
+    total_reviews = serializers.IntegerField(source='review_count', read_only=True)
     
     class Meta(BookListSerializer.Meta):
-        fields = BookListSerializer.Meta.fields + ['reviews', 'average_rating', 'total_reviews']
+        fields = BookListSerializer.Meta.fields + ['reviews', 'total_reviews']
     
     def get_reviews(self, obj):
-        reviews = obj.reviews.all()[:5]  # Derniers 5 avis
+        # Derniers 5 avis, sans charger tous les avis du livre
+        reviews = obj.reviews.select_related('user')[:5]
         return ReviewSerializer(reviews, many=True).data
-    
-    def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews:
-            return sum(review.rating for review in reviews) / len(reviews)
-        return 0
-    
-    def get_total_reviews(self, obj):
-        return obj.reviews.count()
 
 class BookCreateUpdateSerializer(serializers.ModelSerializer):
     authors = serializers.PrimaryKeyRelatedField(queryset=Author.objects.all(), many=True)
@@ -70,6 +92,18 @@ class BookCreateUpdateSerializer(serializers.ModelSerializer):
             'authors', 'categories', 'publisher'
         ]
     
+    def validate_isbn(self, value):
+        # Clé de contrôle vérifiée, et unicité quelle que soit l'écriture (tirets, ISBN-10)
+        isbn13 = canonical_isbn(value)
+        if isbn13 is None:
+            raise serializers.ValidationError("ISBN invalide : ISBN-10 ou ISBN-13 attendu, clé de contrôle comprise.")
+        duplicates = Book.objects.filter(isbn13=isbn13)
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise serializers.ValidationError("Un livre avec cet ISBN existe déjà.")
+        return value
+    
     def create(self, validated_data):
         authors = validated_data.pop('authors')
         categories = validated_data.pop('categories')
@@ -95,7 +129,7 @@ class BookCreateUpdateSerializer(serializers.ModelSerializer):
         
         return instance
 
-class LoanSerializer(serializers.ModelSerializer):
+class LoanSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     book = BookListSerializer(read_only=True)
     user = UserSerializer(read_only=True)
     book_id = serializers.IntegerField(write_only=True)
@@ -106,22 +140,50 @@ class LoanSerializer(serializers.ModelSerializer):
     class Meta:
         model = Loan
         fields = '__all__'
+        field_dependencies = {
+            'is_overdue': ['status', 'due_date'],
+            'days_overdue': ['status', 'due_date'],
+        }
     
     def create(self, validated_data):
         if 'user_id' not in validated_data:
             validated_data['user_id'] = self.context['request'].user.id
         return super().create(validated_data)
 
-class ReservationSerializer(serializers.ModelSerializer):
+class BatchCheckoutSerializer(serializers.Serializer):
+    book_ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=settings.LIBRARY_BATCH_MAX_ITEMS
+    )
+    due_date = serializers.DateField(required=False)
+
+class BatchReturnSerializer(serializers.Serializer):
+    loan_ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=settings.LIBRARY_BATCH_MAX_ITEMS
+    )
+
+class ReservationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     book = BookListSerializer(read_only=True)
     user = UserSerializer(read_only=True)
     book_id = serializers.IntegerField(write_only=True)
     user_id = serializers.IntegerField(write_only=True, required=False)
     is_expired = serializers.ReadOnlyField()
+    queue_position = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Reservation
         fields = '__all__'
+        # Statut et échéance sont pilotés par la file de réservation
+        read_only_fields = ('status', 'expiry_date', 'notified')
+        field_dependencies = {'is_expired': ['expiry_date'], 'queue_position': []}
+    
+    def validate(self, attrs):
+        user_id = attrs.get('user_id', self.context['request'].user.id)
+        open_reservations = Reservation.objects.filter(
+            book_id=attrs['book_id'], user_id=user_id, status__in=Reservation.OPEN_STATUSES
+        )
+        if open_reservations.exists():
+            raise serializers.ValidationError("Une réservation est déjà en cours pour ce livre.")
+        return attrs
     
     def create(self, validated_data):
         if 'user_id' not in validated_data:
@@ -0,0 +1,185 @@
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.db import transaction
+from django.db.models import Sum
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .conditional import touch_books
+from .facets import invalidate_facet_index
+from .models import Author, Book, Category, Loan, Publisher, Review, User
+from .ratings import apply_rating_change
+from .search import get_search_backend
+from .sqlite import configure_connection
+from .stats import invalidate_dashboard
+from .thumbnails import IMAGE_FIELDS, schedule_thumbnails
+from .typeahead import record_change
+
+
+# Réglages SQLite de chaque connexion
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    configure_connection(connection)
+
+
+# Index plein texte
+@receiver(post_migrate)
+def create_search_index(sender, app_config=None, using='default', **kwargs):
+    if app_config is None or app_config.label != 'library':
+        return
+    backend = get_search_backend()
+    if backend.ensure_index():
+        backend.rebuild()
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_search_backend().index_books([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    get_search_backend().remove_books([instance.pk])
+
+
+@receiver(post_save, sender=Author)
+def reindex_author_books(sender, instance, raw=False, created=False, **kwargs):
+    if not raw and not created:
+        get_search_backend().index_books(instance.books.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Author)
+def remember_author_books(sender, instance, **kwargs):
+    instance._indexed_book_ids = list(instance.books.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+def reindex_deleted_author_books(sender, instance, **kwargs):
+    get_search_backend().index_books(getattr(instance, '_indexed_book_ids', []))
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def reindex_book_authors(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # Côté auteur, `pk_set` est vide lors d'un clear : on garde les livres concernés
+        instance._indexed_book_ids = list(instance.books.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        book_ids = [instance.pk]
+    elif action == 'post_clear':
+        book_ids = getattr(instance, '_indexed_book_ids', [])
+    else:
+        book_ids = pk_set or []
+    get_search_backend().index_books(book_ids)
+
+
+# Agrégats des avis
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    if instance.pk and not raw:
+        instance._previous_rating = Review.objects.filter(pk=instance.pk).values_list('book_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def update_rating_aggregates(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    if created or previous is None:
+        apply_rating_change(instance.book_id, added=instance.rating)
+    elif previous[0] != instance.book_id:
+        apply_rating_change(previous[0], removed=previous[1])
+        apply_rating_change(instance.book_id, added=instance.rating)
+    elif previous[1] != instance.rating:
+        apply_rating_change(instance.book_id, added=instance.rating, removed=previous[1])
+
+
+@receiver(post_delete, sender=Review)
+def remove_rating_from_aggregates(sender, instance, **kwargs):
+    apply_rating_change(instance.book_id, removed=instance.rating)
+
+
+# Tableau de bord
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Loan)
+@receiver(post_delete, sender=Loan)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_dashboard_stats(sender, raw=False, **kwargs):
+    if not raw:
+        invalidate_dashboard()
+
+
+# Index de facettes : les autres écritures avancent `updated_at`
+@receiver(post_delete, sender=Book)
+def invalidate_facets(sender, instance, **kwargs):
+    invalidate_facet_index()
+
+
+# Suggestions de saisie
+@receiver(post_save, sender=Book)
+def suggest_book(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record_change('books', instance.pk, instance.title, instance.popularity)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Category)
+def suggest_catalog_entry(sender, instance, raw=False, created=False, **kwargs):
+    if raw:
+        return
+    kind = 'authors' if sender is Author else 'categories'
+    label = instance.full_name if sender is Author else instance.name
+    weight = 0.0 if created else instance.books.aggregate(weight=Sum('popularity'))['weight'] or 0.0
+    record_change(kind, instance.pk, label, weight)
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Category)
+def forget_suggestion(sender, instance, **kwargs):
+    record_change({Book: 'books', Author: 'authors', Category: 'categories'}[sender], instance.pk)
+
+
+# Validateurs HTTP du catalogue
+@receiver(post_save, sender=Author)
+@receiver(pre_delete, sender=Author)
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def touch_related_books(sender, instance, raw=False, created=False, **kwargs):
+    if not raw and not created:
+        touch_books(instance.books.values('id'))
+
+
+@receiver(post_save, sender=Publisher)
+@receiver(pre_delete, sender=Publisher)
+def touch_published_books(sender, instance, raw=False, created=False, **kwargs):
+    if not raw and not created:
+        touch_books(Book.objects.filter(publisher=instance).values('id'))
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+@receiver(m2m_changed, sender=Book.categories.through)
+def touch_books_on_relation_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            touch_books([instance.pk])
+    elif action == 'pre_clear':
+        touch_books(instance.books.values('id'))
+    elif action in ('post_add', 'post_remove'):
+        touch_books(pk_set or [])
+
+
+# Miniatures des images envoyées
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=User)
+def generate_thumbnails(sender, instance, raw=False, **kwargs):
+    image = getattr(instance, IMAGE_FIELDS[sender])
+    if not raw and image:
+        transaction.on_commit(lambda: schedule_thumbnails(image.name))
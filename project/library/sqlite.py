@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.db import connections
+
+# Réglages par défaut de SQLite, pour comparaison dans les benchmarks
+DEFAULT_PRAGMAS = {'busy_timeout': 5000, 'journal_mode': 'delete', 'synchronous': 'full'}
+
+
+def apply_pragmas(cursor, pragmas):
+    """Applique `pragmas` ({nom: valeur}) sur un curseur DB-API SQLite."""
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+
+
+def configure_connection(connection):
+    """Applique `LIBRARY_SQLITE_PRAGMAS` à une nouvelle connexion SQLite."""
+    if connection.vendor != 'sqlite' or not settings.LIBRARY_SQLITE_PRAGMAS:
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, settings.LIBRARY_SQLITE_PRAGMAS)
+
+
+def optimize():
+    """Met à jour les statistiques du planificateur et vide le journal WAL.
+
+    Renvoie, par base SQLite, le nombre de pages du WAL recopiées dans la base.
+    """
+    checkpointed = {}
+    for connection in connections.all():
+        if connection.vendor != 'sqlite':
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA optimize')
+            cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            _, _, pages = cursor.fetchone()
+        checkpointed[connection.alias] = pages
+    return checkpointed
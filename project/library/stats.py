@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import Book, Category, Loan, User
+from .popularity import current_factor
+from .serializers import BookSummarySerializer, CategorySerializer
+
+# Les clés du tableau de bord sont préfixées par un numéro de version :
+# l'incrémenter rend obsolètes toutes les entrées d'un coup.
+VERSION_KEY = 'dashboard:version'
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def invalidate_dashboard():
+    """Invalide tous les tableaux de bord en cache, une fois la transaction validée."""
+    def bump():
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, 1, None)
+    transaction.on_commit(bump)
+
+
+def _cached(key, compute):
+    key = f'dashboard:{_version()}:{key}'
+    data = cache.get(key)
+    if data is None:
+        data = compute()
+        cache.set(key, data, settings.LIBRARY_DASHBOARD_CACHE_TTL)
+    return data
+
+
+def compute_user_stats(user_id):
+    """Compteurs d'emprunts d'un lecteur, en un seul agrégat conditionnel."""
+    return Loan.objects.filter(user_id=user_id).aggregate(
+        active_loans=Count('id', filter=Q(status='active')),
+        overdue_loans=Count('id', filter=Q(status='overdue')),
+        total_borrowed=Count('id'),
+    )
+
+
+def compute_admin_stats():
+    """Compteurs globaux : un agrégat conditionnel par table."""
+    books = Book.objects.aggregate(
+        total_books=Count('id'),
+        available_books=Count('id', filter=Q(status='available')),
+        borrowed_books=Count('id', filter=Q(status='borrowed')),
+    )
+    loans = Loan.objects.aggregate(
+        active_loans=Count('id', filter=Q(status='active')),
+        overdue_loans=Count('id', filter=Q(status='overdue')),
+    )
+    top_categories = Category.objects.annotate(book_count=Count('books')).order_by('-book_count')[:5]
+    recent_books = Book.objects.prefetch_related('authors').order_by('-created_at')[:5]
+    trending = Book.objects.filter(popularity__gt=0).prefetch_related('authors').order_by('-popularity')[:5]
+    factor = current_factor()
+
+    return {
+        'total_books': books['total_books'],
+        'available_books': books['available_books'],
+        'borrowed_books': books['borrowed_books'],
+        'total_users': User.objects.count(),
+        'active_loans': loans['active_loans'],
+        'overdue_loans': loans['overdue_loans'],
+        'top_categories': CategorySerializer(top_categories, many=True).data,
+        'trending': [
+            {**data, 'popularity': round(book.popularity * factor, 2)}
+            for book, data in zip(trending, BookSummarySerializer(trending, many=True).data)
+        ],
+        'recent_books': BookSummarySerializer(recent_books, many=True).data,
+    }
+
+
+def user_stats(user):
+    return _cached(f'user:{user.id}', lambda: compute_user_stats(user.id))
+
+
+def admin_stats():
+    return _cached('admin', compute_admin_stats)
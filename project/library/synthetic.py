@@ -0,0 +1,144 @@
+import random
+from datetime import date, timedelta
+
+FIRST_NAMES = [
+    'Camille', 'Léa', 'Manon', 'Chloé', 'Emma', 'Inès', 'Sarah', 'Julie', 'Claire', 'Alice',
+    'Lucas', 'Hugo', 'Louis', 'Nathan', 'Gabriel', 'Jules', 'Arthur', 'Paul', 'Thomas', 'Victor',
+]
+LAST_NAMES = [
+    'Martin', 'Bernard', 'Dubois', 'Thomas', 'Robert', 'Richard', 'Petit', 'Durand', 'Leroy', 'Moreau',
+    'Simon', 'Laurent', 'Lefebvre', 'Michel', 'Garcia', 'David', 'Bertrand', 'Roux', 'Vincent', 'Fournier',
+]
+WORDS = [
+    'nuit', 'mer', 'jardin', 'silence', 'ombre', 'voyage', 'mémoire', 'rivière', 'hiver', 'lumière',
+    'secret', 'maison', 'feu', 'forêt', 'ville', 'étoile', 'chemin', 'temps', 'vent', 'île',
+    'dernier', 'grand', 'petit', 'perdu', 'rouge', 'blanc', 'premier', 'long', 'dernière', 'noire',
+]
+CATEGORY_NAMES = [
+    'Roman', 'Policier', 'Science-fiction', 'Fantasy', 'Histoire', 'Biographie', 'Poésie', 'Théâtre',
+    'Jeunesse', 'Bande dessinée', 'Philosophie', 'Sciences', 'Cuisine', 'Voyage', 'Art', 'Économie',
+]
+# Langues et notes, avec leur poids relatif
+LANGUAGES = (['fr', 'en', 'es', 'de', 'it', 'pt', 'other'], [70, 18, 4, 3, 2, 1, 2])
+RATINGS = ([1, 2, 3, 4, 5], [4, 8, 20, 38, 30])
+
+LOAN_PERIOD_DAYS = 30
+
+
+# Ces fonctions ne touchent pas à la base : elles tournent dans des processus
+# séparés et renvoient des tuples. Les références entre tables sont des index
+# (0 à n-1) que l'appelant traduit en identifiants après insertion.
+
+def _rng(seed, kind, chunk):
+    # Un générateur par tranche : le résultat ne dépend ni du nombre de
+    # processus ni de l'ordre d'exécution
+    return random.Random(f'{seed}:{kind}:{chunk}')
+
+
+def skewed(rng, n, skew):
+    """Index dans [0, n) selon une loi de puissance : 0 est le plus fréquent."""
+    return min(int(n * rng.random() ** skew), n - 1)
+
+
+def isbn13(index):
+    """ISBN-13 valide et unique par index (préfixe 979-8)."""
+    digits = f'9798{index:08d}'
+    total = sum(int(digit) * (1 if position % 2 == 0 else 3) for position, digit in enumerate(digits))
+    return digits + str((10 - total % 10) % 10)
+
+
+def author_rows(spec):
+    seed, chunk, start, count = spec
+    rng = _rng(seed, 'author', chunk)
+    rows = []
+    for _ in range(count):
+        birth = date(1850, 1, 1) + timedelta(days=rng.randrange(150 * 365))
+        rows.append((rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), birth))
+    return rows
+
+
+def user_rows(spec):
+    seed, chunk, start, count = spec
+    rng = _rng(seed, 'user', chunk)
+    return [
+        (f'lecteur{index}@synthetic.invalid', f'lecteur{index}', rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))
+        for index in range(start, start + count)
+    ]
+
+
+def book_rows(spec):
+    """(isbn, titre, description, date, pages, langue, quantité, éditeur, [auteurs], [catégories])."""
+    seed, chunk, start, count, authors, publishers, categories = spec
+    rng = _rng(seed, 'book', chunk)
+    rows = []
+    for index in range(start, start + count):
+        words = rng.sample(WORDS, rng.randint(2, 5))
+        title = ' '.join(words).capitalize()
+        rows.append((
+            isbn13(index),
+            title,
+            f'{title}. ' + ' '.join(rng.choices(WORDS, k=rng.randint(20, 80))),
+            date(1900, 1, 1) + timedelta(days=int(46000 * rng.random() ** 0.3)),
+            rng.randint(48, 900),
+            rng.choices(*LANGUAGES)[0],
+            1 + skewed(rng, 5, 3),
+            skewed(rng, publishers, 2),
+            sorted({skewed(rng, authors, 1.5) for _ in range(1 + skewed(rng, 3, 3))}),
+            sorted({skewed(rng, categories, 2) for _ in range(1 + skewed(rng, 2, 2))}),
+        ))
+    return rows
+
+
+def loan_rows(spec):
+    """(livre, lecteur, date d'emprunt, échéance, date de retour, statut).
+
+    Les emprunts plus récents que la durée de prêt sont en cours ; les plus
+    anciens sont presque tous rendus, quelques-uns restent ouverts ou perdus.
+    """
+    seed, chunk, count, books, users, days, today = spec
+    rng = _rng(seed, 'loan', chunk)
+    rows = []
+    for _ in range(count):
+        borrow_date = today - timedelta(days=int(days * rng.random() ** 0.7))
+        due_date = borrow_date + timedelta(days=LOAN_PERIOD_DAYS)
+        return_date = None
+        if due_date >= today:
+            status = 'active'
+        else:
+            draw = rng.random()
+            if draw < 0.9:
+                status = 'returned'
+                return_date = min(borrow_date + timedelta(days=rng.randint(1, LOAN_PERIOD_DAYS + 15)), today)
+            else:
+                status = 'active' if draw < 0.98 else 'lost'
+        rows.append((skewed(rng, books, 3), skewed(rng, users, 2), borrow_date, due_date, return_date, status))
+    return rows
+
+
+def review_rows(spec):
+    """(livre, lecteur, note, commentaire) ; les doublons livre/lecteur sont retirés."""
+    seed, chunk, count, books, users = spec
+    rng = _rng(seed, 'review', chunk)
+    rows = {}
+    for _ in range(count):
+        key = (skewed(rng, books, 3), skewed(rng, users, 2))
+        rows[key] = key + (rng.choices(*RATINGS)[0], ' '.join(rng.choices(WORDS, k=rng.randint(0, 30))))
+    return list(rows.values())
+
+
+def reservation_rows(spec):
+    """(livre, lecteur, date de réservation, expiration, statut)."""
+    seed, chunk, count, books, users, days, now = spec
+    rng = _rng(seed, 'reservation', chunk)
+    rows = {}
+    for _ in range(count):
+        reserved = now - timedelta(days=days * rng.random() ** 0.7)
+        status = rng.choices(['fulfilled', 'expired', 'cancelled', 'active'], [70, 15, 5, 10])[0]
+        if status == 'active':
+            # Une seule réservation ouverte par livre et lecteur, encore en file
+            reserved = now - timedelta(days=rng.random() * 6)
+        key = (skewed(rng, books, 3), skewed(rng, users, 2), status)
+        # Une réservation en file n'a pas d'échéance ; les autres gardent celle de leur mise de côté
+        expiry = None if status == 'active' else reserved + timedelta(days=7)
+        rows[key] = key[:2] + (reserved, expiry, status)
+    return list(rows.values())
@@ -0,0 +1,395 @@
+import base64
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import OperationalError, connection
+from django.http import QueryDict
+from django.utils import timezone
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from accounts.models import User
+
+from .circulation import BookUnavailable, checkout, expire_reservations, reserve_copy, return_loan, with_queue_position
+from .facets import compute_facet_counts, facet_index_is_current, rebuild_facet_index
+from .isbn import backfill_isbn13, canonical_isbn
+from .models import Author, Book, Category, Loan, Reservation
+from .thumbnails import ThumbnailsField, render_thumbnails, thumbnail_job
+from .typeahead import Typeahead
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Emprunts simultanés sur un même livre : jamais plus de prêts que d'exemplaires.
+
+    Garde-fou automatique de l'UPDATE conditionnel de `reserve_copy`, que
+    `stress_checkout` ne vérifie qu'à la demande.
+    """
+    copies = 5
+    attempts = 40
+    workers = 8
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='concurrent@library.invalid', username='concurrent',
+            first_name='Concurrent', last_name='Test', role='admin',
+        )
+        self.book = Book.objects.create(
+            title='Concurrent test', isbn='concurrent-test', description='Livre de test',
+            publish_date=date.today(), pages=1, quantity=self.copies, available_quantity=self.copies,
+        )
+
+    def run_concurrently(self, function):
+        def attempt(_):
+            try:
+                function()
+                return 'ok'
+            except BookUnavailable:
+                return 'unavailable'
+            except OperationalError:
+                # Verrou SQLite non obtenu à temps : l'emprunt n'a pas eu lieu
+                return 'error'
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            outcomes = list(executor.map(attempt, range(self.attempts)))
+        self.book.refresh_from_db()
+        return outcomes
+
+    def test_reserve_copy_never_oversells(self):
+        def take():
+            if not reserve_copy(self.book.id):
+                raise BookUnavailable()
+
+        outcomes = self.run_concurrently(take)
+        self.assertGreaterEqual(self.book.available_quantity, 0)
+        self.assertEqual(outcomes.count('ok'), self.copies)
+        self.assertEqual(self.book.available_quantity, self.copies - outcomes.count('ok'))
+        self.assertEqual(self.book.status, 'borrowed' if self.book.available_quantity == 0 else 'available')
+
+    def test_checkout_never_oversells(self):
+        outcomes = self.run_concurrently(lambda: checkout(self.book.id, self.user))
+        loans = Loan.objects.filter(book=self.book).count()
+        # Une tentative peut échouer sur le verrou SQLite alors qu'il restait
+        # des exemplaires : seul le compte exact de l'UPDATE seul est garanti
+        self.assertGreaterEqual(self.book.available_quantity, 0)
+        self.assertLessEqual(loans, self.copies)
+        self.assertEqual(outcomes.count('ok'), loans)
+        self.assertEqual(self.book.available_quantity, self.copies - loans)
+
+
+class ReservationQueueTests(TestCase):
+    """File de réservation : ordre d'arrivée, mise de côté au retour, retrait et expiration."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.borrower, cls.first, cls.second = [
+            User.objects.create_user(
+                email=f'{name}@library.invalid', username=name, first_name=name.title(), last_name='Test',
+            )
+            for name in ('borrower', 'first', 'second')
+        ]
+        cls.book = make_book('queue-1')
+        cls.loan = checkout(cls.book.pk, cls.borrower)
+
+    def setUp(self):
+        for user in (self.first, self.second):
+            client = APIClient()
+            client.force_authenticate(user)
+            response = client.post('/api/reservations/create/', {'book_id': self.book.pk})
+            self.assertEqual(response.status_code, 201)
+
+    def reservation(self, user):
+        return Reservation.objects.get(book=self.book, user=user)
+
+    def test_queue_waits_without_expiry_until_a_copy_returns(self):
+        queue = with_queue_position(Reservation.objects.filter(book=self.book)).order_by('queue_position')
+        self.assertEqual([(entry.user_id, entry.queue_position) for entry in queue], [(self.first.pk, 1), (self.second.pk, 2)])
+        self.assertTrue(all(entry.expiry_date is None for entry in queue))
+
+        # Bien au-delà d'une durée de prêt, personne n'est sorti de la file
+        self.assertEqual(expire_reservations(now=timezone.now() + timedelta(days=90)), 0)
+
+        return_loan(self.loan.pk, self.borrower)
+        first, second = self.reservation(self.first), self.reservation(self.second)
+        self.assertEqual(first.status, 'ready')
+        self.assertAlmostEqual(first.expiry_date, timezone.now() + Reservation.HOLD_PERIOD, delta=timedelta(minutes=1))
+        self.assertEqual((second.status, second.expiry_date), ('active', None))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_quantity, 0)
+
+    def test_hold_is_claimed_by_its_patron_only(self):
+        return_loan(self.loan.pk, self.borrower)
+        with self.assertRaises(BookUnavailable):
+            checkout(self.book.pk, self.second)
+
+        checkout(self.book.pk, self.first)
+        self.assertEqual(self.reservation(self.first).status, 'fulfilled')
+        self.assertEqual(self.reservation(self.second).status, 'active')
+
+    def test_unclaimed_hold_passes_to_the_next_patron_then_back_to_the_shelf(self):
+        return_loan(self.loan.pk, self.borrower)
+
+        for user, successor in ((self.first, self.second), (self.second, None)):
+            # Délai de retrait écoulé sans emprunt
+            Reservation.objects.filter(book=self.book, user=user).update(expiry_date=timezone.now() - timedelta(minutes=1))
+            self.assertEqual(expire_reservations(), 1)
+            self.assertEqual(self.reservation(user).status, 'expired')
+            if successor is not None:
+                self.assertEqual(self.reservation(successor).status, 'ready')
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.available_quantity, self.book.status), (1, 'available'))
+
+
+def make_book(isbn, title='Livre de test', copies=1):
+    return Book.objects.create(
+        title=title, isbn=isbn, description='Livre de test', publish_date=date.today(), pages=1,
+        quantity=copies, available_quantity=copies,
+    )
+
+
+def encode_cursor(position, reverse=False):
+    payload = json.dumps({'p': position, 'r': reverse}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+class CursorPaginationTests(TestCase):
+    """Pagination par curseur : parcours complet, égalités sur la clé de tri, curseurs altérés."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='cursor@library.invalid', username='cursor', first_name='Cursor', last_name='Test',
+        )
+        # 45 livres sur 3 pages, dont 30 partagent le même titre
+        for index in range(45):
+            make_book(f'cursor-{index}', title='Même titre' if index % 3 else f'Titre {index:02d}')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url):
+        ids, pages = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(book['id'] for book in response.data['results'])
+            pages.append(response.data)
+            url = response.data['next']
+        return ids, pages
+
+    def test_round_trip_with_ties_on_title(self):
+        ids, pages = self.walk('/api/books/?pagination=cursor')
+        self.assertEqual(ids, list(Book.objects.order_by('title', 'id').values_list('id', flat=True)))
+        self.assertEqual(len(pages), 3)
+        self.assertIsNone(pages[0]['previous'])
+
+        # Le curseur « précédent » de la page 2 ramène exactement la page 1
+        second = self.client.get(pages[0]['next']).data
+        previous = self.client.get(second['previous']).data
+        self.assertEqual([book['id'] for book in previous['results']], ids[:20])
+
+    def test_tampered_cursor_is_not_found(self):
+        cursors = [
+            'pas-du-base64',
+            encode_cursor(['Titre', 1, 2]),
+            encode_cursor({'title': 'Titre'}),
+            encode_cursor(['Titre', 'abc']),
+            encode_cursor(['Titre', None]),
+            encode_cursor(['Titre', 10 ** 30]),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get('/api/books/', {'cursor': cursor}).status_code, 404)
+
+        self.assertEqual(self.client.get('/api/loans/', {'cursor': encode_cursor(['2024-13-45', 1])}).status_code, 404)
+        self.assertEqual(self.client.get('/api/reviews/', {'cursor': encode_cursor(['hier', 1])}).status_code, 404)
+
+
+class SparseFieldsetTests(TestCase):
+    """`?fields=` restreint aussi les relations imbriquées, et refuse les chemins qu'il ne sait pas servir."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='fields@library.invalid', username='fields', first_name='Fields', last_name='Test',
+        )
+        cls.book = make_book('fields-1', copies=2)
+        cls.book.authors.add(Author.objects.create(first_name='Victor', last_name='Hugo', biography='Longue biographie'))
+        checkout(cls.book.pk, cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_dotted_paths_prune_nested_serializers(self):
+        book = self.client.get('/api/books/', {'fields': 'id,authors.last_name'}).data['results'][0]
+        self.assertEqual(book, {'id': self.book.pk, 'authors': [{'last_name': 'Hugo'}]})
+
+        loan = self.client.get('/api/loans/', {'fields': 'id,book.authors.last_name,user.full_name'}).data['results'][0]
+        self.assertEqual(set(loan), {'id', 'book', 'user'})
+        self.assertEqual(loan['book'], {'authors': [{'last_name': 'Hugo'}]})
+        self.assertEqual(loan['user'], {'full_name': 'Fields Test'})
+
+    def test_unsupported_paths_are_rejected(self):
+        for fields in ('id,inconnu', 'id,title.length', 'id,authors.inconnu', 'id,book.authors.biographie'):
+            with self.subTest(fields=fields):
+                url = '/api/loans/' if fields.startswith('id,book') else '/api/books/'
+                self.assertEqual(self.client.get(url, {'fields': fields}).status_code, 400)
+
+
+class IsbnTests(TestCase):
+    def test_canonical_isbn(self):
+        cases = {
+            '2-07-036822-X': '9782070368228',
+            '207036822x': '9782070368228',
+            'ISBN 2 07 036822 X': '9782070368228',
+            '2-07-036822-8': None,
+            '978-2-07-036822-8': '9782070368228',
+            ' isbn-13: 978 2 07 036822 8 ': '9782070368228',
+            '978-2-07-036822-9': None,
+            '979-10-90636-07-1': '9791090636071',
+            '9791090636072': None,
+            '9771090636071': None,
+            '080442957X': '9780804429573',
+            '': None,
+            None: None,
+        }
+        for value, expected in cases.items():
+            with self.subTest(value=value):
+                self.assertEqual(canonical_isbn(value), expected)
+
+    def test_backfilled_duplicate_stays_saveable(self):
+        Book.objects.bulk_create([
+            Book(title=title, isbn=isbn, description='Livre de test', publish_date=date.today(), pages=1)
+            for title, isbn in (('A', '978-2-07-036822-8'), ('B', '9782070368228'))
+        ])
+        self.assertEqual(backfill_isbn13(), (1, 0, 1))
+
+        duplicate = Book.objects.get(isbn13__isnull=True)
+        duplicate.title = 'B2'
+        duplicate.save()
+        duplicate.refresh_from_db()
+        self.assertIsNone(duplicate.isbn13)
+
+        # Changer l'ISBN vers une autre écriture du même : erreur de validation, pas d'IntegrityError
+        original = Book.objects.get(isbn13='9782070368228')
+        original.isbn = '207036822X'
+        original.validate_unique()
+        duplicate.isbn = '2-07-036822-X'
+        with self.assertRaises(ValidationError):
+            duplicate.validate_unique()
+
+
+class FacetIndexTests(TestCase):
+    """Les compteurs de l'index ne contredisent jamais la liste après une écriture."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='facets@library.invalid', username='facets', first_name='Facets', last_name='Test',
+        )
+        cls.category = Category.objects.create(name='Facettes')
+        cls.books = [make_book(f'facets-{index}') for index in range(3)]
+        cls.category.books.add(*cls.books[:2])
+
+    def setUp(self):
+        # Livres modifiés bien avant la reconstruction : l'index est à jour
+        Book.objects.update(updated_at=timezone.now() - timedelta(minutes=1))
+        rebuild_facet_index()
+
+    def counts(self, query=''):
+        facets = compute_facet_counts(QueryDict(query), ['status', 'category'])
+        return {name: {bucket['value']: bucket['count'] for bucket in buckets} for name, buckets in facets.items()}
+
+    def test_index_matches_exact_counts(self):
+        self.assertTrue(facet_index_is_current())
+        with self.settings(LIBRARY_FACET_INDEX=False):
+            exact = self.counts('status=available')
+        self.assertEqual(self.counts('status=available'), exact)
+        self.assertEqual(exact, {'status': {'available': 3}, 'category': {self.category.id: 2}})
+
+    def test_counts_follow_checkout(self):
+        checkout(self.books[0].id, self.user)
+        self.assertFalse(facet_index_is_current())
+        self.assertEqual(self.counts('status=available'),
+                         {'status': {'available': 2, 'borrowed': 1}, 'category': {self.category.id: 1}})
+
+    def test_counts_follow_category_change_and_deletion(self):
+        self.category.books.remove(self.books[1])
+        self.assertFalse(facet_index_is_current())
+        self.assertEqual(self.counts()['category'], {self.category.id: 1})
+
+        Book.objects.update(updated_at=timezone.now() - timedelta(minutes=1))
+        rebuild_facet_index()
+        self.books[2].delete()
+        self.assertFalse(facet_index_is_current())
+        self.assertEqual(self.counts()['status'], {'available': 2})
+
+
+@override_settings(
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+    LIBRARY_THUMBNAIL_SIZES=[64, 160],
+)
+class ThumbnailTests(TestCase):
+    """Génération par `open()`/`save()` seuls, et aucune URL de miniature avant la fin de la génération."""
+
+    def setUp(self):
+        from PIL import Image
+
+        cache.clear()
+        buffer = io.BytesIO()
+        Image.new('RGB', (400, 600), 'teal').save(buffer, 'PNG')
+        self.name = default_storage.save('book_covers/test.png', ContentFile(buffer.getvalue()))
+        self.cover = Book(cover_image=self.name).cover_image
+        self.field = ThumbnailsField()
+
+    def test_urls_appear_once_rendered(self):
+        self.assertEqual(self.field.to_representation(self.cover), {})
+
+        # Stockage sans chemin local : `path()` lèverait NotImplementedError
+        render_thumbnails(*thumbnail_job(self.name))
+        self.assertIsNone(thumbnail_job(self.name))
+        self.assertTrue(default_storage.exists('book_covers/test_64w.webp'))
+        self.assertEqual(
+            set(self.field.to_representation(self.cover)), {'64w', '160w'},
+        )
+
+        # Une régénération forcée écrase les fichiers au lieu d'en créer de nouveaux
+        render_thumbnails(*thumbnail_job(self.name, force=True))
+        self.assertEqual(default_storage.listdir('book_covers')[1].count('test_64w.webp'), 1)
+
+
+class TypeaheadColdStartTests(TestCase):
+    """Suggestions servies pendant la construction de l'index du processus."""
+
+    def setUp(self):
+        self.book = make_book('typeahead-1', title='Le Jardin secret')
+        self.typeahead = Typeahead()
+        # Construction « en cours » : aucun fil lancé pendant le test
+        self.typeahead.building = True
+
+    def suggest(self, query):
+        return [hit['label'] for hit in self.typeahead.suggest(query, ['books'], 5)['books']]
+
+    def test_database_fallback_matches_word_starts(self):
+        self.assertEqual(self.suggest('jar'), ['Le Jardin secret'])
+        self.assertEqual(self.suggest('le jardin'), ['Le Jardin secret'])
+        self.assertEqual(self.suggest('ardin'), [])
+        self.assertIsNone(self.typeahead.indexes)
+
+    def test_overlay_applies_before_the_index_is_built(self):
+        self.typeahead.record('books', 999999, 'Zèbre étonnant', 1.0)
+        self.assertEqual(self.suggest('zebre'), ['Zèbre étonnant'])
+        self.typeahead.record('books', self.book.pk)
+        self.assertEqual(self.suggest('jar'), [])
@@ -0,0 +1,148 @@
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from rest_framework import serializers
+
+from .models import Author, Book, User
+
+# Modèle -> champ image dont on dérive des miniatures
+IMAGE_FIELDS = {Book: 'cover_image', Author: 'photo', User: 'avatar'}
+
+logger = logging.getLogger('library.thumbnails')
+
+_executor = None
+
+# Compteur des générations terminées, repris dans l'ETag du catalogue
+GENERATION_KEY = 'thumbnails:generation'
+
+
+def thumbnail_name(name, width):
+    """`book_covers/dune.jpg` -> `book_covers/dune_160w.webp`, à côté de l'original."""
+    root, _ = os.path.splitext(name)
+    return f'{root}_{width}w.webp'
+
+
+def render_thumbnails(name, sizes):
+    """Écrit les miniatures de l'image `name` pour chaque largeur de `sizes`.
+
+    Tourne dans un processus séparé et ne passe que par `open()` et `save()`
+    du stockage : fonctionne aussi sur un stockage distant (S3...). La plus
+    petite taille est écrite en dernier et sert de témoin de fin de génération.
+    """
+    from PIL import Image, ImageOps
+
+    with default_storage.open(name, 'rb') as source, Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        for width in sorted(sizes, reverse=True):
+            copy = image.copy()
+            # Jamais d'agrandissement : une image étroite garde sa largeur
+            copy.thumbnail((width, width * 10), Image.LANCZOS)
+            buffer = io.BytesIO()
+            copy.save(buffer, 'WEBP', quality=settings.LIBRARY_THUMBNAIL_QUALITY, method=4)
+            target = thumbnail_name(name, width)
+            # Le stockage renommerait un fichier existant au lieu de l'écraser
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            default_storage.save(target, ContentFile(buffer.getvalue()))
+    return name
+
+
+def thumbnail_job(name, force=False):
+    """Arguments de `render_thumbnails` pour le fichier `name`, ou None s'il n'y a rien à faire."""
+    sizes = settings.LIBRARY_THUMBNAIL_SIZES
+    if not name or not sizes or not default_storage.exists(name):
+        return None
+    if not force and default_storage.exists(thumbnail_name(name, min(sizes))):
+        return None
+    return name, list(sizes)
+
+
+def setup_worker():
+    """Initialise Django dans un processus de génération lancé sans fork."""
+    import django
+
+    django.setup()
+
+
+def _executor_instance():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.LIBRARY_THUMBNAIL_WORKERS, initializer=setup_worker)
+    return _executor
+
+
+def thumbnails_generation():
+    return cache.get(GENERATION_KEY, 0)
+
+
+def thumbnails_generated():
+    """Signale des miniatures terminées : les réponses qui les omettaient changent d'ETag."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 1, None)
+
+
+def _finished(future):
+    if future.exception() is not None:
+        logger.warning('Miniatures non générées : %s', future.exception())
+    else:
+        thumbnails_generated()
+
+
+def schedule_thumbnails(name):
+    """Génère les miniatures de `name` hors du cycle de la requête."""
+    job = thumbnail_job(name)
+    if job is None:
+        return
+    if not settings.LIBRARY_THUMBNAIL_WORKERS:
+        render_thumbnails(*job)
+        thumbnails_generated()
+        return
+    _executor_instance().submit(render_thumbnails, *job).add_done_callback(_finished)
+
+
+def thumbnails_ready(name):
+    """Vrai si les miniatures de `name` sont écrites (témoin : la plus petite taille).
+
+    Seule une réponse positive est mise en cache : une fois écrites, les
+    miniatures ne disparaissent pas, et la vérification coûte alors un accès
+    au cache au lieu d'un aller-retour vers le stockage.
+    """
+    key = f'thumbnails:ready:{name}'
+    if cache.get(key):
+        return True
+    ready = default_storage.exists(thumbnail_name(name, min(settings.LIBRARY_THUMBNAIL_SIZES)))
+    if ready:
+        cache.set(key, True, None)
+    return ready
+
+
+class ThumbnailsField(serializers.ReadOnlyField):
+    """Miniatures d'une image, façon srcset : `{"64w": url, "160w": url, ...}`.
+
+    Tant que la génération n'est pas terminée, quelques secondes après
+    l'envoi, le champ vaut `{}` et le client affiche l'image originale :
+    aucune URL ne pointe vers un fichier encore absent.
+    """
+
+    def to_representation(self, value):
+        sizes = settings.LIBRARY_THUMBNAIL_SIZES
+        if not value or not sizes:
+            return None
+        if not thumbnails_ready(value.name):
+            return {}
+        request = self.context.get('request')
+        urls = {}
+        for width in sizes:
+            url = default_storage.url(thumbnail_name(value.name, width))
+            urls[f'{width}w'] = request.build_absolute_uri(url) if request is not None else url
+        return urls
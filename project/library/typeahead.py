@@ -0,0 +1,310 @@
+import os
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from heapq import nlargest
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, FloatField, Q, Sum, Value
+from django.db.models.functions import Coalesce, Concat
+
+from .models import Author, Book, Category
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+# Longueur des clés indexées : au-delà, les préfixes sont tronqués
+KEY_LENGTH = 32
+# Plages de clés assez courtes pour être parcourues à la requête ; au-delà,
+# les meilleurs résultats du préfixe sont précalculés
+SCAN_LIMIT = 256
+# Références des clés : position du libellé, puis début du mot sur OFFSET_BITS bits
+OFFSET_BITS = 12
+OFFSET_MASK = (1 << OFFSET_BITS) - 1
+VERSION_KEY = 'typeahead:version'
+# Lignes parcourues au plus par type, les plus populaires d'abord, par les
+# suggestions lues en base pendant la construction de l'index
+FALLBACK_SCAN = 20000
+
+
+def normalize(text):
+    """Minuscules, sans accents ni ponctuation : `L'Île-de-France` -> `l ile de france`."""
+    text = unicodedata.normalize('NFKD', (text or '').casefold())
+    return ' '.join(WORD_RE.findall(''.join(char for char in text if not unicodedata.combining(char))))
+
+
+def word_starts(text):
+    """Positions des débuts de mots d'un texte normalisé."""
+    return [0, *(position + 1 for position, char in enumerate(text) if char == ' ')] if text else []
+
+
+def word_keys(label):
+    """Clés d'un libellé : la fin du libellé à partir de chacun de ses mots."""
+    words = normalize(label).split()
+    return {' '.join(words[start:])[:KEY_LENGTH] for start in range(len(words))}
+
+
+class _Keys:
+    """Clés triées d'un index, lues dans les libellés normalisés sans être copiées.
+
+    Chaque référence code la position d'un libellé et le début d'un de ses
+    mots ; la clé est la fin du libellé à partir de ce mot.
+    """
+
+    def __init__(self, texts, refs):
+        self.texts = texts
+        self.refs = refs
+
+    def __len__(self):
+        return len(self.refs)
+
+    def __getitem__(self, position):
+        return self.key(self.refs[position])
+
+    def key(self, ref):
+        start = ref & OFFSET_MASK
+        return self.texts[ref >> OFFSET_BITS][start:start + KEY_LENGTH]
+
+
+class PrefixIndex:
+    """Suggestions d'un type d'objet, immuables une fois construites.
+
+    Les clés sont triées (recherche dichotomique) et renvoient vers des
+    tableaux compacts d'ids, de libellés et de poids. Les préfixes dont la
+    plage dépasse `SCAN_LIMIT` clés ont leurs `size` meilleurs résultats
+    précalculés : une requête coûte au plus une recherche dichotomique et le
+    tri de `SCAN_LIMIT` candidats.
+    """
+
+    def __init__(self, entries, size):
+        entries = sorted((normalize(label), pk, label, weight) for pk, label, weight in entries)
+        self.texts = [entry[0] for entry in entries]
+        self.ids = array('q', (entry[1] for entry in entries))
+        self.labels = [entry[2] for entry in entries]
+        self.weights = array('d', (entry[3] for entry in entries))
+        del entries
+        refs = [
+            (index << OFFSET_BITS) | start
+            for index, text in enumerate(self.texts)
+            for start in word_starts(text) if start <= OFFSET_MASK
+        ]
+        self.keys = _Keys(self.texts, refs)
+        refs.sort(key=self.keys.key)
+        self.refs = self.keys.refs = array('q', refs)
+        del refs
+        self.size = size
+        self.tops = {}
+        self._precompute(0, len(self.keys), 0)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _rank(self, index):
+        # À poids égal, l'ordre alphabétique des libellés
+        return self.weights[index], -index
+
+    def _best(self, lo, hi):
+        return nlargest(self.size, {ref >> OFFSET_BITS for ref in self.refs[lo:hi]}, key=self._rank)
+
+    def _precompute(self, lo, hi, length):
+        """Meilleurs résultats de la plage [lo, hi) des clés qui partagent `length` caractères."""
+        if hi - lo <= SCAN_LIMIT:
+            return self._best(lo, hi)
+        best = []
+        start = lo
+        # Les clés égales au préfixe lui-même viennent en tête de plage
+        while start < hi and len(self.keys[start]) <= length:
+            best.append(self.refs[start] >> OFFSET_BITS)
+            start += 1
+        while start < hi:
+            prefix = self.keys[start][:length + 1]
+            end = bisect_left(self.keys, prefix + '￿', start, hi)
+            best.extend(self._precompute(start, end, length + 1))
+            start = end
+        best = nlargest(self.size, set(best), key=self._rank)
+        self.tops[self.keys[lo][:length]] = best
+        return best
+
+    def search(self, key):
+        """(id, libellé, poids) des meilleurs résultats pour une clé normalisée."""
+        best = self.tops.get(key)
+        if best is None:
+            lo = bisect_left(self.keys, key)
+            best = self._best(lo, bisect_left(self.keys, key + '￿', lo))
+        return [(self.ids[index], self.labels[index], self.weights[index]) for index in best]
+
+
+SOURCES = {
+    'books': lambda: Book.objects.values_list('id', 'title', 'popularity'),
+    'authors': lambda: Author.objects.annotate(
+        weight=Coalesce(Sum('books__popularity'), 0.0)
+    ).values_list('id', 'first_name', 'last_name', 'weight'),
+    'categories': lambda: Category.objects.annotate(
+        weight=Coalesce(Sum('books__popularity'), 0.0)
+    ).values_list('id', 'name', 'weight'),
+}
+
+
+def _entries(kind):
+    rows = SOURCES[kind]().order_by()
+    if kind == 'authors':
+        # Même libellé que `Author.full_name`
+        return [(pk, f'{first_name} {last_name}', weight) for pk, first_name, last_name, weight in rows.iterator()]
+    return list(rows.iterator())
+
+
+# Suggestions lues en base tant que l'index n'est pas prêt : (libellé, poids).
+# Seuls les livres sont classés, par popularité : le poids des auteurs et des
+# catégories demanderait d'agréger tous leurs livres
+FALLBACK_SOURCES = {
+    'books': lambda: Book.objects.annotate(label=F('title'), weight=F('popularity')),
+    'authors': lambda: Author.objects.annotate(
+        label=Concat('first_name', Value(' '), 'last_name'), weight=Value(0.0, output_field=FloatField()),
+    ),
+    'categories': lambda: Category.objects.annotate(label=F('name'), weight=Value(0.0, output_field=FloatField())),
+}
+
+
+def _fallback(kind, query, limit):
+    """Libellés dont un mot commence par `query`, parmi les `FALLBACK_SCAN` plus lourds.
+
+    Sans normalisation des accents : un pis-aller de quelques secondes, le
+    temps que l'index soit prêt.
+    """
+    query = ' '.join(query.split())
+    rows = FALLBACK_SOURCES[kind]()
+    # Ordres lus à rebours dans un index, sans tri ; poids constant hors des livres
+    ordering = ('-popularity', '-pk') if kind == 'books' else ('-pk',)
+    candidates = rows.order_by(*ordering).values('pk')[:FALLBACK_SCAN]
+    rows = rows.filter(Q(label__istartswith=query) | Q(label__icontains=' ' + query), pk__in=candidates)
+    return list(rows.order_by('-weight', 'label').values_list('id', 'label', 'weight')[:limit])
+
+
+class Typeahead:
+    """Index des suggestions du processus, reconstruit en arrière-plan.
+
+    Chaque processus construit le sien à la première demande de suggestions,
+    sans faire attendre la requête : en attendant, les suggestions viennent
+    d'une requête bornée en base. Un processus issu d'un fork repart de zéro
+    plutôt que d'hériter de l'index ou du verrou de son parent.
+
+    Les modifications faites dans ce processus sont visibles immédiatement
+    par une surcouche de changements ; celles des autres processus, signalées
+    par un numéro de version dans le cache, et l'évolution des popularités
+    sont prises en compte à la reconstruction suivante. Avec un cache propre
+    à chaque processus (LocMem par défaut), la version n'est pas partagée :
+    les modifications des autres workers n'apparaissent qu'après
+    `LIBRARY_TYPEAHEAD_MAX_AGE`.
+    """
+
+    def __init__(self):
+        self.indexes = None
+        self.changes = {kind: {} for kind in SOURCES}
+        self.built_at = 0.0
+        self.version = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+        self.building = False
+
+    def build(self):
+        version = cache.get(VERSION_KEY)
+        changes = {kind: {} for kind in SOURCES}
+        # Les changements arrivés pendant la construction restent dans la nouvelle surcouche
+        self.changes, previous = changes, self.changes
+        try:
+            size = 2 * settings.LIBRARY_TYPEAHEAD_MAX_LIMIT
+            indexes = {kind: PrefixIndex(_entries(kind), size) for kind in SOURCES}
+        except Exception:
+            for kind, entries in previous.items():
+                changes[kind] = {**entries, **changes[kind]}
+            raise
+        self.indexes, self.built_at, self.version = indexes, time.monotonic(), version
+        return {kind: len(index) for kind, index in indexes.items()}
+
+    def _build_in_background(self):
+        try:
+            self.build()
+        finally:
+            self.building = False
+            connection.close()
+
+    def refresh(self):
+        """Lance une reconstruction en arrière-plan, sauf si une est déjà en cours."""
+        with self.lock:
+            if self.building:
+                return
+            self.building = True
+        threading.Thread(target=self._build_in_background, name='typeahead-build', daemon=True).start()
+
+    def _stale(self):
+        now = time.monotonic()
+        if now - self.built_at >= settings.LIBRARY_TYPEAHEAD_MAX_AGE:
+            return True
+        if sum(len(changes) for changes in self.changes.values()) > settings.LIBRARY_TYPEAHEAD_MAX_CHANGES:
+            return True
+        # Version partagée lue au plus une fois par période, pas à chaque frappe
+        if now - self.checked_at < settings.LIBRARY_TYPEAHEAD_REFRESH:
+            return False
+        self.checked_at = now
+        return cache.get(VERSION_KEY) != self.version
+
+    def suggest(self, query, kinds, limit):
+        if self.indexes is None or self._stale():
+            self.refresh()
+        key = normalize(query)[:KEY_LENGTH]
+        if not key:
+            return {kind: [] for kind in kinds}
+
+        indexes = self.indexes
+        results = {}
+        for kind in kinds:
+            changes = self.changes[kind]
+            # Index encore en construction : une requête bornée plutôt qu'une attente
+            hits = indexes[kind].search(key) if indexes is not None else _fallback(kind, query, limit)
+            found = [hit for hit in hits if hit[0] not in changes]
+            for pk, change in list(changes.items()):
+                if change is not None and any(word.startswith(key) for word in change[2]):
+                    found.append((pk, change[0], change[1]))
+            found.sort(key=lambda hit: -hit[2])
+            results[kind] = [{'id': pk, 'label': label} for pk, label, _ in found[:limit]]
+        return results
+
+    def record(self, kind, pk, label=None, weight=0.0, version=None):
+        """Répercute l'ajout, la modification (`label`) ou la suppression d'un objet.
+
+        `version` est la version partagée après ce changement : si aucun
+        autre processus n'a rien modifié entre-temps, l'index reste à jour.
+        """
+        self.changes[kind][pk] = None if label is None else (label, weight, word_keys(label))
+        if version is not None and self.version == ((version - 1) or None):
+            self.version = version
+
+
+_typeahead = Typeahead()
+
+
+def _reset_after_fork():
+    # Le fil de construction du parent n'existe pas dans l'enfant
+    _typeahead.__init__()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_typeahead():
+    return _typeahead
+
+
+def record_change(kind, pk, label=None, weight=0.0):
+    """Met à jour les suggestions une fois la transaction validée, ici et dans les autres processus."""
+    def apply():
+        try:
+            version = cache.incr(VERSION_KEY)
+        except ValueError:
+            version = 1
+            cache.set(VERSION_KEY, version, None)
+        _typeahead.record(kind, pk, label, weight, version)
+    transaction.on_commit(apply)
@@ -1,5 +1,6 @@
 from django.urls import path
 from . import views
+from .asynchronous import read_view
 
 urlpatterns = [
     # Authors
@@ -15,16 +16,20 @@ urlpatterns = [
     path('publishers/<int:pk>/', views.PublisherDetailView.as_view(), name='publisher-detail'),
     
     # Books
-    path('books/', views.BookListView.as_view(), name='book-list'),
-    path('books/<int:pk>/', views.BookDetailView.as_view(), name='book-detail'),
+    path('books/', read_view(views.BookListView.as_view()), name='book-list'),
+    path('books/<int:pk>/', read_view(views.BookDetailView.as_view()), name='book-detail'),
     path('books/create/', views.BookCreateView.as_view(), name='book-create'),
     path('books/<int:pk>/update/', views.BookUpdateView.as_view(), name='book-update'),
     path('books/<int:pk>/delete/', views.BookDeleteView.as_view(), name='book-delete'),
+    path('books/<int:pk>/similar/', views.similar_books, name='book-similar'),
+    path('books/isbn/<str:isbn>/', views.book_by_isbn, name='book-by-isbn'),
     
     # Loans
-    path('loans/', views.LoanListView.as_view(), name='loan-list'),
+    path('loans/', read_view(views.LoanListView.as_view()), name='loan-list'),
     path('loans/create/', views.LoanCreateView.as_view(), name='loan-create'),
     path('loans/<int:loan_id>/return/', views.return_book, name='loan-return'),
+    path('loans/batch/checkout/', views.batch_checkout, name='loan-batch-checkout'),
+    path('loans/batch/return/', views.batch_return, name='loan-batch-return'),
     
     # Reservations
     path('reservations/', views.ReservationListView.as_view(), name='reservation-list'),
@@ -33,6 +38,12 @@ urlpatterns = [
     # Reviews
     path('reviews/', views.ReviewListCreateView.as_view(), name='review-list-create'),
     
+    # Autocomplete
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
+    
     # Statistics
-    path('dashboard/', views.dashboard_stats, name='dashboard-stats'),
+    path('dashboard/', read_view(views.dashboard_stats), name='dashboard-stats'),
+    
+    # Exports
+    path('export/<str:dataset>/', views.export_data, name='export-data'),
 ]
\ No newline at end of file
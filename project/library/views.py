@@ -1,17 +1,35 @@
-from rest_framework import generics, status, permissions
+from rest_framework import generics, status, permissions, serializers
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from django.db.models import Q, Count, Avg
-from datetime import date, timedelta
-from .models import Author, Category, Publisher, Book, Loan, Reservation, Review
+from django.conf import settings
+from django.db import transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from django.db.models import Q, Count, Avg, prefetch_related_objects
+from datetime import date
+from accounts.authentication import token_cache_metrics
+from .models import Author, Category, Publisher, Book, Loan, Reservation, Review, SimilarBook
 from .serializers import (
     AuthorSerializer, CategorySerializer, PublisherSerializer,
-    BookListSerializer, BookDetailSerializer, BookCreateUpdateSerializer,
-    LoanSerializer, ReservationSerializer, ReviewSerializer
+    BookListSerializer, BookDetailSerializer, BookCreateUpdateSerializer, BookSummarySerializer,
+    LoanSerializer, ReservationSerializer, ReviewSerializer,
+    BatchCheckoutSerializer, BatchReturnSerializer
 )
-from .filters import BookFilter
+from .asynchronous import iterate_in_thread
+from .circulation import CirculationError, checkout, checkout_many, return_loan, return_many, with_queue_position
+from .conditional import ConditionalGetMixin
+from .exporter import DATASETS, FORMATS, export
+from .facets import facet_counts, parse_facets
+from .fieldsets import SparseFieldsetMixin
+from .filters import BookFilter, FullTextSearchFilter
+from .isbn import canonical_isbn
+from .pagination import BookPagination, LoanPagination, ReviewPagination
+from .replicas import ReplicaReadMixin, read_from_replica
+from .stats import admin_stats, user_stats
+from .typeahead import SOURCES, get_typeahead
 
 class IsAdminOrReadOnly(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -20,7 +38,7 @@ class IsAdminOrReadOnly(permissions.BasePermission):
         return request.user.is_authenticated and request.user.is_admin
 
 # Author Views
-class AuthorListCreateView(generics.ListCreateAPIView):
+class AuthorListCreateView(ConditionalGetMixin, generics.ListCreateAPIView):
     queryset = Author.objects.all()
     serializer_class = AuthorSerializer
     permission_classes = [IsAdminOrReadOnly]
@@ -57,20 +75,37 @@ class PublisherDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAdminOrReadOnly]
 
 # Book Views
-class BookListView(generics.ListAPIView):
+class BookListView(ReplicaReadMixin, ConditionalGetMixin, SparseFieldsetMixin, generics.ListAPIView):
     queryset = Book.objects.all().prefetch_related('authors', 'categories').select_related('publisher')
     serializer_class = BookListSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    pagination_class = BookPagination
+    # La recherche passe en dernier pour pouvoir trier par pertinence
+    filter_backends = [DjangoFilterBackend, OrderingFilter, FullTextSearchFilter]
     filterset_class = BookFilter
-    search_fields = ['title', 'subtitle', 'isbn', 'authors__first_name', 'authors__last_name']
-    ordering_fields = ['title', 'publish_date', 'pages', 'created_at']
+    # `-popularity` : « populaires en ce moment »
+    ordering_fields = ['title', 'publish_date', 'pages', 'created_at', 'average_rating', 'review_count', 'popularity']
     ordering = ['title']
 
-class BookDetailView(generics.RetrieveAPIView):
-    queryset = Book.objects.all().prefetch_related('authors', 'categories', 'reviews__user').select_related('publisher')
+    def get_validators_queryset(self):
+        # Avec les facettes, un livre hors des filtres peut changer la réponse
+        if self.request.query_params.get('facets'):
+            return self.get_queryset().order_by()
+        return super().get_validators_queryset()
+
+    def list(self, request, *args, **kwargs):
+        names = parse_facets(request.query_params.get('facets'))
+        response = super().list(request, *args, **kwargs)
+        if names:
+            response.data['facets'] = facet_counts(request.query_params, names)
+        return response
+
+class BookDetailView(ReplicaReadMixin, ConditionalGetMixin, SparseFieldsetMixin, generics.RetrieveAPIView):
+    queryset = Book.objects.all().prefetch_related('authors', 'categories').select_related('publisher')
     serializer_class = BookDetailSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # Les derniers avis sont imbriqués dans la fiche
+    last_modified_fields = ('updated_at', 'reviews__updated_at')
 
 class BookCreateView(generics.CreateAPIView):
     queryset = Book.objects.all()
@@ -95,18 +130,23 @@ class BookDeleteView(generics.DestroyAPIView):
         return [permissions.IsAuthenticated()]
 
 # Loan Views
-class LoanListView(generics.ListAPIView):
+class LoanListView(SparseFieldsetMixin, generics.ListAPIView):
     serializer_class = LoanSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = LoanPagination
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['status', 'book', 'user']
     ordering_fields = ['borrow_date', 'due_date']
     ordering = ['-borrow_date']
     
     def get_queryset(self):
+        # Le livre est sérialisé en entier : éditeur, auteurs et catégories chargés par page
+        queryset = Loan.objects.select_related('book__publisher', 'user').prefetch_related(
+            'book__authors', 'book__categories'
+        )
         if self.request.user.is_admin:
-            return Loan.objects.all().select_related('book', 'user')
-        return Loan.objects.filter(user=self.request.user).select_related('book', 'user')
+            return queryset
+        return queryset.filter(user=self.request.user)
 
 class LoanCreateView(generics.CreateAPIView):
     queryset = Loan.objects.all()
@@ -114,50 +154,71 @@ class LoanCreateView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def perform_create(self, serializer):
-        book = Book.objects.get(id=serializer.validated_data['book_id'])
-        if not book.is_available:
-            raise serializers.ValidationError("Ce livre n'est pas disponible.")
-        
-        # Réduire la quantité disponible
-        book.available_quantity -= 1
-        if book.available_quantity == 0:
-            book.status = 'borrowed'
-        book.save()
-        
-        serializer.save(user=self.request.user)
+        try:
+            serializer.instance = checkout(
+                serializer.validated_data['book_id'],
+                self.request.user,
+                due_date=serializer.validated_data.get('due_date'),
+                notes=serializer.validated_data.get('notes', ''),
+            )
+        except CirculationError as exc:
+            raise serializers.ValidationError(exc.message)
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def return_book(request, loan_id):
     try:
-        loan = Loan.objects.get(id=loan_id)
-        if loan.user != request.user and not request.user.is_admin:
-            return Response({'error': 'Permission refusée'}, status=status.HTTP_403_FORBIDDEN)
-        
-        loan.status = 'returned'
-        loan.return_date = date.today()
-        loan.save()
-        
-        # Augmenter la quantité disponible
-        book = loan.book
-        book.available_quantity += 1
-        if book.status == 'borrowed' and book.available_quantity > 0:
-            book.status = 'available'
-        book.save()
-        
-        return Response({'message': 'Livre retourné avec succès'})
-    except Loan.DoesNotExist:
-        return Response({'error': 'Emprunt non trouvé'}, status=status.HTTP_404_NOT_FOUND)
+        return_loan(loan_id, request.user)
+    except CirculationError as exc:
+        return Response({'error': exc.message}, status=exc.status_code)
+    return Response({'message': 'Livre retourné avec succès'})
+
+def batch_response(results):
+    succeeded = sum(1 for result in results if result['ok'])
+    return Response({
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'results': results,
+    })
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def batch_checkout(request):
+    serializer = BatchCheckoutSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        results = checkout_many(
+            serializer.validated_data['book_ids'], request.user,
+            due_date=serializer.validated_data.get('due_date'),
+        )
+    except CirculationError as exc:
+        return Response({'error': exc.message}, status=exc.status_code)
+    return batch_response(results)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def batch_return(request):
+    serializer = BatchReturnSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        results = return_many(serializer.validated_data['loan_ids'], request.user)
+    except CirculationError as exc:
+        return Response({'error': exc.message}, status=exc.status_code)
+    return batch_response(results)
 
 # Reservation Views
-class ReservationListView(generics.ListAPIView):
+class ReservationListView(SparseFieldsetMixin, generics.ListAPIView):
     serializer_class = ReservationSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
         if self.request.user.is_admin:
-            return Reservation.objects.all().select_related('book', 'user')
-        return Reservation.objects.filter(user=self.request.user).select_related('book', 'user')
+            queryset = Reservation.objects.all()
+        else:
+            queryset = Reservation.objects.filter(user=self.request.user)
+        return with_queue_position(queryset.select_related('book', 'user'))
 
 class ReservationCreateView(generics.CreateAPIView):
     queryset = Reservation.objects.all()
@@ -165,62 +226,109 @@ class ReservationCreateView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def perform_create(self, serializer):
-        from django.utils import timezone
-        expiry_date = timezone.now() + timedelta(days=7)
-        serializer.save(user=self.request.user, expiry_date=expiry_date)
+        # Pas d'échéance dans la file : le délai de retrait part de la mise de côté
+        serializer.save(user=self.request.user)
 
 # Review Views
-class ReviewListCreateView(generics.ListCreateAPIView):
+class ReviewListCreateView(ReplicaReadMixin, generics.ListCreateAPIView):
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ReviewPagination
     
     def get_queryset(self):
         book_id = self.request.query_params.get('book_id')
         if book_id:
             return Review.objects.filter(book_id=book_id).select_related('user', 'book')
         return Review.objects.all().select_related('user', 'book')
+    
+    def perform_create(self, serializer):
+        # L'avis et la mise à jour des agrégats du livre sont validés ensemble
+        with transaction.atomic():
+            serializer.save()
+
+# Lecture de code-barres
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+@read_from_replica
+def book_by_isbn(request, isbn):
+    # Une sonde sur l'index unique de `isbn13`, quelle que soit l'écriture lue (tirets, ISBN-10)
+    isbn13 = canonical_isbn(isbn)
+    if isbn13 is None:
+        return Response({'error': 'ISBN invalide'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        book = Book.objects.get(isbn13=isbn13)
+    except Book.DoesNotExist:
+        return Response({'error': 'Livre introuvable'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(BookSummarySerializer(book, context={'request': request}).data)
+
+# Recommendations
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+@read_from_replica
+def similar_books(request, pk):
+    # Table précalculée par build_similar_books : une lecture sur l'index (book, rank)
+    entries = SimilarBook.objects.filter(book_id=pk).select_related('similar').order_by('rank')
+    limit = request.query_params.get('limit')
+    if limit:
+        if not limit.isdigit():
+            return Response({'error': 'Limite invalide'}, status=status.HTTP_400_BAD_REQUEST)
+        entries = entries[:int(limit)]
+    entries = list(entries)
+    if not entries and not Book.objects.filter(pk=pk).exists():
+        return Response({'error': 'Livre introuvable'}, status=status.HTTP_404_NOT_FOUND)
+
+    books = [entry.similar for entry in entries]
+    prefetch_related_objects(books, 'authors')
+    data = BookSummarySerializer(books, many=True, context={'request': request}).data
+    for item, entry in zip(data, entries):
+        item['score'] = entry.score
+    return Response(data)
+
+# Autocomplete
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def autocomplete(request):
+    # Index en mémoire du processus : aucune requête SQL une fois construit, une
+    # requête bornée par type tant qu'il est en construction
+    limit = request.query_params.get('limit') or str(settings.LIBRARY_TYPEAHEAD_LIMIT)
+    if not limit.isdigit() or not 0 < int(limit) <= settings.LIBRARY_TYPEAHEAD_MAX_LIMIT:
+        return Response({'error': f'Limite invalide (1 à {settings.LIBRARY_TYPEAHEAD_MAX_LIMIT})'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    kinds = [kind.strip() for kind in request.query_params.get('types', '').split(',') if kind.strip()]
+    unknown = [kind for kind in kinds if kind not in SOURCES]
+    if unknown:
+        return Response({'error': f"Type(s) inconnu(s) : {', '.join(unknown)}. Valeurs possibles : {', '.join(SOURCES)}."},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return Response(get_typeahead().suggest(request.query_params.get('q', ''), kinds or list(SOURCES), int(limit)))
 
 # Statistics Views
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@read_from_replica
 def dashboard_stats(request):
     if not request.user.is_admin:
-        # Stats utilisateur
-        user_loans = Loan.objects.filter(user=request.user)
-        active_loans = user_loans.filter(status='active').count()
-        overdue_loans = user_loans.filter(status='overdue').count()
-        total_borrowed = user_loans.count()
-        
-        return Response({
-            'active_loans': active_loans,
-            'overdue_loans': overdue_loans,
-            'total_borrowed': total_borrowed,
-        })
-    
-    # Stats admin
-    from accounts.models import User
-    total_books = Book.objects.count()
-    available_books = Book.objects.filter(status='available').count()
-    borrowed_books = Book.objects.filter(status='borrowed').count()
-    total_users = User.objects.count()
-    active_loans = Loan.objects.filter(status='active').count()
-    overdue_loans = Loan.objects.filter(status='overdue').count()
-    
-    # Top genres
-    top_categories = Category.objects.annotate(
-        book_count=Count('books')
-    ).order_by('-book_count')[:5]
-    
-    # Livres récents
-    recent_books = Book.objects.order_by('-created_at')[:5]
-    
-    return Response({
-        'total_books': total_books,
-        'available_books': available_books,
-        'borrowed_books': borrowed_books,
-        'total_users': total_users,
-        'active_loans': active_loans,
-        'overdue_loans': overdue_loans,
-        'top_categories': CategorySerializer(top_categories, many=True).data,
-        'recent_books': BookListSerializer(recent_books, many=True).data,
-    })
\ No newline at end of file
+        return Response(user_stats(request.user))
+    return Response({**admin_stats(), 'token_cache': token_cache_metrics()})
+
+# Exports
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def export_data(request, dataset):
+    if not request.user.is_admin:
+        return Response({'error': 'Permission refusée'}, status=status.HTTP_403_FORBIDDEN)
+    fmt = request.query_params.get('output', 'csv')
+    if dataset not in DATASETS or fmt not in FORMATS:
+        return Response({'error': 'Export inconnu'}, status=status.HTTP_404_NOT_FOUND)
+    since = request.query_params.get('since')
+    if since:
+        since = parse_date(since)
+        if since is None:
+            return Response({'error': 'Date invalide (AAAA-MM-JJ)'}, status=status.HTTP_400_BAD_REQUEST)
+
+    lines = export(dataset, fmt, since=since)
+    if isinstance(request._request, ASGIRequest):
+        # Un itérateur synchrone serait lu en entier avant l'envoi sous ASGI
+        lines = iterate_in_thread(lines)
+    response = StreamingHttpResponse(lines, content_type=FORMATS[fmt][1])
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+    return response
@@ -0,0 +1,7 @@
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'library_project.settings')
+os.environ.setdefault('LIBRARY_ASYNC_READS', 'True')
+
+application = get_asgi_application()
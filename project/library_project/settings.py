@@ -1,6 +1,7 @@
 import os
+from decimal import Decimal
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -18,6 +19,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    'rest_framework.authtoken',
     'corsheaders',
     'django_filters',
     'library',
@@ -25,12 +27,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'library.instrumentation.ServerTimingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'library.replicas.ReplicaStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -54,14 +58,53 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'library_project.wsgi.application'
+ASGI_APPLICATION = 'library_project.asgi.application'
+
+# Vues de lecture asynchrones (catalogue, emprunts, tableau de bord) servies
+# par un pool de threads borné ; activées par défaut par asgi.py
+LIBRARY_ASYNC_READS = config('LIBRARY_ASYNC_READS', default=False, cast=bool)
+LIBRARY_ASYNC_READ_THREADS = config('LIBRARY_ASYNC_READ_THREADS', default=32, cast=int)
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Connexions persistantes (secondes) ; 0 pour en ouvrir une par requête
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        # Base de test sur fichier : les tests de concurrence ont besoin des
+        # verrous SQLite (WAL, busy_timeout), absents d'une base en mémoire partagée
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Répliques en lecture seule : fichiers SQLite séparés par des virgules (copies
+# tenues à jour par `replicate_sqlite`), déclarés sous les alias replica1, replica2...
+for index, name in enumerate(config('LIBRARY_REPLICA_DATABASES', default='', cast=Csv()), start=1):
+    DATABASES[f'replica{index}'] = {**DATABASES['default'], 'NAME': name, 'TEST': {'MIRROR': 'default'}}
+LIBRARY_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['library.replicas.ReplicaRouter']
+
+# Après une écriture, durée pendant laquelle l'utilisateur lit sur la base
+# principale pour voir ses propres modifications (secondes) ; le marqueur est
+# dans le cache par défaut, qui doit alors être partagé (Redis, Memcached)
+LIBRARY_REPLICA_STICKY_SECONDS = config('LIBRARY_REPLICA_STICKY_SECONDS', default=10, cast=int)
+
+# Pragmas SQLite appliqués à chaque connexion : journal WAL (les lectures ne
+# bloquent plus sur les écritures), fsync au checkpoint seulement, 256 Mo de
+# mmap, 64 Mo de cache de pages, 5 s d'attente sur un verrou avant
+# « database is locked ». LIBRARY_SQLITE_TUNING=False revient aux réglages
+# par défaut de SQLite.
+LIBRARY_SQLITE_PRAGMAS = {
+    # En premier : les pragmas suivants peuvent déjà attendre un verrou
+    'busy_timeout': config('LIBRARY_SQLITE_BUSY_TIMEOUT', default=5000, cast=int),
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': config('LIBRARY_SQLITE_MMAP_SIZE', default=268435456, cast=int),
+    'cache_size': -config('LIBRARY_SQLITE_CACHE_KB', default=65536, cast=int),
+    'temp_store': 'memory',
+} if config('LIBRARY_SQLITE_TUNING', default=True, cast=bool) else {}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -91,11 +134,18 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='library'),
+    }
+}
+
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -109,6 +159,90 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Durée de cache de la résolution jeton -> utilisateur (secondes) avec un
+# CACHE_BACKEND partagé entre processus (Redis, Memcached) ; sinon cache propre
+# à chaque processus, dont la durée courte borne le délai avant qu'une
+# révocation faite par un autre worker soit vue, et taille maximale de ce cache
+AUTH_TOKEN_CACHE_TTL = config('AUTH_TOKEN_CACHE_TTL', default=300, cast=int)
+AUTH_TOKEN_LOCAL_CACHE_TTL = config('AUTH_TOKEN_LOCAL_CACHE_TTL', default=30, cast=int)
+AUTH_TOKEN_LOCAL_CACHE_SIZE = config('AUTH_TOKEN_LOCAL_CACHE_SIZE', default=10000, cast=int)
+
+# Recherche plein texte du catalogue
+LIBRARY_SEARCH_BACKEND = config('LIBRARY_SEARCH_BACKEND', default='library.search.SQLiteFTS5Backend')
+
+# Durée de cache des comptes estimés en pagination par curseur (secondes)
+LIBRARY_COUNT_CACHE_TTL = config('LIBRARY_COUNT_CACHE_TTL', default=300, cast=int)
+
+# Nombre maximal d'éléments par lot d'emprunts ou de retours
+LIBRARY_BATCH_MAX_ITEMS = config('LIBRARY_BATCH_MAX_ITEMS', default=200, cast=int)
+
+# Durée de vie du cache du tableau de bord (secondes)
+LIBRARY_DASHBOARD_CACHE_TTL = config('LIBRARY_DASHBOARD_CACHE_TTL', default=30, cast=int)
+
+# Amendes de retard : montant par jour et plafond (0 = pas de plafond)
+LIBRARY_FINE_PER_DAY = config('LIBRARY_FINE_PER_DAY', default='0.20', cast=Decimal)
+LIBRARY_FINE_MAX = config('LIBRARY_FINE_MAX', default='0', cast=Decimal)
+
+# Taille des tranches de la passe des retards (identifiants par UPDATE)
+LIBRARY_SWEEP_CHUNK_SIZE = config('LIBRARY_SWEEP_CHUNK_SIZE', default=50000, cast=int)
+
+# Lignes lues par aller-retour base lors des exports
+LIBRARY_EXPORT_CHUNK_SIZE = config('LIBRARY_EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Miniatures des couvertures, photos et avatars : largeurs en pixels, qualité
+# WebP et processus de génération (0 : génération synchrone)
+LIBRARY_THUMBNAIL_SIZES = config('LIBRARY_THUMBNAIL_SIZES', default='64,160,320,640',
+                                 cast=lambda value: [int(width) for width in value.split(',') if width.strip()])
+LIBRARY_THUMBNAIL_QUALITY = config('LIBRARY_THUMBNAIL_QUALITY', default=80, cast=int)
+LIBRARY_THUMBNAIL_WORKERS = config('LIBRARY_THUMBNAIL_WORKERS', default=2, cast=int)
+
+# Facettes de la liste des livres (?facets=) : valeurs renvoyées au plus par
+# facette, durée de cache des compteurs par combinaison de filtres, et usage
+# de l'index de facettes (build_facet_index) quand les filtres le permettent ;
+# l'index n'est lu que si aucun livre n'a changé depuis sa reconstruction
+# (emprunt, avis, popularité compris) : à reconstruire à intervalle court
+LIBRARY_FACET_SIZE = config('LIBRARY_FACET_SIZE', default=20, cast=int)
+LIBRARY_FACET_CACHE_TTL = config('LIBRARY_FACET_CACHE_TTL', default=60, cast=int)
+LIBRARY_FACET_INDEX = config('LIBRARY_FACET_INDEX', default=True, cast=bool)
+
+# Popularité des livres : demi-vie d'un emprunt en jours, et score sous lequel
+# la passe de décroissance remet un livre à zéro
+LIBRARY_POPULARITY_HALF_LIFE_DAYS = config('LIBRARY_POPULARITY_HALF_LIFE_DAYS', default=7, cast=float)
+LIBRARY_POPULARITY_FLOOR = config('LIBRARY_POPULARITY_FLOOR', default=0.01, cast=float)
+
+# Recommandations « aussi empruntés » : livres similaires conservés par livre,
+# co-emprunts minimum pour retenir un couple, et historiques plus longs
+# ignorés (comptes de service, gros lecteurs)
+LIBRARY_SIMILAR_BOOKS_K = config('LIBRARY_SIMILAR_BOOKS_K', default=20, cast=int)
+LIBRARY_SIMILAR_MIN_COUNT = config('LIBRARY_SIMILAR_MIN_COUNT', default=2, cast=int)
+LIBRARY_SIMILAR_MAX_HISTORY = config('LIBRARY_SIMILAR_MAX_HISTORY', default=500, cast=int)
+
+# Suggestions de saisie (/api/autocomplete/) : nombre par défaut et maximum
+# par type, âge maximum de l'index en mémoire avant reconstruction (prise en
+# compte des popularités), délai minimum entre deux reconstructions dues aux
+# modifications d'autres processus (signalées par le cache par défaut : avec
+# un cache propre à chaque processus, vues seulement après l'âge maximum) et
+# changements locaux tolérés hors index
+LIBRARY_TYPEAHEAD_LIMIT = config('LIBRARY_TYPEAHEAD_LIMIT', default=8, cast=int)
+LIBRARY_TYPEAHEAD_MAX_LIMIT = config('LIBRARY_TYPEAHEAD_MAX_LIMIT', default=20, cast=int)
+LIBRARY_TYPEAHEAD_MAX_AGE = config('LIBRARY_TYPEAHEAD_MAX_AGE', default=3600, cast=int)
+LIBRARY_TYPEAHEAD_REFRESH = config('LIBRARY_TYPEAHEAD_REFRESH', default=300, cast=int)
+LIBRARY_TYPEAHEAD_MAX_CHANGES = config('LIBRARY_TYPEAHEAD_MAX_CHANGES', default=500, cast=int)
+
+# Instrumentation par requête (en-tête Server-Timing et logs) ; une même
+# requête SQL répétée au moins ce nombre de fois est signalée comme N+1
+LIBRARY_SERVER_TIMING = config('LIBRARY_SERVER_TIMING', default=False, cast=bool)
+LIBRARY_N_PLUS_ONE_THRESHOLD = config('LIBRARY_N_PLUS_ONE_THRESHOLD', default=20, cast=int)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'loggers': {
+        'library.instrumentation': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",